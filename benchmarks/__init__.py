@@ -0,0 +1,5 @@
+"""
+压测与基准套件 (不随服务发布)。
+
+    python -m benchmarks.run --help
+"""
@@ -0,0 +1,58 @@
+import io
+import wave
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.core.engine import MODEL_SAMPLE_RATE
+
+# 音频时长分布：[(时长秒, 权重), ...]
+AUDIO_MIXES: Dict[str, List[Tuple[float, float]]] = {
+    "short": [(2.0, 1.0)],                             # 语音指令
+    "mixed": [(2.0, 0.7), (15.0, 0.2), (60.0, 0.1)],    # 典型线上流量
+    "long": [(60.0, 0.5), (300.0, 0.5)],               # 会议录音
+}
+
+
+def synth_wav(duration_s: float, sample_rate: int = MODEL_SAMPLE_RATE, seed: int = 0) -> bytes:
+    """生成确定性的 16-bit 单声道 WAV：带音调起伏的正弦波 + 少量噪声"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_s * sample_rate)) / sample_rate
+    pitch = 220.0 + 80.0 * np.sin(2 * np.pi * 0.5 * t)
+    signal = 0.3 * np.sin(2 * np.pi * pitch * t) + 0.02 * rng.standard_normal(len(t))
+    pcm = (np.clip(signal, -1.0, 1.0) * 32767).astype("<i2")
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def sample_durations(mix: str, count: int, seed: int = 0) -> List[float]:
+    """按分布抽样 count 个音频时长 (固定种子，可复现)"""
+    durations, weights = zip(*AUDIO_MIXES[mix])
+    probabilities = np.asarray(weights) / sum(weights)
+    rng = np.random.default_rng(seed)
+    return [float(d) for d in rng.choice(durations, size=count, p=probabilities)]
+
+
+class AudioLibrary:
+    """
+    每个时长只合成一次，压测时重复使用。
+    传入 nonce 时改写最后一个采样，保证每个请求的内容哈希不同，不会命中服务端的结果缓存。
+    """
+
+    def __init__(self, sample_rate: int = MODEL_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._cache: Dict[float, bytes] = {}
+
+    def get(self, duration_s: float, nonce: Optional[int] = None) -> bytes:
+        if duration_s not in self._cache:
+            self._cache[duration_s] = synth_wav(duration_s, self.sample_rate, seed=int(duration_s * 1000))
+        data = self._cache[duration_s]
+        if nonce is None:
+            return data
+        return data[:-2] + (nonce % 32768).to_bytes(2, "little")
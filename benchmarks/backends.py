@@ -0,0 +1,247 @@
+"""
+推理后端对比：在固定的本地测试集上依次测 torch (fp32) / int8 / onnx 引擎，
+输出延迟分位数、RTF、每核吞吐、模型内存占用，以及字错率 (CER)。
+内存有两列：RSS MB 是加载 (含量化/替换 ASR 子模型) 前后的进程 RSS 差值，量化后端先加载的 fp32 权重
+即使已经释放，分配器也未必还给系统，所以它偏大；weights MB 是替换之后实际在用的子模型权重大小
+(ONNX 会话不是 PyTorch 模块，统计不到，显示 "-")。
+
+    python -m benchmarks.backends --test-set data/testset --backends torch,int8,onnx --threads 4
+
+测试集目录：音频文件 (wav/flac/mp3/m4a ...) + 同名 .txt 参考文本，按文件名排序，保证每次输入相同。
+没有参考文本的文件只参与 "相对 fp32" 的 CER (以第一个后端的输出为参考)。
+每个后端在独立的子进程里加载和测试，内存占用互不影响。
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import statistics
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from benchmarks.run import print_table
+from src.adapters.audio import probe_duration
+from src.adapters.memory import process_rss_bytes
+from src.adapters.text import parse_sensevoice_output
+from src.core.backends import ENGINE_BACKENDS, QuantizedSenseVoiceEngine, _import_funasr_onnx
+from src.core.engine import SenseVoiceEngine, _import_funasr, _import_torch
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".m4a", ".ogg", ".opus", ".aac")
+
+COLUMNS = [
+    ("backend", "backend", "{}"),
+    ("files", "files", "{}"),
+    ("audio_s", "audio s", "{:.1f}"),
+    ("load_s", "load s", "{:.1f}"),
+    ("memory_mb", "RSS MB", "{:.0f}"),
+    ("weights_mb", "weights MB", "{:.0f}"),
+    ("p50_s", "p50 s", "{:.3f}"),
+    ("p95_s", "p95 s", "{:.3f}"),
+    ("rtf", "RTF", "{:.4f}"),
+    ("audio_x_per_core", "x/core", "{:.1f}"),
+    ("speedup", "speedup", "{:.2f}x"),
+    ("cer", "CER", "{:.2%}"),
+    ("cer_vs_baseline", "CER vs fp32", "{:.2%}"),
+]
+
+
+# === 测试集 ===
+def load_test_set(directory: str) -> List[Tuple[str, Optional[str]]]:
+    """[(音频路径, 参考文本或 None), ...]，按文件名排序"""
+    samples = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in AUDIO_EXTENSIONS:
+            continue
+        reference_path = os.path.join(directory, stem + ".txt")
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as reference_file:
+                reference = reference_file.read().strip()
+        samples.append((os.path.join(directory, name), reference))
+    if not samples:
+        raise ValueError(f"No audio files found in {directory}")
+    return samples
+
+
+# === 字错率 ===
+def normalize_for_cer(text: str) -> str:
+    """去掉 SenseVoice 标签、标点和空白，英文转小写：只比较识别出的字"""
+    body = parse_sensevoice_output(text or "").text.lower()
+    return "".join(char for char in body if not char.isspace() and not unicodedata.category(char).startswith("P"))
+
+
+def edit_distance(reference: str, hypothesis: str) -> int:
+    """字符级 Levenshtein 距离 (替换 + 删除 + 插入)"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_char in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_char in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_char != hyp_char)))
+        previous = current
+    return previous[-1]
+
+
+def corpus_cer(pairs: Sequence[Tuple[str, str]]) -> Optional[float]:
+    """整个测试集的 CER = 总编辑距离 / 参考总字数 (不是逐句 CER 的平均)"""
+    references = [(normalize_for_cer(reference), normalize_for_cer(hypothesis)) for reference, hypothesis in pairs]
+    total = sum(len(reference) for reference, _ in references)
+    if not total:
+        return None
+    return sum(edit_distance(reference, hypothesis) for reference, hypothesis in references) / total
+
+
+# === 测量 ===
+def create_engine(backend: str, threads: Optional[int]) -> SenseVoiceEngine:
+    # fp32 基线同样固定在 CPU 上，和量化后端比的是同一批核
+    if backend == "torch":
+        return SenseVoiceEngine(device="cpu", num_threads=threads)
+    return QuantizedSenseVoiceEngine(backend=backend, num_threads=threads)
+
+
+def measure_engine(engine: Any, paths: Sequence[str], language: str = "auto") -> Dict[str, Any]:
+    """
+    加载引擎并逐个识别测试集 (与线上一样走完整的 VAD + ASR + 标点流水线)。
+    第一个文件先跑一遍不计时，排除首次调用的开销。
+    """
+    # 先导入推理库再取 RSS 基线：torch / funasr 本身就占几百 MB，不应算进模型
+    _import_runtime(engine)
+    gc.collect()
+    rss_before = process_rss_bytes()
+    started_at = time.perf_counter()
+    engine.load(warmup=False)
+    load_s = time.perf_counter() - started_at
+    # 被替换掉的 fp32 子模型在这里回收，RSS 取回收之后的值
+    gc.collect()
+    rss_after = process_rss_bytes()
+    weights_mb = model_weights_mb(engine)
+
+    engine.transcribe_file(paths[0], language=language)
+    texts, latencies = [], []
+    for path in paths:
+        started_at = time.perf_counter()
+        texts.append(engine.transcribe_file(path, language=language))
+        latencies.append(time.perf_counter() - started_at)
+
+    memory_mb = None
+    if rss_before is not None and rss_after is not None:
+        memory_mb = max(rss_after - rss_before, 0) / (1024 * 1024)
+    return {"load_s": load_s, "memory_mb": memory_mb, "weights_mb": weights_mb, "latencies": latencies, "texts": texts}
+
+
+def _import_runtime(engine: Any):
+    """导入引擎加载时才会导入的推理库"""
+    if isinstance(engine, SenseVoiceEngine):
+        _import_torch()
+        _import_funasr()
+    if isinstance(engine, QuantizedSenseVoiceEngine) and engine.backend == "onnx":
+        _import_funasr_onnx()
+
+
+def model_weights_mb(engine: Any) -> Optional[float]:
+    """
+    引擎实际在用的子模型 (ASR / VAD / 标点) 的权重和缓冲区大小 (MB)。
+    int8 量化的 Linear 按打包后的 int8 权重计算；有子模型不是 PyTorch 模块 (ONNX 会话) 或引擎没有 AutoModel 时返回 None
+    """
+    auto_model = getattr(engine, "model", None)
+    if not isinstance(engine, SenseVoiceEngine) or auto_model is None:
+        return None
+    torch = _import_torch()
+    total = 0
+    for module in (auto_model.model, getattr(auto_model, "vad_model", None), getattr(auto_model, "punc_model", None)):
+        if module is None:
+            continue
+        if not isinstance(module, torch.nn.Module):
+            return None
+        total += sum(_tensor_bytes(value) for value in module.state_dict().values())
+    return total / (1024 * 1024)
+
+
+def _tensor_bytes(value: Any) -> int:
+    # 动态量化的 Linear 在 state_dict 里是 (int8 权重, bias) 元组
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item) for item in value)
+    if hasattr(value, "numel") and hasattr(value, "element_size"):
+        return value.numel() * value.element_size()
+    return 0
+
+
+def _measure_backend(backend: str, threads: Optional[int], paths: Sequence[str], language: str) -> Dict[str, Any]:
+    """子进程入口：每个后端一个干净的进程，RSS 差值只包含这一个模型"""
+    return measure_engine(create_engine(backend, threads), paths, language)
+
+
+def summarize(
+    backend: str,
+    measurement: Dict[str, Any],
+    samples: Sequence[Tuple[str, Optional[str]]],
+    threads: int,
+    baseline: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """单个后端的汇总行；baseline 为 fp32 的测量结果 (用于加速比和相对 CER)"""
+    latencies = measurement["latencies"]
+    audio_s = sum(probe_duration(path) or 0.0 for path, _ in samples)
+    busy_s = sum(latencies)
+    texts = measurement["texts"]
+
+    row = {
+        "backend": backend,
+        "files": len(samples),
+        "audio_s": audio_s,
+        "load_s": measurement["load_s"],
+        "memory_mb": measurement["memory_mb"],
+        "weights_mb": measurement.get("weights_mb"),
+        "p50_s": statistics.median(latencies),
+        "p95_s": sorted(latencies)[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        "rtf": busy_s / audio_s if audio_s else None,
+        # 每核每秒处理多少秒音频：目标是量化后端达到 fp32 的 2-3 倍
+        "audio_x_per_core": audio_s / busy_s / threads if busy_s else None,
+        "cer": corpus_cer([(reference, text) for (_, reference), text in zip(samples, texts) if reference is not None]),
+    }
+    if baseline is not None:
+        row["speedup"] = sum(baseline["latencies"]) / busy_s if busy_s else None
+        row["cer_vs_baseline"] = corpus_cer(list(zip(baseline["texts"], texts)))
+    return row
+
+
+def main(args):
+    samples = load_test_set(args.test_set)
+    paths = [path for path, _ in samples]
+    print(f"🎧 Test set: {len(samples)} file(s), {sum(1 for _, ref in samples if ref is not None)} with references")
+
+    rows, baseline = [], None
+    for backend in args.backends:
+        # spawn：子进程不继承父进程已经导入的 torch 和已分配的内存
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            measurement = executor.submit(_measure_backend, backend, args.threads, paths, args.language).result()
+        if baseline is None:
+            baseline = measurement
+        rows.append(summarize(backend, measurement, samples, args.threads, baseline))
+        print(f"📊 done: {backend}")
+
+    print()
+    print_table(rows, COLUMNS)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(rows, output, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare SenseVoice inference backends on a fixed local test set")
+    parser.add_argument("--test-set", required=True, help="音频 + 同名 .txt 参考文本所在目录")
+    parser.add_argument(
+        "--backends", type=lambda value: [item for item in value.split(",") if item], default=list(ENGINE_BACKENDS),
+        help=f"逗号分隔，第一个作为基线: {','.join(ENGINE_BACKENDS)}",
+    )
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="每个引擎的 CPU 线程数")
+    parser.add_argument("--language", default="auto")
+    parser.add_argument("--json", help="把结果另存为 JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,114 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from src.adapters.audio import probe_duration
+from src.core.engine import MODEL_SAMPLE_RATE
+
+
+class FakeEngine:
+    """
+    确定性的假引擎：接口与 SenseVoiceEngine 一致，但不加载模型。
+    推理耗时 = overhead_s + rtf * 音频时长，推理期间按音频时长占用内存，
+    用来在没有 GPU/模型的机器上复现排队、背压和调度行为。
+    """
+
+    def __init__(
+        self,
+        rtf: float = 0.05,
+        overhead_s: float = 0.01,
+        memory_mb_per_audio_s: float = 0.0,
+        unknown_duration_s: float = 10.0,
+        model_id: str = "fake-sensevoice",
+        device: str = "cpu",
+    ):
+        """
+        Args:
+            rtf: 实时率 (推理耗时 / 音频时长)
+            overhead_s: 每次调用的固定开销 (模型前处理、调度等)
+            memory_mb_per_audio_s: 每秒音频在推理期间占用的内存
+            unknown_duration_s: 文件输入测不出时长时按这个估算
+        """
+        self.rtf = rtf
+        self.overhead_s = overhead_s
+        self.memory_mb_per_audio_s = memory_mb_per_audio_s
+        self.unknown_duration_s = unknown_duration_s
+        self.model_id = model_id
+        self.device = device
+        self.model = object()
+        self.batch_size_s = 60
+        self.merge_length_s = 15
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def load(self, warmup: bool = True):
+        self.model = object()
+
+    def release(self):
+        self.model = None
+
+    # === 与 SenseVoiceEngine 相同的推理接口 (同步阻塞) ===
+    # pipeline / fanout 参数只为接口兼容：假引擎的耗时只取决于音频时长
+    def transcribe_file(self, file_path: str, language: str = "auto", use_itn: bool = True, pipeline: str = "full") -> str:
+        duration = probe_duration(file_path)
+        return self._infer(duration if duration is not None else self.unknown_duration_s)
+
+    def transcribe_array(self, samples, sample_rate: int = MODEL_SAMPLE_RATE, language: str = "auto", use_itn: bool = True, pipeline: str = "full") -> str:
+        return self._infer(len(samples) / float(sample_rate))
+
+    def transcribe_batch(self, inputs: List[Any], sample_rate: int = MODEL_SAMPLE_RATE, language: str = "auto", use_itn: bool = True, pipeline: str = "full") -> List[str]:
+        durations = [self._input_duration(item, sample_rate) for item in inputs]
+        self._infer(sum(durations), overhead_s=self.overhead_s)
+        return [self._text(duration) for duration in durations]
+
+    def transcribe_segments(
+        self,
+        model_input: Any,
+        sample_rate: int = MODEL_SAMPLE_RATE,
+        language: str = "auto",
+        use_itn: bool = True,
+        on_segment: Optional[Callable[[Dict[str, Any]], None]] = None,
+        pipeline: str = "full",
+        fanout: Any = None,
+    ) -> List[Dict[str, Any]]:
+        """按 10 秒一段切分，逐段"推理"并回调"""
+        duration = self._input_duration(model_input, sample_rate)
+        segments = []
+        start = 0.0
+        while start < duration:
+            end = min(start + 10.0, duration)
+            segment = {"start": start, "end": end, "text": self._infer(end - start)}
+            segments.append(segment)
+            if on_segment is not None:
+                on_segment(segment)
+            start = end
+        return segments
+
+    def detect_speech_stream(self, samples, cache: Dict[str, Any], is_final: bool = False, chunk_ms: int = 200) -> List[List[int]]:
+        return []
+
+    # === 内部 ===
+    def _input_duration(self, item: Any, sample_rate: int) -> float:
+        if isinstance(item, str):
+            duration = probe_duration(item)
+            return duration if duration is not None else self.unknown_duration_s
+        return len(item) / float(sample_rate)
+
+    def _infer(self, audio_s: float, overhead_s: Optional[float] = None) -> str:
+        with self._lock:
+            self.calls += 1
+
+        # 推理期间持有内存 (真正写入，保证计入 RSS)
+        ballast = None
+        if self.memory_mb_per_audio_s > 0:
+            ballast = np.ones(int(self.memory_mb_per_audio_s * audio_s * 1024 * 1024), dtype=np.uint8)
+
+        time.sleep((self.overhead_s if overhead_s is None else overhead_s) + self.rtf * audio_s)
+        del ballast
+        return self._text(audio_s)
+
+    @staticmethod
+    def _text(audio_s: float) -> str:
+        return f"<|zh|><|NEUTRAL|><|Speech|><|woitn|>fake transcript of {audio_s:.1f}s"
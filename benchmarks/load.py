@@ -0,0 +1,127 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+
+from src.api.routes import router as api_router
+from src.services.registry import ModelRegistry, ModelSpec
+from src.services.transcription import TranscriptionService
+from benchmarks.audio import AudioLibrary, sample_durations
+
+
+@dataclass
+class RequestRecord:
+    audio_s: float
+    status: int          # HTTP 状态码；0 表示客户端异常 (连接失败、超时等)
+    latency_s: float     # 从"计划发出时间"算起，避免协调遗漏 (coordinated omission)
+
+
+@dataclass
+class BenchmarkReport:
+    scenario: Dict[str, Any]
+    wall_s: float
+    records: List[RequestRecord] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, Any]:
+        ok = [r for r in self.records if r.status == 200]
+        rejected = [r for r in self.records if r.status == 503]
+        latencies = np.asarray([r.latency_s for r in ok]) if ok else np.zeros(0)
+        total = len(self.records)
+
+        def percentile(q: float) -> Optional[float]:
+            return float(np.percentile(latencies, q)) if latencies.size else None
+
+        return {
+            **self.scenario,
+            "requests": total,
+            "ok": len(ok),
+            "throughput_rps": len(ok) / self.wall_s if self.wall_s > 0 else 0.0,
+            "audio_throughput_x": sum(r.audio_s for r in ok) / self.wall_s if self.wall_s > 0 else 0.0,
+            "p50_s": percentile(50),
+            "p95_s": percentile(95),
+            "p99_s": percentile(99),
+            "rejected_rate": len(rejected) / total if total else 0.0,
+            "error_rate": (total - len(ok) - len(rejected)) / total if total else 0.0,
+        }
+
+
+def build_app(engine, **service_kwargs) -> FastAPI:
+    """
+    用给定引擎 (通常是 FakeEngine) 组装一个和 src.main 相同路由的应用。
+    不走 lifespan：调用方负责 start_worker / stop_worker。
+    """
+    app = FastAPI()
+    app.include_router(api_router)
+    service = TranscriptionService(engine=engine, **service_kwargs)
+    registry = ModelRegistry({"sensevoice-small": ModelSpec(model_id=service.model_id or "fake")}, "sensevoice-small")
+    app.state.registry = registry
+    app.state.service = registry.add("sensevoice-small", service)
+    return app
+
+
+async def run_open_loop(
+    client: httpx.AsyncClient,
+    rate_rps: float,
+    duration_s: float,
+    mix: str,
+    concurrency: int = 64,
+    seed: int = 0,
+    library: Optional[AudioLibrary] = None,
+    params: Optional[Dict[str, str]] = None,
+    scenario: Optional[Dict[str, Any]] = None,
+) -> BenchmarkReport:
+    """
+    开环压测：请求按泊松过程 (平均 rate_rps) 定时发出，不等待前一个请求返回。
+    这样服务变慢时负载不会跟着降低，才能看到真实的排队和 503。
+    concurrency 是客户端同时在途的请求上限 (相当于连接池大小)，超出的请求在客户端等待，
+    等待时间同样计入延迟。
+    """
+    library = library or AudioLibrary()
+    rng = np.random.default_rng(seed)
+    count = max(1, int(rate_rps * duration_s))
+    arrivals = np.cumsum(rng.exponential(1.0 / rate_rps, size=count))
+    durations = sample_durations(mix, count, seed=seed)
+    data = params or {"language": "zh"}
+
+    report = BenchmarkReport(
+        scenario=scenario or {"rate_rps": rate_rps, "mix": mix, "concurrency": concurrency}, wall_s=0.0
+    )
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def fire(index: int, scheduled_at: float):
+        await asyncio.sleep(max(scheduled_at - time.perf_counter(), 0.0))
+        audio = library.get(durations[index], nonce=seed * 100003 + index)
+        try:
+            async with in_flight:
+                response = await client.post(
+                    "/v1/audio/transcriptions",
+                    files={"file": (f"bench_{index}.wav", audio, "audio/wav")},
+                    data=data,
+                )
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        report.records.append(RequestRecord(durations[index], status, time.perf_counter() - scheduled_at))
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(fire(i, started_at + float(at)) for i, at in enumerate(arrivals)))
+    report.wall_s = time.perf_counter() - started_at
+    return report
+
+
+def in_process_client(app: FastAPI) -> httpx.AsyncClient:
+    """进程内压测：请求直接走 ASGI，不经过网络栈"""
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+
+
+def http_client(base_url: str, concurrency: int) -> httpx.AsyncClient:
+    """通过 HTTP 压测一个已经在运行的服务 (真实模型或假引擎)"""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=None,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    )
@@ -0,0 +1,133 @@
+"""
+压测入口：在 队列大小 × 到达率 × 并发 × 音频时长分布 的组合上跑开环压测，输出吞吐、延迟分位数和 503 比例。
+
+    # 进程内 + 假引擎 (默认)：RTF=0.05，即 1 分钟音频推理 3 秒
+    python -m benchmarks.run --queue-sizes 10,50 --rates 2,5,10 --mixes short,mixed
+
+    # 压测一个已经启动的服务 (真实模型)：此时 --queue-sizes / --rtf 不生效
+    python -m benchmarks.run --url http://localhost:50070 --rates 1,2 --mixes short
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.audio import AUDIO_MIXES, AudioLibrary
+from benchmarks.fake_engine import FakeEngine
+from benchmarks.load import build_app, http_client, in_process_client, run_open_loop
+
+COLUMNS = [
+    ("queue_size", "queue", "{}"),
+    ("scheduling", "sched", "{}"),
+    ("mix", "mix", "{}"),
+    ("rate_rps", "rate", "{:g}"),
+    ("concurrency", "conc", "{}"),
+    ("requests", "reqs", "{}"),
+    ("throughput_rps", "ok/s", "{:.2f}"),
+    ("audio_throughput_x", "audio x", "{:.1f}"),
+    ("p50_s", "p50 s", "{:.3f}"),
+    ("p95_s", "p95 s", "{:.3f}"),
+    ("p99_s", "p99 s", "{:.3f}"),
+    ("rejected_rate", "503 %", "{:.1%}"),
+    ("error_rate", "err %", "{:.1%}"),
+]
+
+
+def _floats(value: str) -> List[float]:
+    return [float(item) for item in value.split(",") if item]
+
+
+def _ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def _strings(value: str) -> List[str]:
+    return [item for item in value.split(",") if item]
+
+
+async def run_scenario(args, queue_size: int, scheduling: str, mix: str, rate: float, concurrency: int, library: AudioLibrary) -> Dict[str, Any]:
+    scenario = {"queue_size": queue_size, "scheduling": scheduling, "mix": mix, "rate_rps": rate, "concurrency": concurrency}
+
+    if args.url:
+        async with http_client(args.url, concurrency) as client:
+            report = await run_open_loop(client, rate, args.duration, mix, concurrency, args.seed, library, scenario=scenario)
+        return report.summary()
+
+    engine = FakeEngine(rtf=args.rtf, overhead_s=args.overhead, memory_mb_per_audio_s=args.memory_mb_per_audio_s)
+    app = build_app(
+        engine,
+        max_queue_size=queue_size,
+        scheduling=scheduling,
+        max_batch_size=args.max_batch_size,
+        max_batch_wait_ms=args.max_batch_wait_ms,
+        fast_path_max_s=args.fast_path_max_s,
+    )
+    service = app.state.service
+    await service.start_worker()
+    try:
+        async with in_process_client(app) as client:
+            report = await run_open_loop(client, rate, args.duration, mix, concurrency, args.seed, library, scenario=scenario)
+    finally:
+        await service.stop_worker()
+    return report.summary()
+
+
+def print_table(rows: List[Dict[str, Any]], columns: List[Tuple[str, str, str]] = COLUMNS):
+    def fmt(row, key, pattern):
+        value = row.get(key)
+        return "-" if value is None else pattern.format(value)
+
+    table = [[header for _, header, _ in columns]]
+    table += [[fmt(row, key, pattern) for key, _, pattern in columns] for row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(columns))]
+    for line in table:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+
+async def main(args):
+    # 每个请求一行 INFO 日志会淹没结果
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    library = AudioLibrary()
+    queue_sizes = [None] if args.url else args.queue_sizes
+    schedulings = [None] if args.url else args.scheduling
+
+    rows = []
+    for queue_size, scheduling, mix, rate, concurrency in itertools.product(
+        queue_sizes, schedulings, args.mixes, args.rates, args.concurrency
+    ):
+        row = await run_scenario(args, queue_size, scheduling, mix, rate, concurrency, library)
+        rows.append(row)
+        print(f"📊 done: queue={queue_size} sched={scheduling} mix={mix} rate={rate:g} conc={concurrency}")
+
+    print()
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(rows, output, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SenseVoice service load benchmark")
+    parser.add_argument("--url", help="压测一个运行中的服务；不填则进程内 + 假引擎")
+    parser.add_argument("--queue-sizes", type=_ints, default=[10, 50], help="逗号分隔，例如 10,50")
+    parser.add_argument("--scheduling", type=_strings, default=["sjf"], help="fifo,sjf")
+    parser.add_argument("--rates", type=_floats, default=[2.0, 5.0, 10.0], help="到达率 (请求/秒)")
+    parser.add_argument("--concurrency", type=_ints, default=[64], help="客户端在途请求上限")
+    parser.add_argument("--mixes", type=_strings, default=["short", "mixed"], help=f"音频时长分布: {','.join(AUDIO_MIXES)}")
+    parser.add_argument("--duration", type=float, default=10.0, help="每个场景的压测时长 (秒)")
+    parser.add_argument("--rtf", type=float, default=0.05, help="假引擎实时率")
+    parser.add_argument("--overhead", type=float, default=0.01, help="假引擎每次调用的固定开销 (秒)")
+    parser.add_argument("--memory-mb-per-audio-s", type=float, default=0.0, help="假引擎每秒音频占用的内存")
+    parser.add_argument("--max-batch-size", type=int, default=1)
+    parser.add_argument("--max-batch-wait-ms", type=float, default=5.0)
+    parser.add_argument("--fast-path-max-s", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="把结果另存为 JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
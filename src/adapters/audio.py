@@ -0,0 +1,254 @@
+import io
+import shutil
+import struct
+import subprocess
+import wave
+from math import gcd
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+try:
+    import soundfile as sf
+except ImportError:  # soundfile 由 funasr 间接依赖，缺失时只影响非 wav 格式的探测
+    sf = None
+
+# scipy 导入要一秒多，只有解码进程里的 decode_file 用得到，第一次调用时再导入 (不拖慢服务冷启动)
+resample_poly = None
+
+
+def _import_resample_poly():
+    """scipy 同样由 funasr 间接依赖，缺失时返回 None：保留原采样率，交给引擎重采样"""
+    global resample_poly
+    if resample_poly is None:
+        try:
+            from scipy.signal import resample_poly as resample
+        except ImportError:
+            return None
+        resample_poly = resample
+    return resample_poly
+
+
+def probe_duration(file_path: str) -> Optional[float]:
+    """
+    读取音频容器头信息，估算音频时长（秒）。
+    只解析文件头，不做完整解码，开销可以忽略。
+
+    Args:
+        file_path: 音频文件路径
+
+    Returns:
+        时长（秒）；无法识别的格式返回 None
+    """
+    # 1. WAV: 标准库即可解析
+    try:
+        with wave.open(file_path, "rb") as wav_file:
+            frame_rate = wav_file.getframerate()
+            if frame_rate > 0:
+                return wav_file.getnframes() / float(frame_rate)
+    except (wave.Error, EOFError, OSError):
+        pass
+
+    # 2. 其他格式 (flac, ogg, mp3, ...): 交给 libsndfile
+    if sf is not None:
+        try:
+            info = sf.info(file_path)
+            if info.samplerate > 0:
+                return info.frames / float(info.samplerate)
+        except Exception:
+            pass
+
+    # 3. MP4 容器 (m4a/mp4/mov): libsndfile 不支持，直接读 moov/mvhd 里的时长
+    try:
+        return _probe_mp4_duration(file_path)
+    except (OSError, struct.error):
+        return None
+
+
+def _probe_mp4_duration(file_path: str) -> Optional[float]:
+    """在 MP4 的 box 结构里找到 moov/mvhd，读取 timescale 和 duration"""
+    with open(file_path, "rb") as f:
+        f.seek(0, io.SEEK_END)
+        file_size = f.tell()
+
+        # moov 可能在文件开头也可能在末尾，逐个跳过顶层 box 即可，不读 mdat 内容
+        moov = _find_mp4_box(f, 0, file_size, b"moov")
+        if moov is None:
+            return None
+        mvhd = _find_mp4_box(f, moov[0], moov[1], b"mvhd")
+        if mvhd is None:
+            return None
+
+        # mvhd: version(1) + flags(3)，之后的字段长度取决于 version
+        f.seek(mvhd[0])
+        version = f.read(4)[0]
+        if version == 1:
+            _, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+        else:
+            _, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+
+    if timescale <= 0:
+        return None
+    return duration / float(timescale)
+
+
+def _find_mp4_box(f, start: int, end: int, box_type: bytes) -> Optional[Tuple[int, int]]:
+    """在 [start, end) 范围内查找指定类型的 box，返回 (内容起点, box 终点)"""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        size, current_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:  # 64 位大小
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:  # 一直延伸到范围末尾
+            size = end - position
+        if size < header:
+            return None
+
+        if current_type == box_type:
+            return position + header, position + size
+        position += size
+
+    return None
+
+
+def decode_audio(data: Union[bytes, str]) -> Optional[Tuple[np.ndarray, int]]:
+    """
+    在内存中解码上传的音频，不经过 ffmpeg。
+
+    Args:
+        data: 音频文件的完整字节内容，或者文件路径
+
+    Returns:
+        (samples, sample_rate)：samples 为单声道 float32 一维数组；
+        无法在内存中解码的格式 (需要 ffmpeg 的 m4a 等) 返回 None，由调用方走临时文件兜底
+    """
+    if sf is None or not data:
+        return None
+
+    try:
+        source = io.BytesIO(data) if isinstance(data, bytes) else data
+        samples, sample_rate = sf.read(source, dtype="float32", always_2d=False)
+    except Exception:
+        return None
+
+    # 多声道 -> 单声道 (与 FunASR 的 reduce_channels 行为一致)
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1, dtype=np.float32)
+
+    if samples.size == 0:
+        return None
+
+    return samples, int(sample_rate)
+
+
+def decode_file(file_path: str, target_rate: int = 16000) -> Tuple[np.ndarray, int]:
+    """
+    把音频文件完整解码成单声道 float32 (解码进程池里调用，不依赖 torch)。
+    libsndfile 能读的格式直接读，其余 (m4a 等) 交给 ffmpeg 直接输出 target_rate 的 f32le。
+
+    Returns:
+        (samples, sample_rate)：能重采样时 sample_rate 即 target_rate，否则为原采样率
+    Raises:
+        RuntimeError: 两种方式都解码不了
+    """
+    samples, sample_rate = None, None
+    if sf is not None:
+        try:
+            samples, sample_rate = sf.read(file_path, dtype="float32", always_2d=False)
+        except Exception:
+            samples = None
+
+    if samples is None:
+        return _decode_with_ffmpeg(file_path, target_rate), target_rate
+
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1, dtype=np.float32)
+
+    resample = _import_resample_poly() if sample_rate != target_rate and samples.size else None
+    if resample is not None:
+        divisor = gcd(int(sample_rate), target_rate)
+        samples = resample(samples, target_rate // divisor, int(sample_rate) // divisor).astype(np.float32)
+        sample_rate = target_rate
+
+    return np.ascontiguousarray(samples, dtype=np.float32), int(sample_rate)
+
+
+def _decode_with_ffmpeg(file_path: str, target_rate: int) -> np.ndarray:
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError(f"Cannot decode {file_path}: unsupported format and ffmpeg not found.")
+
+    proc = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", file_path,
+         "-f", "f32le", "-ac", "1", "-ar", str(target_rate), "-"],
+        capture_output=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {file_path}: {proc.stderr.decode(errors='ignore').strip()}")
+    return np.frombuffer(proc.stdout, dtype="<f4").copy()
+
+
+def pcm_to_float32(data: bytes, encoding: str = "pcm_s16le") -> np.ndarray:
+    """
+    把裸 PCM 字节 (单声道) 转成 float32 一维数组，用于流式输入。
+
+    Args:
+        data: PCM 字节
+        encoding: "pcm_s16le" (16-bit 整型) 或 "pcm_f32le" (32-bit 浮点)
+
+    Returns:
+        取值范围 [-1, 1] 的 float32 采样
+    """
+    if encoding == "pcm_s16le":
+        if len(data) % 2:
+            raise ValueError("PCM s16le payload must have an even number of bytes.")
+        return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+    if encoding == "pcm_f32le":
+        if len(data) % 4:
+            raise ValueError("PCM f32le payload length must be a multiple of 4.")
+        return np.frombuffer(data, dtype="<f4").astype(np.float32, copy=False)
+
+    raise ValueError(f"Unsupported PCM encoding: {encoding}")
+
+
+def merge_vad_segments(segments: List[List[int]], max_length_ms: int = 15000) -> List[List[int]]:
+    """
+    合并相邻的短 VAD 语音段，减少碎片化 (每段单独识别的开销 + 上下文太短)。
+    与 FunASR 的 merge_vad 不同，这里保留真实的语音起止点，不会把段间静音算进时间戳。
+
+    Args:
+        segments: [[start_ms, end_ms], ...]，按时间排序
+        max_length_ms: 合并后单段的最大跨度
+
+    Returns:
+        合并后的 [[start_ms, end_ms], ...]
+    """
+    merged: List[List[int]] = []
+    for start_ms, end_ms in segments:
+        if merged and end_ms - merged[-1][0] <= max_length_ms:
+            merged[-1][1] = end_ms
+        else:
+            merged.append([start_ms, end_ms])
+    return merged
+
+
+def synth_speech_like(duration_s: float, sample_rate: int = 16000, seed: int = 0) -> np.ndarray:
+    """
+    合成"像语音"的测试信号 (float32 单声道)，用于模型预热。
+    纯静音会被 VAD 全部切掉，ASR / 标点根本不会执行；这里用带谐波的浊音 +
+    约 4Hz 的音节起伏，每 2 秒留 0.3 秒停顿，让 VAD 切出多段，整条流水线都能跑到。
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_s * sample_rate), dtype=np.float32) / sample_rate
+
+    f0 = 150.0 + 40.0 * np.sin(2 * np.pi * 0.7 * t)          # 基频缓慢起伏
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))   # 前 5 次谐波
+    syllables = 0.5 * (1 + np.sin(2 * np.pi * 4.0 * t))       # 音节包络
+    pauses = (t % 2.0) < 1.7                                   # 句间停顿
+
+    signal = 0.2 * voiced * syllables * pauses + 0.005 * rng.standard_normal(len(t))
+    return signal.astype(np.float32)
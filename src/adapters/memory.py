@@ -0,0 +1,56 @@
+import ctypes
+import ctypes.util
+import os
+import sys
+from typing import Optional
+
+# macOS: task_info(mach_task_self(), MACH_TASK_BASIC_INFO, ...)
+MACH_TASK_BASIC_INFO = 20
+
+
+class _MachTaskBasicInfo(ctypes.Structure):
+    """<mach/task_info.h> 中的 mach_task_basic_info"""
+
+    _fields_ = [
+        ("virtual_size", ctypes.c_uint64),
+        ("resident_size", ctypes.c_uint64),
+        ("resident_size_max", ctypes.c_uint64),
+        ("user_time", ctypes.c_int32 * 2),
+        ("system_time", ctypes.c_int32 * 2),
+        ("policy", ctypes.c_int32),
+        ("suspend_count", ctypes.c_int32),
+    ]
+
+
+def process_rss_bytes() -> Optional[int]:
+    """
+    读取当前进程的常驻内存 (RSS)，单位字节。
+
+    Linux 读 /proc/self/statm，macOS 通过 mach task_info 读当前 RSS。
+    无法获取当前值时返回 None：getrusage 的 ru_maxrss 是峰值，只增不减，
+    内存水位控制拿它判断"已经回落"会永远等不到，宁可不控制。
+    """
+    if sys.platform == "darwin":
+        return _darwin_rss_bytes()
+
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _darwin_rss_bytes() -> Optional[int]:
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"))
+        # mach_task_self() 是读取全局变量 mach_task_self_ 的宏
+        task = ctypes.c_uint.in_dll(libc, "mach_task_self_")
+        info = _MachTaskBasicInfo()
+        count = ctypes.c_uint(ctypes.sizeof(info) // ctypes.sizeof(ctypes.c_uint))
+        result = libc.task_info(task, MACH_TASK_BASIC_INFO, ctypes.byref(info), ctypes.byref(count))
+    except (OSError, ValueError, AttributeError):
+        return None
+    if result != 0:  # KERN_SUCCESS
+        return None
+    return info.resident_size
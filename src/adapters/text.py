@@ -1,34 +1,106 @@
 import re
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+# SenseVoice 的特殊标签：<|zh|>、<|NEUTRAL|>、<|Speech|>、<|withitn|> ...
+# 兼容带空格的标签格式: < | zh | >、< | S pe ech | >
+_TAG_RE = re.compile(r'<\s*\|\s*([^>]+?)\s*\|\s*>')
+# 连续重复的标点 (，， / ,, / 。。 / ..) 合并成一个
+_REPEATED_PUNCT_RE = re.compile(r'([，,。.])\1+')
+# 批量清洗时拼接各段用的分隔符：不是空白也不是标点，不会被规范化吃掉
+_BATCH_SEPARATOR = "\x00"
+
+LANGUAGE_TAGS = frozenset({"zh", "en", "yue", "ja", "ko", "nospeech"})
+EMOTION_TAGS = frozenset({"HAPPY", "SAD", "ANGRY", "NEUTRAL", "FEARFUL", "DISGUSTED", "SURPRISED", "EMO_UNKNOWN"})
+ITN_TAGS = {"withitn": True, "woitn": False}
+
+
+@dataclass
+class SenseVoiceTags:
+    """从 SenseVoice 输出中提取的结构化标签 (多个片段时取第一个出现的语言/情感)"""
+    language: Optional[str] = None
+    emotion: Optional[str] = None
+    events: List[str] = field(default_factory=list)   # 音频事件 (Speech, BGM, Applause ...)，去重保序
+    itn: Optional[bool] = None                        # 是否做了逆文本正则化 (withitn / woitn)
+
+
+@dataclass
+class ParsedTranscript:
+    text: str
+    tags: SenseVoiceTags
+
+
+def parse_sensevoice_output(text: str, clean_tags: bool = True) -> ParsedTranscript:
+    """
+    一次扫描同时完成标签提取和文本清洗。
+
+    Args:
+        text: 原始文本 (e.g. "<|zh|><|NEUTRAL|>你好")
+        clean_tags: 是否清洗文本；为 False 时原样返回文本，但依然提取标签
+
+    Returns:
+        ParsedTranscript(text=清洗后的文本, tags=结构化标签)
+    """
+    if not text:
+        return ParsedTranscript("", SenseVoiceTags())
+
+    parts = _split_tags(text)
+    tags = _collect_tags(parts[1::2])
+    return ParsedTranscript(_normalize("".join(parts[::2])) if clean_tags else text, tags)
+
+
+def parse_sensevoice_batch(texts: Iterable[str], clean_tags: bool = True) -> List[ParsedTranscript]:
+    """
+    批量版 parse_sensevoice_output (例如一个长音频的所有 VAD 段)。
+    各段的标签分别提取，正文拼接后只做一次规范化，省掉逐段调用的开销。
+    """
+    texts = [text or "" for text in texts]
+    split = [_split_tags(text) for text in texts]
+    tags = [_collect_tags(parts[1::2]) for parts in split]
+    if not clean_tags:
+        return [ParsedTranscript(text, segment_tags) for text, segment_tags in zip(texts, tags)]
+
+    bodies = _BATCH_SEPARATOR.join("".join(parts[::2]) for parts in split)
+    cleaned = _REPEATED_PUNCT_RE.sub(r'\1', bodies).split(_BATCH_SEPARATOR)
+    return [ParsedTranscript(" ".join(body.split()), segment_tags) for body, segment_tags in zip(cleaned, tags)]
+
 
 def clean_sensevoice_tags(text: str, clean_tags: bool = True) -> str:
     """
     清洗 SenseVoice 输出的特殊标签。
-    
+
     Args:
         text: 原始文本 (e.g. "<|zh|><|NEUTRAL|>你好")
         clean_tags: 是否执行清洗
-        
+
     Returns:
         清洗后的文本
     """
-    if not text:
-        return ""
-        
-    if not clean_tags:
-        return text
-        
-    # 1. 使用正则去掉所有 <|...|> 格式的标签
-    # 比如 <|zh|>, <|NEUTRAL|>, <|Speech|>, <|withitn|> 等
-    # 兼容带空格的标签格式: < | zh | >
-    cleaned = re.sub(r'<\s*\|\s*[^>]+?\s*\|\s*>', '', text)
-
-    # 2. 规范化标点符号 (去掉多余的重复标点)
-    cleaned = re.sub(r'，{2,}', '，', cleaned)
-    cleaned = re.sub(r',{2,}', ',', cleaned)
-    cleaned = re.sub(r'。{2,}', '。', cleaned)
-    cleaned = re.sub(r'\.{2,}', '.', cleaned)
-    
-    # 3. 去掉多余的空格 (有时候标签去掉后会留下双空格)
-    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
-    
-    return cleaned
\ No newline at end of file
+    return parse_sensevoice_output(text, clean_tags=clean_tags).text
+
+
+def _split_tags(text: str) -> List[str]:
+    """按标签切分：偶数位是正文，奇数位是标签内容。没有 '<' 的文本不走正则"""
+    if "<" not in text:
+        return [text]
+    return _TAG_RE.split(text)
+
+
+def _normalize(body: str) -> str:
+    # 合并重复标点，再把连续空白 (包括标签去掉后留下的双空格) 合并成一个空格
+    return " ".join(_REPEATED_PUNCT_RE.sub(r'\1', body).split())
+
+
+def _collect_tags(raw_tags: List[str]) -> SenseVoiceTags:
+    tags = SenseVoiceTags()
+    for raw_tag in raw_tags:
+        name = "".join(raw_tag.split())   # "S pe ech" -> "Speech"
+        if name in LANGUAGE_TAGS:
+            tags.language = tags.language or name
+        elif name in EMOTION_TAGS:
+            tags.emotion = tags.emotion or name
+        elif name in ITN_TAGS:
+            tags.itn = ITN_TAGS[name] if tags.itn is None else tags.itn
+        elif name not in tags.events:
+            tags.events.append(name)
+    return tags
@@ -0,0 +1,47 @@
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# multipart 边界、字段头等额外开销：请求体上限 = 文件上限 + 这些余量
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadLimitMiddleware:
+    """
+    请求体大小上限 (纯 ASGI 中间件，不缓冲请求体)。
+    - 声明的 Content-Length 超限：不读请求体，直接 413
+    - 没有声明 (chunked) 或声明不实：边收边数，超限时中止读取并返回 413
+    """
+
+    def __init__(self, app: ASGIApp, max_body_bytes: Optional[int]):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self.max_body_bytes is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            response = JSONResponse({"detail": self._detail()}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise HTTPException(status_code=413, detail=self._detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _detail(self) -> str:
+        return f"Request body exceeds {self.max_body_bytes} bytes."
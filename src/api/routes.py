@@ -1,7 +1,17 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
-from typing import Optional, List
+import asyncio
+import json
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import Optional, List, Dict, Any, AsyncIterator
 from pydantic import BaseModel, Field
 
+from src.adapters.audio import pcm_to_float32
+from src.core.engine import PIPELINES
+from src.services.streaming import StreamingSession
+
+# WebSocket 流式转录：已收到、等待处理的帧最多缓存多少个 (每帧通常 100-200ms 音频)，满了才对客户端反压
+STREAM_INBOX_FRAMES = 600
+
 # === 1. 定义响应模型 (The Contract) ===
 # 这里就是你找的 "OpenAPI 定义"。
 # 我们用 Python 类来代替 YAML，FastAPI 会自动把它们转换成文档。
@@ -20,12 +30,27 @@ class TranscriptionResponse(BaseModel):
     """
     text: str = Field(description="转录文本（根据clean_tags参数决定是否清理）")
     task: str = Field(default="transcribe", description="任务类型")
-    language: str = Field(default="zh", description="识别出的语言")
+    language: str = Field(default="auto", description="识别出的语言 (模型没有输出语言标签时为请求的 language)")
     duration: float = Field(description="音频总时长(秒)")
     raw_text: Optional[str] = Field(default=None, description="原始转录文本（包含所有SenseVoice标签和语气词）")
     is_cleaned: bool = Field(default=True, description="text字段是否经过清理")
+    emotion: Optional[str] = Field(default=None, description="识别出的情感 (HAPPY, SAD, ANGRY, NEUTRAL ...)")
+    events: Optional[List[str]] = Field(default=None, description="检测到的音频事件 (Speech, BGM, Applause, Laughter ...)")
     # 这里就是你觉得缺失的复杂部分：
     segments: Optional[List[Segment]] = Field(default=None, description="详细的时间戳分段信息")
+    timings: Optional[Dict[str, Any]] = Field(default=None, description="各处理阶段耗时(毫秒)，仅 verbose_json 返回")
+    pipeline: Optional[str] = Field(default=None, description="实际使用的推理流水线 (asr, asr_punc, full)")
+
+class JobStatusResponse(BaseModel):
+    """异步任务 (/v1/jobs) 的状态"""
+    id: str = Field(description="任务ID")
+    status: str = Field(description="任务状态 (queued, running, succeeded, failed, cancelled)")
+    created_at: float = Field(description="提交时间 (Unix 时间戳)")
+    started_at: Optional[float] = Field(default=None, description="开始处理时间")
+    finished_at: Optional[float] = Field(default=None, description="结束时间")
+    queue_position: Optional[int] = Field(default=None, description="排队位置 (1 表示下一个)，仅 queued 时返回")
+    eta_s: Optional[float] = Field(default=None, description="预计还需多少秒完成，按实测实时率估算")
+    error: Optional[str] = Field(default=None, description="失败原因，仅 failed 时返回")
 
 # === 2. 路由定义 ===
 router = APIRouter()
@@ -42,45 +67,298 @@ async def create_transcription(
     # === 输入参数定义 (Request Body) ===
     # 这里的每一个参数，FastAPI 都会自动生成到 OpenAPI 的 requestBody 中
     file: UploadFile = File(..., description="音频文件 (wav, mp3, m4a)"),
-    model: str = Form(default="sensevoice-small", description="模型ID (仅做兼容，固定为 sensevoice)"),
+    model: Optional[str] = Form(default=None, description="模型名 (见 /health 的 models)，不填使用默认模型"),
     language: str = Form(default="auto", description="语言代码 (zh, en, ja, ko, auto)"),
     response_format: str = Form(default="json", description="返回格式 (json, verbose_json)"),
     clean_tags: bool = Form(default=True, description="是否清洗情感标签 (<happy>等)"),
+    stream: bool = Form(default=False, description="是否以 SSE (text/event-stream) 渐进返回每个分段"),
+    pipeline: Optional[str] = Form(default=None, description="推理流水线 (asr, asr_punc, full)；不填则短语音自动走快速通道"),
+    deadline_s: Optional[float] = Form(default=None, gt=0, description="最多等待多少秒；预计赶不上时直接 503 + Retry-After (音频本身就比它长时 422)，不填使用服务端默认值"),
     prompt: Optional[str] = Form(default=None, description="提示词 (当前版本未实装)"),
     temperature: float = Form(default=0.0, description="采样温度 (当前版本未实装)"),
 ):
-    # 1. 获取 Service
-    service = request.app.state.service
+    # 1. 获取 Service (按 model 路由，没加载的模型在后台开始加载)
+    _validate_pipeline(pipeline)
+    service = await _acquire_service(request, model)
 
     try:
         # 2. 构造参数
         params = {
             "language": language,
             "clean_tags": clean_tags,
-            "response_format": response_format
+            "response_format": response_format,
+            "pipeline": pipeline
         }
 
-        # 3. 提交任务 (Task Submission)
+        # 3a. 渐进式返回 (SSE)：入队成功后立即开始响应，每解码完一段推送一次
+        if stream:
+            events = await service.submit_stream(file, params, deadline_s=deadline_s)
+            return StreamingResponse(
+                _sse_events(events, language),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        # 3b. 提交任务 (Task Submission)
         # 这一步 result 拿到的其实是一个字典 (dict)
-        result = await service.submit(file, params)
+        # 客户端断开 (超时、挂断) 后任务随即取消，不再占用推理
+        result = await service.submit(file, params, is_disconnected=request.is_disconnected, deadline_s=deadline_s)
         
         # 4. 构造返回对象 (Data Mapping)
-        # 如果 result 里没有 segments,Pydantic 会自动填 None，不会报错
-        return TranscriptionResponse(
-            text=result["text"],
-            duration=result.get("duration", 0.0),
-            language=language if language != "auto" else "zh", # MVP 简化处理
-            raw_text=result.get("raw_text"),  # 原始文本（包含所有标签）
-            is_cleaned=result.get("is_cleaned", True),  # 是否清理过
-            segments=result.get("segments", None) # 如果 Service 以后支持了 segments，这里直接透传
-        )
+        return _to_response(result, language)
 
     except RuntimeError as e:
-        if "Queue is full" in str(e):
-            raise HTTPException(status_code=503, detail="Server is busy (Queue Full). Please try again later.")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _service_error(service, e)
     
     except Exception as e:
         # 生产环境建议隐藏具体错误堆栈，但在 MVP 开发期打印出来方便调试
         print(f"Error processing request: {e}")
-        raise HTTPException(status_code=500, detail="Internal Server Error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+async def _acquire_service(request: Request, model: Optional[str]):
+    registry = request.app.state.registry
+    name = registry.resolve(model)
+    if name is None:
+        raise HTTPException(status_code=400, detail=f"Unsupported model '{model}'. Choose from: {', '.join(registry.names)}")
+    return await registry.acquire(name)
+
+
+def _validate_pipeline(pipeline: Optional[str]):
+    if pipeline is not None and pipeline not in PIPELINES:
+        raise HTTPException(status_code=400, detail=f"Unsupported pipeline '{pipeline}'. Choose from: {', '.join(PIPELINES)}")
+
+
+def _service_error(service, e: RuntimeError) -> HTTPException:
+    """
+    把 Service 抛出的 RuntimeError 映射成 HTTP 错误：
+    过载 (队列满/赶不上截止时间)/加载中/停机中为 503 + Retry-After，排队超过截止时间为 504，超限为 413，
+    音频本身就比截止时间长 (重试也没用) 为 422，其余 500
+    """
+    retry_after = {"Retry-After": str(getattr(e, "retry_after_s", service.retry_after_s))}
+    if "Deadline cannot be met" in str(e):
+        return HTTPException(status_code=503, detail=f"Server is overloaded: {e}", headers=retry_after)
+    if "Queue is full" in str(e):
+        return HTTPException(status_code=503, detail="Server is busy (Queue Full). Please try again later.", headers=retry_after)
+    if "Model is loading" in str(e):
+        return HTTPException(status_code=503, detail="Model is loading. Please try again later.", headers=retry_after)
+    if "Shutting down" in str(e):
+        return HTTPException(status_code=503, detail="Server is shutting down. Please try again later.", headers=retry_after)
+    if "Deadline unattainable" in str(e):
+        return HTTPException(status_code=422, detail=str(e))
+    if "Deadline exceeded" in str(e):
+        return HTTPException(status_code=504, detail=str(e))
+    if "Payload too large" in str(e):
+        return HTTPException(status_code=413, detail=str(e))
+    if "Client disconnected" in str(e):
+        # 客户端已经收不到了，沿用 nginx 的 499 (Client Closed Request) 便于日志区分
+        return HTTPException(status_code=499, detail=str(e))
+    return HTTPException(status_code=500, detail=str(e))
+
+
+# === 异步任务 API ===
+# 提交后立即返回任务 id，不占用连接；客户端轮询状态、取结果，或者等 webhook 回调
+@router.post(
+    "/v1/jobs",
+    response_model=JobStatusResponse,
+    status_code=202,
+    summary="异步提交转录任务",
+    description="上传音频文件，立即返回任务ID。完成后可通过 GET /v1/jobs/{id}/result 取结果，或通过 webhook_url 接收回调。",
+    tags=["Jobs"]
+)
+async def create_job(
+    request: Request,
+    file: UploadFile = File(..., description="音频文件 (wav, mp3, m4a)"),
+    model: Optional[str] = Form(default=None, description="模型名 (见 /health 的 models)，不填使用默认模型"),
+    language: str = Form(default="auto", description="语言代码 (zh, en, ja, ko, auto)"),
+    response_format: str = Form(default="json", description="返回格式 (json, verbose_json)"),
+    clean_tags: bool = Form(default=True, description="是否清洗情感标签 (<happy>等)"),
+    pipeline: Optional[str] = Form(default=None, description="推理流水线 (asr, asr_punc, full)；不填则短语音自动走快速通道"),
+    webhook_url: Optional[str] = Form(default=None, description="任务结束后把状态和结果 POST 到这个地址 (http/https，默认只允许公网地址)"),
+    deadline_s: Optional[float] = Form(default=None, gt=0, description="必须在多少秒内完成；预计赶不上时直接 503 (音频本身就比它长时 422)，排队超时的任务以失败结束。不填则不限"),
+):
+    _validate_pipeline(pipeline)
+    service = await _acquire_service(request, model)
+    if webhook_url is not None:
+        try:
+            await service.check_webhook_url(webhook_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    params = {
+        "language": language,
+        "clean_tags": clean_tags,
+        "response_format": response_format,
+        "pipeline": pipeline
+    }
+    try:
+        job = await service.submit_job(file, params, webhook_url=webhook_url, deadline_s=deadline_s)
+    except RuntimeError as e:
+        raise _service_error(service, e)
+
+    return JobStatusResponse(**service.job_status(job))
+
+
+def _get_job_or_404(request: Request, job_id: str):
+    """按任务 id 找到任务和它所属模型的 Service"""
+    found = request.app.state.registry.find_job(job_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return found
+
+
+@router.get("/v1/jobs/{job_id}", response_model=JobStatusResponse, summary="查询任务状态", tags=["Jobs"])
+async def get_job(request: Request, job_id: str):
+    service, job = _get_job_or_404(request, job_id)
+    return JobStatusResponse(**service.job_status(job))
+
+
+@router.get("/v1/jobs/{job_id}/result", response_model=TranscriptionResponse, summary="获取任务结果", tags=["Jobs"])
+async def get_job_result(request: Request, job_id: str):
+    """成功时返回与 /v1/audio/transcriptions 相同的结构；未完成或已取消返回 409，失败返回 500"""
+    _, job = _get_job_or_404(request, job_id)
+    status = job.status
+    if status == "succeeded":
+        return _to_response(job.future.result(), job.params.get("language", "auto"))
+    if status == "failed":
+        raise HTTPException(status_code=500, detail=str(job.future.exception()))
+    raise HTTPException(status_code=409, detail=f"Job is {status}.")
+
+
+@router.delete("/v1/jobs/{job_id}", response_model=JobStatusResponse, summary="取消排队中的任务", tags=["Jobs"])
+async def cancel_job(request: Request, job_id: str):
+    service, job = _get_job_or_404(request, job_id)
+    if not service.cancel_job(job):
+        raise HTTPException(status_code=409, detail=f"Job is {job.status} and can no longer be cancelled.")
+    return JobStatusResponse(**service.job_status(job))
+
+
+def _to_response(result: Dict[str, Any], language: str) -> TranscriptionResponse:
+    """把 Service 返回的字典映射成对外的 TranscriptionResponse"""
+    # 如果 result 里没有 segments,Pydantic 会自动填 None，不会报错
+    return TranscriptionResponse(
+        text=result["text"],
+        duration=result.get("duration", 0.0),
+        language=result.get("language") or language,
+        raw_text=result.get("raw_text"),  # 原始文本（包含所有标签）
+        is_cleaned=result.get("is_cleaned", True),  # 是否清理过
+        emotion=result.get("emotion"),
+        events=result.get("events"),
+        segments=result.get("segments", None), # 如果 Service 以后支持了 segments，这里直接透传
+        timings=result.get("timings"),
+        pipeline=result.get("pipeline")
+    )
+
+
+async def _sse_events(events: AsyncIterator[Dict[str, Any]], language: str) -> AsyncIterator[str]:
+    """
+    把 Service 的事件流编码成 SSE 格式：
+    - event: segment  每个 VAD 段解码完成后推送 (id/start/end/text)
+    - event: done     最终汇总，结构与非流式接口的 JSON 响应一致
+    - event: error    中途失败 (响应头已经发出，无法再改 HTTP 状态码)
+    """
+    try:
+        async for event in events:
+            if event["type"] == "segment":
+                payload = Segment(**event).model_dump()
+            else:
+                payload = _to_response(event, language).model_dump()
+            yield f"event: {event['type']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    except Exception as e:
+        print(f"Error while streaming transcription: {e}")
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+
+
+@router.websocket("/v1/audio/stream")
+async def stream_transcription(
+    websocket: WebSocket,
+    language: str = "auto",
+    clean_tags: bool = True,
+    encoding: str = "pcm_s16le",
+    partial_interval_s: float = 2.0,
+):
+    """
+    实时流式转录 (WebSocket)。
+
+    协议：
+    - 客户端发送二进制帧：16kHz 单声道 PCM (encoding = pcm_s16le / pcm_f32le)
+    - 客户端发送文本帧 "end" (或 {"event": "end"})：表示音频结束
+    - 服务端发送 JSON 事件：partial / final / error / done (见 StreamingSession)
+    """
+    service = websocket.app.state.service
+    if not service.ready:
+        # 流式会话需要引擎跑 VAD，模型加载完成前无法排队：1013 = Try Again Later
+        await websocket.close(code=1013, reason="Model is loading")
+        return
+
+    await websocket.accept()
+    session = StreamingSession(
+        service,
+        params={"language": language, "clean_tags": clean_tags, "response_format": "json"},
+        partial_interval_s=partial_interval_s,
+    )
+
+    # 收帧和推理解耦：单独的任务一直读 WebSocket，帧按顺序放进 inbox；本协程依次处理。
+    # 语音段结束时要等这一段的识别结果，这期间照常收帧 (客户端的发送不会被反压卡住)，断开也能立即发现
+    inbox: asyncio.Queue = asyncio.Queue(maxsize=STREAM_INBOX_FRAMES)
+    receiver = asyncio.create_task(_receive_frames(websocket, inbox))
+    try:
+        while True:
+            message = await inbox.get()
+            if message is None:
+                return
+
+            if message.get("bytes") is not None:
+                try:
+                    samples = pcm_to_float32(message["bytes"], encoding=encoding)
+                except ValueError as e:
+                    await websocket.send_json({"type": "error", "detail": str(e)})
+                    continue
+                events = await session.feed(samples)
+
+            elif _is_end_message(message.get("text")):
+                for event in await session.finish():
+                    await websocket.send_json(event)
+                await websocket.close()
+                return
+
+            else:
+                continue
+
+            for event in events:
+                await websocket.send_json(event)
+
+    except WebSocketDisconnect:
+        # 客户端提前断开，直接结束会话即可
+        pass
+    finally:
+        receiver.cancel()
+
+
+async def _receive_frames(websocket: WebSocket, inbox: asyncio.Queue):
+    """持续读取客户端的帧放进 inbox；断开时放入 None。收到结束消息后不再读取"""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            await inbox.put(message)
+            if _is_end_message(message.get("text")):
+                return
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    await inbox.put(None)
+
+
+def _is_end_message(text: Optional[str]) -> bool:
+    """只认精确的结束控制消息："end" 或 {"event": "end"}，其他文本帧 (配置、"append" 等) 一律忽略"""
+    if text is None:
+        return False
+    if text.strip() == "end":
+        return True
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return False
+    return isinstance(message, dict) and message.get("event") == "end"
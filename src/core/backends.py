@@ -0,0 +1,129 @@
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core import engine as engine_module
+from src.core.engine import MODEL_SAMPLE_RATE, SenseVoiceEngine, _import_funasr, _import_torch
+
+# 推理后端：
+# - "torch": FunASR 原生 fp32 (MPS / CUDA / CPU)，即 SenseVoiceEngine
+# - "int8": ASR 子模型的 Linear 层做 PyTorch 动态 int8 量化，权重常驻 int8，激活按批量化 (仅 CPU)
+# - "onnx": ASR 子模型换成导出的 ONNX 模型 (默认 int8 量化版)，由 onnxruntime 执行 (仅 CPU，仅 SenseVoice)
+# VAD 和标点子模型在所有后端下都保持 FunASR 原样 (体积小，不是瓶颈)
+ENGINE_BACKENDS = ("torch", "int8", "onnx")
+
+# === 可选依赖延迟导入 ===
+# onnx 后端才需要 funasr-onnx + onnxruntime，不装也不影响其他后端
+SenseVoiceSmallOnnx = None
+
+
+def _import_funasr_onnx():
+    global SenseVoiceSmallOnnx
+    if SenseVoiceSmallOnnx is None:
+        try:
+            from funasr_onnx import SenseVoiceSmall
+        except ImportError as e:
+            raise RuntimeError("The onnx backend requires funasr-onnx and onnxruntime (pip install funasr-onnx onnxruntime).") from e
+        SenseVoiceSmallOnnx = SenseVoiceSmall
+    return SenseVoiceSmallOnnx
+
+
+class OnnxSenseVoiceModel:
+    """
+    把 funasr_onnx 的 SenseVoiceSmall 包装成 FunASR 子模型的样子 (eval / parameters / inference)。
+    替换 AutoModel.model 之后，generate (VAD + 动态分批) 和 inference (快速通道、分段推理) 都照常调用它，
+    输出同样是带 <|zh|><|NEUTRAL|>... 标签的原始文本，清洗逻辑不用改。
+    """
+
+    def __init__(self, session: Any):
+        self.session = session
+
+    def eval(self) -> "OnnxSenseVoiceModel":
+        return self
+
+    def parameters(self):
+        # AutoModel.inference 结束时用第一个参数的 device 判断是否清理 CUDA 缓存
+        yield _import_torch().zeros(0)
+
+    def inference(
+        self,
+        data_in: Sequence[Any],
+        data_lengths: Any = None,
+        key: Optional[List[str]] = None,
+        language: str = "auto",
+        use_itn: bool = False,
+        **kwargs: Any,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        waveforms = [self._to_waveform(item) for item in data_in]
+        textnorm = "withitn" if use_itn else "woitn"
+        # funasr_onnx 把列表输入当作文件路径，数组只能逐个传
+        texts = [self.session(waveform, language=language, textnorm=textnorm)[0] if len(waveform) else "" for waveform in waveforms]
+
+        keys = key or [f"onnx_{index}" for index in range(len(waveforms))]
+        audio_s = sum(len(waveform) for waveform in waveforms) / MODEL_SAMPLE_RATE
+        return [{"key": k, "text": text} for k, text in zip(keys, texts)], {"batch_data_time": audio_s}
+
+    @staticmethod
+    def _to_waveform(item: Any) -> np.ndarray:
+        if isinstance(item, str):
+            # 文件输入与 torch 后端一致：交给 FunASR 的加载器 (torchaudio / ffmpeg)
+            _import_funasr()
+            item = engine_module.load_audio_text_image_video(item, fs=MODEL_SAMPLE_RATE)
+        if hasattr(item, "numpy"):
+            item = item.detach().cpu().numpy()
+        return np.asarray(item, dtype=np.float32).reshape(-1)
+
+
+class QuantizedSenseVoiceEngine(SenseVoiceEngine):
+    """
+    CPU 推理后端 (int8 动态量化 / ONNX Runtime)。
+    接口与 SenseVoiceEngine 完全一致：加载时先按原样加载 AutoModel (VAD、标点不变)，
+    再把 ASR 子模型换成量化版本，之后的 generate / inference / 分段推理 / 预热都走新的子模型。
+    """
+
+    def __init__(
+        self,
+        model_id: str = "iic/SenseVoiceSmall",
+        backend: str = "int8",
+        num_threads: Optional[int] = None,
+        warmup_buckets_s: Sequence[float] = (),
+        vad_model: Optional[str] = "fsmn-vad",
+        punc_model: Optional[str] = "ct-punc",
+        onnx_quantize: bool = True,
+    ):
+        """
+        Args:
+            backend: "int8" 或 "onnx" (见 ENGINE_BACKENDS)
+            onnx_quantize: onnx 后端是否使用 int8 量化的 ONNX 模型 (model_quant.onnx)，否则用 fp32 的 model.onnx
+            其余参数同 SenseVoiceEngine；device 固定为 cpu
+        """
+        if backend not in ENGINE_BACKENDS or backend == "torch":
+            raise ValueError(f"Unknown quantized backend: {backend}")
+        self.backend = backend
+        self.onnx_quantize = onnx_quantize
+        super().__init__(
+            model_id=model_id,
+            device="cpu",
+            num_threads=num_threads,
+            warmup_buckets_s=warmup_buckets_s,
+            vad_model=vad_model,
+            punc_model=punc_model,
+        )
+
+    def _prepare_backend(self):
+        torch = _import_torch()
+        if self.backend == "int8":
+            # 只量化 Linear (编码器的注意力和前馈层，占绝大部分计算)；卷积和前端特征提取保持 fp32
+            self.model.model = torch.ao.quantization.quantize_dynamic(self.model.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        else:
+            # ONNX 模型不存在时 funasr_onnx 会先导出一次 (需要几分钟)，之后直接复用；
+            # 替换后原来的 PyTorch 权重随之释放
+            session = _import_funasr_onnx()(
+                self.model_id,
+                quantize=self.onnx_quantize,
+                intra_op_num_threads=self.num_threads or os.cpu_count() or 1,
+            )
+            self.model.model = OnnxSenseVoiceModel(session)
+        print(f"⚡ ASR sub-model switched to the {self.backend} backend{' (int8)' if self.backend == 'onnx' and self.onnx_quantize else ''}.")
+
@@ -1,9 +1,52 @@
-import torch
+import numpy as np
 import time
-import os
 import gc
-from funasr import AutoModel
-from typing import Optional, Dict, Any
+import threading
+from typing import Optional, Dict, Any, List, Union, Callable, Sequence, TYPE_CHECKING
+from src.adapters.audio import merge_vad_segments, synth_speech_like
+from src.core.tracing import stage
+
+if TYPE_CHECKING:
+    from src.core.fanout import ChunkFanout
+
+# SenseVoice 的前端固定使用 16kHz 采样率
+MODEL_SAMPLE_RATE = 16000
+# generate 的动态分批参数默认值：每批最多 BATCH_SIZE_S 秒音频，相邻的短 VAD 段合并到 MERGE_LENGTH_S 秒
+# 内存吃紧时 MemoryWatchdog 会调小引擎实例上的这两个值，分段推理的合并长度也随之变化
+BATCH_SIZE_S = 60
+MERGE_LENGTH_S = 15
+MERGE_LENGTH_MS = MERGE_LENGTH_S * 1000
+# 推理流水线变体，共用同一份已加载的权重：
+# - "full": VAD 切分 + ASR + 标点 (长音频必须走这条)
+# - "asr_punc": 跳过 VAD，整段 ASR + 标点 (短语音)
+# - "asr": 只做 ASR (最快，没有标点)
+PIPELINES = ("asr", "asr_punc", "full")
+
+# === 重依赖延迟导入 ===
+# 导入 torch + funasr 要十几秒，放到第一次真正用到时 (通常是后台加载模型时) 再导入，
+# 这样服务进程不到一秒就能开始监听端口、响应探针
+torch = None
+AutoModel = None
+load_audio_text_image_video = None
+
+
+def _import_torch():
+    global torch
+    if torch is None:
+        import torch as torch_module
+        torch = torch_module
+    return torch
+
+
+def _import_funasr():
+    global AutoModel, load_audio_text_image_video
+    if AutoModel is None:
+        from funasr import AutoModel as auto_model
+        AutoModel = auto_model
+    if load_audio_text_image_video is None:
+        from funasr.utils.load_utils import load_audio_text_image_video as loader
+        load_audio_text_image_video = loader
+
 
 class SenseVoiceEngine:
     """
@@ -11,24 +54,51 @@ class SenseVoiceEngine:
     负责模型的生命周期管理（加载、推理、资源释放）。
     """
 
-    def __init__(self, model_id: str = "iic/SenseVoiceSmall", device: Optional[str] = None):
+    def __init__(
+        self,
+        model_id: str = "iic/SenseVoiceSmall",
+        device: Optional[str] = None,
+        num_threads: Optional[int] = None,
+        warmup_buckets_s: Sequence[float] = (),
+        vad_model: Optional[str] = "fsmn-vad",
+        punc_model: Optional[str] = "ct-punc",
+    ):
         self.model_id = model_id
+        # 搭配的 VAD / 标点子模型，None 表示不加载 (没有 VAD 时 "full" 流水线整段识别，没有标点时原样返回)
+        self.vad_model = vad_model
+        self.punc_model = punc_model
+        # CPU 推理线程数 (FunASR 的 ncpu)。多副本时每个副本分到一段，避免互相抢核
+        self.num_threads = num_threads
+        # 预热用的音频时长档位 (秒)，为空则不预热
+        self.warmup_buckets_s = tuple(warmup_buckets_s)
+        self.warmup_results: List[Dict[str, Any]] = []
         # 自动检测 M4 Pro (MPS) 环境
         if device is None:
-            self.device = "mps" if torch.backends.mps.is_available() else "cpu"
+            self.device = "mps" if _import_torch().backends.mps.is_available() else "cpu"
         else:
             self.device = device
         
         self.model = None
+        self.batch_size_s = BATCH_SIZE_S
+        self.merge_length_s = MERGE_LENGTH_S
+        # 加载进度 (供 /readyz 展示)：pending -> importing -> loading model -> warming up -> ready
+        self.load_stage = "pending"
+        # 流式 VAD 专用的小模型 (fsmn-vad，<2MB)，首次使用时才加载
+        # 固定跑在 CPU 上，不和主模型争抢 MPS；多个 WebSocket 会话共用，调用时加锁
+        self.stream_vad_model = None
+        self._stream_vad_lock = threading.Lock()
         print(f"⚙️ Engine initialized. Target device: {self.device}")
 
-    def load(self):
+    def load(self, warmup: bool = True):
         """
         加载模型。
         这一步会触发 FunASR 的自动检查机制：
         1. 检查本地缓存 (~/.cache/modelscope)
         2. 如果不存在，自动下载
         3. 加载到内存/显存
+
+        Args:
+            warmup: 是否预热；空闲卸载后按需重新加载时跳过，尽快处理等待中的请求
         """
         if self.model is not None:
             print("⚠️ Model already loaded. Skipping.")
@@ -39,73 +109,438 @@ class SenseVoiceEngine:
         
         try:
             start_time = time.time()
-            
+
+            self.load_stage = "importing"
+            _import_torch()
+            _import_funasr()
+
+            self.load_stage = "loading model"
             # === 核心逻辑：复用你旧代码中的参数 ===
             self.model = AutoModel(
                 model=self.model_id,
-                vad_model="fsmn-vad",  # 语音活动检测，用于切分长音频
-                punc_model="ct-punc",  # 标点符号模型
+                vad_model=self.vad_model,    # 语音活动检测，用于切分长音频
+                punc_model=self.punc_model,  # 标点符号模型
                 device=self.device,
                 disable_update=True,   # 禁止每次都去 check update，加快启动速度
-                log_level="ERROR"      # 减少刷屏日志
+                log_level="ERROR",     # 减少刷屏日志
+                **({"ncpu": self.num_threads} if self.num_threads else {})
             )
             
+            # 替换推理后端 (见 src/core/backends.py) 放在预热之前：预热测的就是实际使用的后端
+            self._prepare_backend()
+
             duration = time.time() - start_time
             print(f"✅ Model loaded successfully in {duration:.2f}s")
             
             # 简单的 Warmup (预热)，防止第一次推理卡顿
-            self._warmup()
+            if warmup:
+                self.load_stage = "warming up"
+                self._warmup()
+            self.load_stage = "ready"
             
         except Exception as e:
+            self.load_stage = "failed"
             print(f"❌ Failed to load model: {e}")
             raise e
 
+    def _prepare_backend(self):
+        """加载完成后的扩展点：子类在这里替换 ASR 子模型 (self.model.model)，默认保持 FunASR 原生 PyTorch"""
+
     def _warmup(self):
-        """执行一次空推理，让 MPS 图编译完成"""
-        print("🔥 Warming up model...")
-        try:
-            # 随便搞个极短的空音频或伪造输入，这里简单打印一下即可
-            # 实际 FunASR 在加载时内部会有初始化
-            pass 
-        except Exception:
-            pass
+        """
+        按时长档位合成类语音音频，完整跑一遍 VAD + ASR + 标点，
+        让算子选择、内存池扩张、各子模型的首次调用开销都发生在接流量之前。
+        每个档位跑两次：第一次是冷启动耗时，第二次是预热后的耗时。
+        """
+        if not self.warmup_buckets_s:
+            return
 
-    def transcribe_file(self, file_path: str, language: str = "auto", use_itn: bool = True) -> str:
+        print(f"🔥 Warming up model with {len(self.warmup_buckets_s)} length bucket(s)...")
+        self.warmup_results = []
+        for bucket_s in self.warmup_buckets_s:
+            audio = synth_speech_like(bucket_s, MODEL_SAMPLE_RATE)
+            try:
+                cold_ms = self._timed_generate(audio)
+                warm_ms = self._timed_generate(audio)
+            except Exception as e:
+                # 预热失败不影响服务启动，第一个真实请求照常付出冷启动代价
+                print(f"⚠️ Warmup failed for {bucket_s:g}s bucket: {e}")
+                self.warmup_results.append({"bucket_s": bucket_s, "error": str(e)})
+                continue
+
+            self.warmup_results.append({"bucket_s": bucket_s, "cold_ms": round(cold_ms, 1), "warm_ms": round(warm_ms, 1)})
+            print(f"   {bucket_s:g}s bucket: cold {cold_ms:.0f}ms, warm {warm_ms:.0f}ms")
+
+    def _timed_generate(self, audio: np.ndarray) -> float:
+        start_time = time.perf_counter()
+        self._generate(audio, language="auto", use_itn=True)
+        return (time.perf_counter() - start_time) * 1000.0
+
+    def transcribe_file(self, file_path: str, language: str = "auto", use_itn: bool = True, pipeline: str = "full") -> str:
         """
-        执行推理。
+        执行推理。pipeline 见 PIPELINES。
         注意：这是同步阻塞方法，必须在 Service 层通过线程池调用。
         """
+        res = self._generate(file_path, language=language, use_itn=use_itn, pipeline=pipeline)
+
+        # res 是一个列表，取第一个结果 (静音文件可能没有结果)
+        return res[0]["text"] if res else ""
+
+    def transcribe_array(
+        self,
+        samples: Union[np.ndarray, "torch.Tensor"],
+        sample_rate: int = MODEL_SAMPLE_RATE,
+        language: str = "auto",
+        use_itn: bool = True,
+        pipeline: str = "full",
+    ) -> str:
+        """
+        对内存中的音频缓冲区执行推理，跳过 FunASR 的文件读取与解码。
+        samples 为单声道 float32 一维数组 (NumPy 或 torch)，16kHz 时零拷贝直接透传。
+        注意：这是同步阻塞方法，必须在 Service 层通过线程池调用。
+        """
+        audio = self._prepare_array(samples, sample_rate)
+        res = self._generate(audio, language=language, use_itn=use_itn, pipeline=pipeline)
+        return res[0]["text"] if res else ""
+
+    def transcribe_batch(
+        self,
+        inputs: List[Any],
+        sample_rate: int = MODEL_SAMPLE_RATE,
+        language: str = "auto",
+        use_itn: bool = True,
+        pipeline: str = "full",
+    ) -> List[str]:
+        """
+        批量推理 (文件路径或 float32 数组，数组采样率为 sample_rate)，返回的文本列表与 inputs 一一对应。
+        不交给 generate：它在 VAD 流水线上逐个输入处理 (CPU 上每段单独前向)，多个任务凑成一批也不会共享前向。
+        这里每个输入各跑一次 VAD，所有输入切出的语音段放在一起按长度打包，一次 ASR 前向处理多个任务的语音段；
+        拼接和标点与 generate 一致 (同一输入的各段以空格连接，再整体加标点)。
+        注意：这是同步阻塞方法，必须在 Service 层通过线程池调用。
+        """
+        if not inputs:
+            return []
         if not self.model:
             raise RuntimeError("Model not loaded! Call engine.load() first.")
+        if pipeline not in PIPELINES:
+            raise ValueError(f"Unknown pipeline: {pipeline}")
 
-        # 映射语言参数
-        # SenseVoice 支持: zh, en, yue, ja, ko
-        valid_langs = ["zh", "en", "yue", "ja", "ko"]
-        target_lang = language if language in valid_langs else "auto"
+        # 1. VAD：逐个输入切段 (VAD 子模型很小，不是瓶颈)；不走 VAD 的流水线整段作为一个语音段
+        owners, pieces = [], []
+        for index, item in enumerate(inputs):
+            audio = self._load_audio(item, sample_rate)
+            for start_ms, end_ms in self._detect_segments(audio, pipeline):
+                owners.append(index)
+                pieces.append(audio[start_ms * MODEL_SAMPLE_RATE // 1000:end_ms * MODEL_SAMPLE_RATE // 1000])
+
+        # 2. ASR：跨任务打包前向
+        texts = self._transcribe_pieces(pieces, language, use_itn)
+
+        # 3. 按输入拼接，再加标点
+        parts: List[List[str]] = [[] for _ in inputs]
+        for index, text in zip(owners, texts):
+            parts[index].append(text)
+        results = [" ".join(texts_of_input) for texts_of_input in parts]
+        if pipeline != "asr":
+            results = [self._punctuate(text) for text in results]
+
+        self._empty_cache()
+        return results
+
+    def _transcribe_pieces(self, pieces: List[Any], language: str, use_itn: bool) -> List[str]:
+        """
+        把一组语音段打包成尽量少的 ASR 前向，返回与 pieces 一一对应的原始文本。
+        按长度排序后依次装包 (补齐的 padding 最少)，每包 最长段 x 段数 不超过 batch_size_s 秒，
+        与 FunASR 动态分批的规则相同，内存吃紧时 batch_size_s 被调小，包也随之变小。
+        """
+        texts = [""] * len(pieces)
+        order = sorted((index for index, piece in enumerate(pieces) if len(piece)), key=lambda index: len(pieces[index]))
+        budget = self.batch_size_s * MODEL_SAMPLE_RATE
+
+        group: List[int] = []
+        for index in order:
+            # 升序遍历，当前段就是包内最长的
+            if group and len(pieces[index]) * (len(group) + 1) > budget:
+                self._transcribe_group(pieces, group, texts, language, use_itn)
+                group = []
+            group.append(index)
+        if group:
+            self._transcribe_group(pieces, group, texts, language, use_itn)
+        return texts
+
+    def _transcribe_group(self, pieces: List[Any], group: List[int], texts: List[str], language: str, use_itn: bool):
+        """一次前向识别一包语音段。AutoModel 在 CPU 上默认 batch_size=1，这里按包大小显式指定"""
+        with stage("asr"):
+            res = self.model.inference(
+                [pieces[index] for index in group],
+                model=self.model.model,
+                kwargs=dict(self.model.kwargs, batch_size=len(group)),
+                language=self._target_language(language),
+                use_itn=use_itn
+            )
+        if len(res) != len(group):
+            raise RuntimeError(f"ASR returned {len(res)} result(s) for a batch of {len(group)} segment(s).")
+        for index, item in zip(group, res):
+            texts[index] = item["text"]
+
+    @staticmethod
+    def _prepare_array(samples: Union[np.ndarray, "torch.Tensor"], sample_rate: int) -> Union[np.ndarray, "torch.Tensor"]:
+        """把缓冲区整理成模型需要的 16kHz float32 一维数据，已经符合要求时不复制"""
+        torch = _import_torch()
+        if isinstance(samples, torch.Tensor):
+            audio = samples.to(torch.float32).reshape(-1)
+        else:
+            audio = np.asarray(samples, dtype=np.float32).reshape(-1)
+
+        if sample_rate != MODEL_SAMPLE_RATE:
+            import torchaudio.functional as AF
+
+            with stage("resample"):
+                tensor = audio if isinstance(audio, torch.Tensor) else torch.from_numpy(audio)
+                audio = AF.resample(tensor, sample_rate, MODEL_SAMPLE_RATE)
+
+        return audio
+
+    def transcribe_segments(
+        self,
+        model_input: Union[str, np.ndarray, "torch.Tensor"],
+        sample_rate: int = MODEL_SAMPLE_RATE,
+        language: str = "auto",
+        use_itn: bool = True,
+        on_segment: Optional[Callable[[Dict[str, Any]], None]] = None,
+        pipeline: str = "full",
+        fanout: Optional["ChunkFanout"] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        分段推理：先跑一次 VAD，再按时间顺序逐段做 ASR + 标点。
+        不走 VAD 的流水线 (asr / asr_punc) 把整段音频当作一个分段。
+        每识别完一段就调用 on_segment，调用方可以边解码边输出 (例如 SSE)。
+        复用 AutoModel 内已加载的 vad/asr/punc 子模型，不会额外占用显存。
+        传入 fanout 时，本进程只跑 VAD，各段的 ASR + 标点分发到进程池并行执行，仍按时间顺序回调。
+
+        Returns:
+            [{"start": 秒, "end": 秒, "text": 原始文本 (含 SenseVoice 标签)}, ...]
+        注意：这是同步阻塞方法，必须在 Service 层通过线程池调用。
+        """
+        if not self.model:
+            raise RuntimeError("Model not loaded! Call engine.load() first.")
+
+        audio = self._load_audio(model_input, sample_rate)
+
+        # 1. VAD：切出语音段 (毫秒)
+        vad_segments = self._detect_segments(audio, pipeline)
+
+        if fanout is not None:
+            return self._transcribe_segments_fanout(audio, vad_segments, language, use_itn, on_segment, pipeline, fanout)
+
+        segments = []
+        for start_ms, end_ms in vad_segments:
+            begin = start_ms * MODEL_SAMPLE_RATE // 1000
+            end = end_ms * MODEL_SAMPLE_RATE // 1000
+
+            # 2. ASR：只识别这一段
+            with stage("asr"):
+                asr_res = self.model.inference(
+                    audio[begin:end],
+                    model=self.model.model,
+                    kwargs=self.model.kwargs,
+                    language=self._target_language(language),
+                    use_itn=use_itn
+                )
+            text = asr_res[0]["text"] if asr_res else ""
+
+            # 3. 标点
+            if pipeline != "asr":
+                text = self._punctuate(text)
+
+            segment = {"start": start_ms / 1000.0, "end": end_ms / 1000.0, "text": text}
+            segments.append(segment)
+            if on_segment is not None:
+                on_segment(segment)
+
+        self._empty_cache()
+        return segments
+
+    def _load_audio(self, model_input: Union[str, np.ndarray, "torch.Tensor"], sample_rate: int) -> Union[np.ndarray, "torch.Tensor"]:
+        if isinstance(model_input, str):
+            # 文件输入 (内存解码不了的格式)：交给 FunASR 的加载器 (torchaudio / ffmpeg)
+            _import_funasr()
+            with stage("load_audio"):
+                return load_audio_text_image_video(model_input, fs=MODEL_SAMPLE_RATE)
+        return self._prepare_array(model_input, sample_rate)
+
+    def _detect_segments(self, audio: Union[np.ndarray, "torch.Tensor"], pipeline: str) -> List[List[int]]:
+        """
+        语音段 [[start_ms, end_ms], ...]：完整流水线跑 VAD，并像 generate(merge_vad=True) 一样合并短段；
+        不走 VAD 的流水线 (或没有加载 VAD 子模型) 整段作为一个语音段
+        """
+        if pipeline == "full" and self.model.vad_model is not None:
+            with stage("vad"):
+                vad_res = self.model.inference(audio, model=self.model.vad_model, kwargs=self.model.vad_kwargs)
+            return merge_vad_segments(vad_res[0]["value"], self.merge_length_s * 1000) if vad_res else []
+        return [[0, len(audio) * 1000 // MODEL_SAMPLE_RATE]]
+
+    def _transcribe_segments_fanout(
+        self,
+        audio: Union[np.ndarray, "torch.Tensor"],
+        vad_segments: List[List[int]],
+        language: str,
+        use_itn: bool,
+        on_segment: Optional[Callable[[Dict[str, Any]], None]],
+        pipeline: str,
+        fanout: "ChunkFanout",
+    ) -> List[Dict[str, Any]]:
+        """一次性提交所有语音段，再按提交顺序收回结果：拼接顺序和时间戳都与串行分段推理一致"""
+        if not isinstance(audio, np.ndarray):
+            audio = audio.numpy()
+
+        chunk_pipeline = "asr" if pipeline == "asr" else "asr_punc"
+        with stage("fanout"):
+            futures = [
+                fanout.submit(
+                    audio[start_ms * MODEL_SAMPLE_RATE // 1000:end_ms * MODEL_SAMPLE_RATE // 1000],
+                    self._target_language(language),
+                    use_itn,
+                    chunk_pipeline,
+                )
+                for start_ms, end_ms in vad_segments
+            ]
+
+            segments = []
+            try:
+                for (start_ms, end_ms), future in zip(vad_segments, futures):
+                    segment = {"start": start_ms / 1000.0, "end": end_ms / 1000.0, "text": future.result()}
+                    segments.append(segment)
+                    if on_segment is not None:
+                        on_segment(segment)
+            finally:
+                # 中途失败时不再占用子进程
+                for future in futures:
+                    future.cancel()
+
+        return segments
+
+    def _generate(self, model_input: Any, language: str, use_itn: bool, pipeline: str = "full") -> List[Dict[str, Any]]:
+        """调用 FunASR 并在结束后清理显存"""
+        if not self.model:
+            raise RuntimeError("Model not loaded! Call engine.load() first.")
+        if pipeline not in PIPELINES:
+            raise ValueError(f"Unknown pipeline: {pipeline}")
+
+        if pipeline != "full":
+            res = self._generate_without_vad(model_input, language, use_itn, punctuate=pipeline == "asr_punc")
+            self._empty_cache()
+            return res
 
         # 调用 FunASR
         # 这里的参数完全参考你提供的成功运行的脚本
-        res = self.model.generate(
-            input=file_path,
-            cache={},
-            language=target_lang,
-            use_itn=use_itn,       # 逆文本标准化 (一百 -> 100)
-            batch_size_s=60,       # 批处理大小 (60秒音频切片)
-            merge_vad=True,        # 自动合并短句
-            merge_length_s=15
-        )
-        
-        # res 是一个列表，取第一个结果
-        text = res[0]["text"]
+        # generate 内部的 解码/VAD/ASR/标点 拆不开，整体记为一个阶段；需要细分时走 transcribe_segments
+        with stage("generate"):
+            res = self.model.generate(
+                input=model_input,
+                cache={},
+                language=self._target_language(language),
+                use_itn=use_itn,       # 逆文本标准化 (一百 -> 100)
+                batch_size_s=self.batch_size_s,      # 批处理大小 (默认 60 秒音频切片，内存吃紧时调小)
+                merge_vad=True,                      # 自动合并短句
+                merge_length_s=self.merge_length_s
+            )
+
+        self._empty_cache()
+        return res
+
+    def _generate_without_vad(self, model_input: Any, language: str, use_itn: bool, punctuate: bool) -> List[Dict[str, Any]]:
+        """
+        短语音快速通道：整段直接送进 ASR 子模型，跳过 VAD 切分 (以及 batch_size_s 动态分批)，
+        按需再过一遍标点。每个输入恰好对应一个结果，顺序与输入一致。
+        """
+        with stage("asr"):
+            res = self.model.inference(
+                model_input,
+                model=self.model.model,
+                kwargs=self.model.kwargs,
+                language=self._target_language(language),
+                use_itn=use_itn
+            )
+
+        if punctuate:
+            for item in res:
+                item["text"] = self._punctuate(item["text"])
+        return res
+
+    def _punctuate(self, text: str) -> str:
+        if not text or self.model.punc_model is None:
+            return text
+        with stage("punc"):
+            punc_res = self.model.inference(text, model=self.model.punc_model, kwargs=self.model.punc_kwargs)
+        return punc_res[0]["text"] if punc_res else text
+
+    @staticmethod
+    def _target_language(language: str) -> str:
+        """
+        映射语言参数
+        SenseVoice 支持: zh, en, yue, ja, ko，其余一律 auto
+        """
+        valid_langs = ["zh", "en", "yue", "ja", "ko"]
+        return language if language in valid_langs else "auto"
 
+    def _empty_cache(self):
         # === 内存优化：打扫战场 ===
         # 防止 MPS (Metal) 显存碎片化，对于 7x24 小时服务至关重要
+        torch = _import_torch()
         if self.device == "mps":
             torch.mps.empty_cache()
         elif self.device == "cuda":
             torch.cuda.empty_cache()
 
-        return text
+    def allocator_bytes(self) -> Optional[int]:
+        """加速器 (MPS/CUDA) 分配器当前占用的字节数；CPU 推理或未导入 torch 时返回 None"""
+        if torch is None or self.device == "cpu":
+            return None
+        try:
+            if self.device == "mps":
+                return int(torch.mps.driver_allocated_memory())
+            if self.device == "cuda":
+                return int(torch.cuda.memory_reserved())
+        except (AttributeError, RuntimeError):
+            pass
+        return None
+
+    def detect_speech_stream(
+        self,
+        samples: np.ndarray,
+        cache: Dict[str, Any],
+        is_final: bool = False,
+        chunk_ms: int = 200,
+    ) -> List[List[int]]:
+        """
+        流式 VAD：喂入一小段 16kHz float32 音频，返回本次新检测到的语音端点。
+        cache 由调用方为每条流单独持有，跨调用保存 VAD 状态。
+
+        Returns:
+            [[start_ms, end_ms], ...]，时间相对流的起点；
+            -1 表示该端点还没出现 (例如 [1200, -1] 表示语音从 1.2s 开始，尚未结束)
+        """
+        with self._stream_vad_lock:
+            if self.stream_vad_model is None:
+                _import_funasr()
+                print("🚀 Loading streaming VAD model 'fsmn-vad' on cpu...")
+                self.stream_vad_model = AutoModel(
+                    model="fsmn-vad",
+                    device="cpu",
+                    disable_update=True,
+                    disable_pbar=True,
+                    log_level="ERROR"
+                )
+
+            res = self.stream_vad_model.generate(
+                input=samples,
+                cache=cache,
+                is_final=is_final,
+                chunk_size=chunk_ms
+            )
+
+        return res[0]["value"] if res else []
 
     def release(self):
         """
@@ -116,7 +551,10 @@ class SenseVoiceEngine:
             print(f"♻️ Releasing model '{self.model_id}'...")
             del self.model
             self.model = None
-            
+            self.stream_vad_model = None
+            self.load_stage = "pending"
+
+            torch = _import_torch()
             if self.device == "mps":
                 torch.mps.empty_cache()
             elif self.device == "cuda":
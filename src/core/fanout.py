@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from src.core.engine import SenseVoiceEngine, MODEL_SAMPLE_RATE
+
+# === 子进程内的状态 ===
+# 每个子进程在 initializer 里加载一份自己的模型，之后只做 "ASR + 标点"
+_worker_engine: Optional[SenseVoiceEngine] = None
+
+
+def _init_worker(model_id: str, num_threads: Optional[int]):
+    global _worker_engine
+    _worker_engine = SenseVoiceEngine(model_id=model_id, device="cpu", num_threads=num_threads)
+    _worker_engine.load()
+
+
+def _transcribe_chunk(samples: np.ndarray, language: str, use_itn: bool, pipeline: str) -> str:
+    return _worker_engine.transcribe_array(samples, language=language, use_itn=use_itn, pipeline=pipeline)
+
+
+class ChunkFanout:
+    """
+    长音频并行转录用的 CPU 进程池。
+    主引擎只跑一次 VAD，切出来的语音段 (已按 MERGE_LENGTH_MS 合并) 分发给 workers 个子进程，
+    每个子进程各自持有一份模型、分到 cpu_count // workers 个线程，互不抢 GIL 和算子线程。
+    结果由调用方按提交顺序收回，时间戳直接取 VAD 的切分边界，所以拼接时不需要再对齐。
+
+    子进程用 spawn 启动：fork 一个已经加载了 torch 的进程可能死锁。
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        workers: int,
+        num_threads: Optional[int] = None,
+        start_method: str = "spawn",
+    ):
+        """
+        Args:
+            model_id: 子进程加载的模型
+            workers: 子进程数 (即同时在识别的语音段数)
+            num_threads: 每个子进程的推理线程数，默认按 CPU 核数平分
+            start_method: multiprocessing 启动方式
+        """
+        self.model_id = model_id
+        self.workers = max(1, workers)
+        self.num_threads = num_threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.start_method = start_method
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """启动进程池，并让每个子进程都完成模型加载 (阻塞，放到线程池里调用)"""
+        if self._executor is not None:
+            return
+
+        print(f"🚀 Starting {self.workers} long-audio worker process(es), {self.num_threads} thread(s) each...")
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_init_worker,
+            initargs=(self.model_id, self.num_threads),
+        )
+        # 每个子进程先跑一段 1 秒静音：把模型加载挪到接流量之前，而不是第一个长音频请求里
+        # (同时提交 workers 个任务时没有空闲进程，进程池会把子进程全部拉起来)
+        silence = np.zeros(MODEL_SAMPLE_RATE, dtype=np.float32)
+        warmup = [
+            self._executor.submit(_transcribe_chunk, silence, "auto", True, "asr")
+            for _ in range(self.workers)
+        ]
+        for future in warmup:
+            future.result()
+        print("✅ Long-audio workers ready.")
+
+    def submit(self, samples: np.ndarray, language: str, use_itn: bool, pipeline: str = "asr_punc") -> Future:
+        """提交一个 16kHz float32 语音段，返回的 Future 结果为识别文本 (含 SenseVoice 标签)"""
+        if self._executor is None:
+            raise RuntimeError("Fan-out pool not started! Call fanout.start() first.")
+        return self._executor.submit(_transcribe_chunk, np.ascontiguousarray(samples), language, use_itn, pipeline)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
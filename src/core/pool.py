@@ -0,0 +1,114 @@
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from src.core.engine import SenseVoiceEngine
+from src.adapters.memory import process_rss_bytes
+
+
+class EnginePool:
+    """
+    推理引擎副本池。
+    职责：
+    1. 按内存预算和实测的单副本占用，决定加载几个模型副本 (K)
+    2. 给每个副本分配一段 CPU 线程，避免副本之间抢核
+
+    默认 max_replicas=1，即 ADR-001 的单例串行模式。
+    只有 CPU 推理才允许多副本：MPS/CUDA 的统一内存/显存不适合多副本争抢。
+    """
+
+    def __init__(
+        self,
+        engine_factory: Callable[[Optional[int]], SenseVoiceEngine],
+        max_replicas: int = 1,
+        memory_budget_mb: Optional[float] = None,
+        replica_footprint_mb: Optional[float] = None,
+        cpu_count: Optional[int] = None,
+    ):
+        """
+        Args:
+            engine_factory: 传入线程数 (None 表示不限制)，返回一个未加载的引擎
+            max_replicas: 副本数上限
+            memory_budget_mb: 所有副本合计可用的内存预算；None 表示只受 max_replicas 限制
+            replica_footprint_mb: 单副本占用；None 表示加载第一个副本时实测
+            cpu_count: 可分配的 CPU 核数，默认取 os.cpu_count()
+        """
+        self.engine_factory = engine_factory
+        self.max_replicas = max(1, max_replicas)
+        self.memory_budget_mb = memory_budget_mb
+        self.replica_footprint_mb = replica_footprint_mb
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        self.engines: List[SenseVoiceEngine] = []
+        # 加载进度 (供 /readyz 展示)：第一个副本加载完才知道一共加载几个
+        self.planned_replicas: Optional[int] = None
+        self._loading: Optional[SenseVoiceEngine] = None
+
+    def load(self):
+        """加载第一个副本并测量占用，再按预算补齐其余副本"""
+        if self.engines:
+            print("⚠️ Engine pool already loaded. Skipping.")
+            return
+
+        # 先按上限切线程，算出来 K 变小也不重新切：宁可少用几个核，也不超卖
+        threads = self._threads_per_replica(self.max_replicas)
+
+        rss_before = process_rss_bytes()
+        first = self._load_replica(threads)
+        rss_after = process_rss_bytes()
+
+        if self.replica_footprint_mb is None and rss_before is not None and rss_after is not None:
+            self.replica_footprint_mb = max(rss_after - rss_before, 0) / (1024 * 1024)
+
+        replicas = self._plan_replicas(first.device)
+        self.planned_replicas = replicas
+        print(
+            f"🧮 Engine pool: {replicas} replica(s), {threads or 'default'} thread(s) each, "
+            f"footprint ~{self.replica_footprint_mb or 0:.0f}MB, budget {self.memory_budget_mb or 'unlimited'}MB"
+        )
+
+        for _ in range(replicas - 1):
+            self._load_replica(threads)
+
+    def _load_replica(self, threads: Optional[int]) -> SenseVoiceEngine:
+        engine = self.engine_factory(threads)
+        self._loading = engine
+        try:
+            engine.load()
+        finally:
+            self._loading = None
+        self.engines.append(engine)
+        return engine
+
+    def progress(self) -> Dict[str, Any]:
+        """加载进度：已加载/计划的副本数，以及正在加载的副本处于哪个阶段"""
+        loading = self._loading
+        return {
+            "replicas_loaded": len(self.engines),
+            "replicas_planned": self.planned_replicas,
+            "loading_stage": getattr(loading, "load_stage", None) if loading is not None else None,
+            # 各副本的预热结果相同，只展示第一个
+            "warmup": self.engines[0].warmup_results if self.engines else [],
+        }
+
+    def release(self):
+        for engine in self.engines:
+            engine.release()
+        self.engines = []
+
+    def _plan_replicas(self, device: str) -> int:
+        """根据设备、内存预算、CPU 核数计算副本数 K"""
+        if self.max_replicas <= 1 or device != "cpu":
+            return 1
+
+        replicas = min(self.max_replicas, self.cpu_count)
+        if self.memory_budget_mb is not None:
+            if not self.replica_footprint_mb:
+                # 测不出占用时不冒险
+                return 1
+            replicas = min(replicas, int(self.memory_budget_mb // self.replica_footprint_mb))
+
+        return max(1, replicas)
+
+    def _threads_per_replica(self, replicas: int) -> Optional[int]:
+        if replicas <= 1:
+            return None
+        return max(1, self.cpu_count // replicas)
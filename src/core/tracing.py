@@ -0,0 +1,117 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class Span:
+    """一个计时区间，children 是它内部的子阶段"""
+
+    __slots__ = ("name", "start", "end", "children")
+
+    def __init__(self, name: str, start: float, end: Optional[float] = None):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.children: List["Span"] = []
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        node: Dict[str, Any] = {"name": self.name, "duration_ms": round(self.duration_ms, 3)}
+        if self.children:
+            node["children"] = [child.to_dict() for child in self.children]
+        return node
+
+
+class JobTrace:
+    """
+    单个任务的阶段耗时树 (按 TranscriptionJob.uid 区分)。
+    上传/解码在事件循环里记录，推理阶段在 worker 线程里记录；
+    同一个任务的阶段是先后发生的，所以不需要更复杂的并发控制，只用一把锁保护栈。
+    """
+
+    def __init__(self, uid: str):
+        self.uid = uid
+        self.root = Span("job", time.perf_counter())
+        self._stack: List[Span] = [self.root]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[Span]:
+        with self._lock:
+            span = Span(name, time.perf_counter())
+            self._stack[-1].children.append(span)
+            self._stack.append(span)
+        try:
+            yield span
+        finally:
+            with self._lock:
+                span.end = time.perf_counter()
+                self._stack.remove(span)
+
+    def add_span(self, name: str, duration_s: float):
+        """补记一个已经结束的阶段 (例如排队等待、整批推理分摊)"""
+        end = time.perf_counter()
+        with self._lock:
+            self._stack[-1].children.append(Span(name, end - duration_s, end))
+
+    def finish(self):
+        if self.root.end is None:
+            self.root.end = time.perf_counter()
+
+    def stage_totals(self) -> Dict[str, float]:
+        """同名阶段的耗时合计 (毫秒)，例如所有分段的 asr 加在一起"""
+        totals: Dict[str, float] = {}
+
+        def walk(span: Span):
+            for child in span.children:
+                totals[child.name] = totals.get(child.name, 0.0) + child.duration_ms
+                walk(child)
+
+        walk(self.root)
+        return {name: round(ms, 3) for name, ms in totals.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """对外的 timings 字段：总耗时 + 各阶段合计 + 完整的阶段树"""
+        return {
+            "total_ms": round(self.root.duration_ms, 3),
+            "stages": self.stage_totals(),
+            "spans": [child.to_dict() for child in self.root.children],
+        }
+
+    def collapsed_stacks(self) -> List[str]:
+        """
+        折叠栈格式 ("job;inference;asr 1234"，单位微秒，只计自身耗时)，
+        与 py-spy record --format raw 的输出相同，可以直接喂给 flamegraph.pl / speedscope。
+        """
+        lines: Dict[str, int] = {}
+
+        def walk(span: Span, prefix: str):
+            path = f"{prefix};{span.name}" if prefix else span.name
+            self_ms = span.duration_ms - sum(child.duration_ms for child in span.children)
+            lines[path] = lines.get(path, 0) + max(round(self_ms * 1000), 0)
+            for child in span.children:
+                walk(child, path)
+
+        walk(self.root, "")
+        return [f"{path} {micros}" for path, micros in lines.items()]
+
+
+# 当前正在处理的任务。run_in_threadpool 会复制 contextvars，所以 Engine 在 worker 线程里也能拿到
+current_trace: ContextVar[Optional[JobTrace]] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """记录一个处理阶段；当前没有任务在追踪时什么都不做"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
@@ -1,18 +1,131 @@
+import asyncio
+import os
+import tempfile
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 # 引入我们生成的所有组件
 from src.core.engine import SenseVoiceEngine
+from src.core.backends import QuantizedSenseVoiceEngine
+from src.core.pool import EnginePool
+from src.core.fanout import ChunkFanout
 from src.services.transcription import TranscriptionService
+from src.services.cache import TranscriptionCache
+from src.services.profiling import ProfileSampler
+from src.services.decoding import DecodePool
+from src.services.journal import JobJournal
+from src.services.uploads import UploadSpool
+from src.services.watchdog import MemoryWatchdog
+from src.services.registry import ModelRegistry, ModelSpec
+from src.api.middleware import UploadLimitMiddleware, MULTIPART_OVERHEAD_BYTES
 from src.api.routes import router as api_router
 
 # === 全局配置 ===
 # 可以从环境变量读取，这里硬编码作为 MVP
 MODEL_ID = "iic/SenseVoiceSmall"
+# 默认模型的推理后端："torch" (FunASR 原生 fp32，MPS/CUDA/CPU)；纯 CPU 节点可选
+# "int8" (PyTorch 动态 int8 量化) 或 "onnx" (onnxruntime，需要 pip install funasr-onnx onnxruntime)
+# 两个量化后端强制跑在 CPU 上，切换前先用 python -m benchmarks.backends 在自己的测试集上对比延迟和 CER
+ENGINE_BACKEND = "torch"
+# 多模型：请求里的 model 字段按名字路由到 MODELS 中的模型 (同一套 API，每个模型一个独立的队列和 worker)
+# DEFAULT_MODEL 随服务启动加载 (不填 model 时使用)；其余模型第一次被请求时才加载，期间请求在它自己的队列里排队
+# 常驻模型合计超过 MODEL_MEMORY_BUDGET_MB 时，先卸载最久没用过的空闲模型 (再次请求时重新加载)；None 表示不限制
+# footprint_mb 为 None 时加载后实测。MODEL_ALIASES 让 OpenAI SDK 默认的 whisper-1 落到默认模型
+# 任务持久化 (JOB_STORE_PATH) 和长音频并行 (LONG_AUDIO_WORKERS) 只作用于默认模型
+DEFAULT_MODEL = "sensevoice-small"
+MODELS = {
+    "sensevoice-small": ModelSpec(model_id=MODEL_ID, backend=ENGINE_BACKEND),
+    "paraformer-zh": ModelSpec(model_id="paraformer-zh"),
+    "paraformer-zh-nopunc": ModelSpec(model_id="paraformer-zh", punc_model=None),
+}
+MODEL_ALIASES = {"whisper-1": DEFAULT_MODEL}
+MODEL_MEMORY_BUDGET_MB = None
 HOST = "0.0.0.0"
 PORT = 50070  # 你的幸运端口
+MAX_QUEUE_SIZE = 50
+# 调度策略："sjf" = 按估算音频时长的最短作业优先 (带老化，长任务不会饿死)；"fifo" = 先来先服务
+# SJF_AGING_RATE: 每排队 1 秒，优先级提升多少秒音频
+SCHEDULING = "sjf"
+SJF_AGING_RATE = 5.0
+# 动态微批：MAX_BATCH_SIZE=1 表示关闭 (严格逐个串行)
+# 调大后 worker 会在 MAX_BATCH_WAIT_MS 内凑批，一批音频总时长不超过 MAX_BATCH_AUDIO_S
+MAX_BATCH_SIZE = 1
+MAX_BATCH_WAIT_MS = 5
+MAX_BATCH_AUDIO_S = 60
+# 结果缓存：相同音频 + 相同参数直接返回
+# CACHE_SQLITE_PATH 设为文件路径即可开启磁盘层 (重启后依然有效)
+CACHE_MAX_ENTRIES = 256
+CACHE_TTL_S = 3600
+CACHE_SQLITE_PATH = None
+# 引擎副本池：默认 1 个副本 (ADR-001 单例串行)
+# 仅 CPU 推理时可调大；实际副本数 = min(MAX_REPLICAS, CPU 核数, MEMORY_BUDGET_MB / 单副本占用)
+# REPLICA_FOOTPRINT_MB 为 None 时，加载第一个副本时实测
+MAX_REPLICAS = 1
+MEMORY_BUDGET_MB = None
+REPLICA_FOOTPRINT_MB = None
+# 预热：加载后按这些音频时长 (秒) 各跑两遍完整流水线，结果见 /readyz 的 warmup 字段；() 表示不预热
+WARMUP_BUCKETS_S = (1, 10, 60)
+# 短语音快速通道：不超过 FAST_PATH_MAX_S 秒的音频跳过 VAD，改走 FAST_PATH_PIPELINE ("asr_punc" 或 "asr")；0 表示关闭
+# 请求里的 pipeline 参数可以覆盖自动选择
+FAST_PATH_MAX_S = 5.0
+FAST_PATH_PIPELINE = "asr_punc"
+# 请求指定 asr / asr_punc 时，只对不超过 MAX_VADLESS_S 秒的音频生效 (整段一次前向，长音频会撑爆内存)，更长的仍走 full
+MAX_VADLESS_S = 30.0
+# 解码进程池：DECODE_WORKERS > 0 时上传只落盘，由独立进程在推理前把音频解码成 16kHz float32 (与推理重叠)，
+# 已解码待推理的音频总时长不超过 DECODE_PREFETCH_AUDIO_S 秒；0 表示关闭 (上传时在线程池里内存解码)
+DECODE_WORKERS = 0
+DECODE_PREFETCH_AUDIO_S = 600
+# 关闭解码进程池时，排队中已经在内存里解码好的音频总时长上限 (秒，48kHz 时约 110MB)；
+# 超出后新任务只保留落盘文件，推理时再由引擎读取，排队再多也不会撑爆内存
+MAX_DECODED_QUEUE_S = 600
+# 截止时间准入：同步请求默认最多等待 DEFAULT_DEADLINE_S 秒 (客户端可用 deadline_s 覆盖)，
+# 按 排队音频时长 x 实测实时率 估算赶不上的请求直接 503 + Retry-After，排队超时的任务不再推理；None 表示关闭
+DEFAULT_DEADLINE_S = 300
+# 异步任务 (/v1/jobs)：结束的任务保留 JOB_TTL_S 秒供取结果，最多保留 MAX_RETAINED_JOBS 个
+JOB_TTL_S = 3600
+MAX_RETAINED_JOBS = 1000
+# webhook 回调：用 WEBHOOK_WORKERS 个专用线程投递 (不占用推理线程池)；
+# WEBHOOK_ALLOWED_HOSTS 为 None 时只允许公网地址 (拒绝回环/内网/链路本地，防 SSRF)，
+# 设为 ["hooks.example.com", ".internal.example.com"] 等则只允许这些主机 (可以是内网)
+WEBHOOK_WORKERS = 4
+WEBHOOK_ALLOWED_HOSTS = None
+# 任务持久化：JOB_STORE_PATH 设为 SQLite 文件路径即可开启，异步任务的音频落到 JOB_SPOOL_DIR，
+# 重启后没处理完的任务自动继续，已完成的结果依然可以查询
+JOB_STORE_PATH = None
+JOB_SPOOL_DIR = "spool"
+# 停机时最多等待多久让队列里的任务处理完 (持久化的任务没处理完也不会丢)
+DRAIN_TIMEOUT_S = 30
+# 长音频并行：时长不少于 LONG_AUDIO_MIN_S 秒的音频只在 worker 里跑一次 VAD，
+# 各语音段分发给 LONG_AUDIO_WORKERS 个 CPU 子进程 (每个进程一份模型，平分 CPU 核) 并行识别，再按顺序拼接
+# 0 表示关闭。注意内存：每个子进程都要加载一份完整模型
+LONG_AUDIO_WORKERS = 0
+LONG_AUDIO_MIN_S = 300
+# 上传落盘：上传内容分块写进 UPLOAD_SPOOL_DIR (有 /dev/shm 时用 tmpfs，不碰磁盘)，
+# 单个文件最大 MAX_UPLOAD_MB，音频最长 MAX_AUDIO_DURATION_S 秒，超限返回 413
+# 进程崩溃留下的文件在下次启动时清理
+UPLOAD_SPOOL_DIR = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "sensevoice-uploads")
+MAX_UPLOAD_MB = 500
+MAX_AUDIO_DURATION_S = 6 * 3600
+# 内存看门狗：每 WATCHDOG_INTERVAL_S 秒采样一次进程 RSS 和 MPS/CUDA 分配器占用
+# 空闲超过 IDLE_UNLOAD_S 秒卸载模型，下一个请求到来时再加载 (这个请求会多等一次加载)；None 表示常驻
+# RSS 超过 MEMORY_HIGH_WATERMARK_MB 时把 batch_size_s / merge_length_s 减半，回落后恢复；None 表示不调整
+IDLE_UNLOAD_S = 1800
+MEMORY_HIGH_WATERMARK_MB = None
+WATCHDOG_INTERVAL_S = 10
+# 抽样剖析：按比例抽取请求，在 PROFILE_DIR 下输出 <uid>.prof (cProfile) 和 <uid>.folded (火焰图折叠栈)
+# 0 表示关闭；各阶段耗时 (timings) 不受影响，始终记录
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_DIR = "profiles"
+# 模型在后台加载，端口立即开始监听
+# QUEUE_WHILE_LOADING=True: 加载期间的请求先排队 (受 MAX_QUEUE_SIZE 约束)；False: 直接 503 + Retry-After
+QUEUE_WHILE_LOADING = True
+RETRY_AFTER_S = 5
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -22,31 +135,153 @@ async def lifespan(app: FastAPI):
     """
     print("🌱 System starting up...")
     
-    # 1. 初始化并加载引擎 (The Engine)
-    # 这会触发模型下载和 MPS 预热
-    engine = SenseVoiceEngine(model_id=MODEL_ID)
-    engine.load()
-    
-    # 2. 初始化并启动服务 (The Service)
-    # 此时队列建立，由于还未收到请求，队列为空
-    service = TranscriptionService(engine=engine, max_queue_size=50)
-    
-    # 3. 启动后台消费者 (The Worker)
-    # 这是一个死循环协程，必须用 create_task 扔到后台跑
-    await service.start_worker()
+    # 1. 初始化服务 (The Service)
+    # 队列立即建立；此时还没有引擎，请求先排队，模型加载完成后 worker 再开始消费
+    cache = TranscriptionCache(
+        max_entries=CACHE_MAX_ENTRIES,
+        ttl_s=CACHE_TTL_S,
+        sqlite_path=CACHE_SQLITE_PATH,
+    )
+    journal = JobJournal(JOB_STORE_PATH, JOB_SPOOL_DIR) if JOB_STORE_PATH else None
+    decode_pool = DecodePool(DECODE_WORKERS, DECODE_PREFETCH_AUDIO_S) if DECODE_WORKERS > 0 else None
+    if decode_pool is not None:
+        decode_pool.start()
+    uploads = UploadSpool(UPLOAD_SPOOL_DIR, max_bytes=MAX_UPLOAD_MB * 1024 * 1024)
+
+    def create_service(name: str, spec: ModelSpec, **kwargs) -> TranscriptionService:
+        return TranscriptionService(
+            engine=None,
+            # 缓存 key 用模型名：同一份权重搭配不同的 VAD/标点，输出也不同
+            model_id=name,
+            max_queue_size=MAX_QUEUE_SIZE,
+            scheduling=SCHEDULING,
+            sjf_aging_rate=SJF_AGING_RATE,
+            max_batch_size=MAX_BATCH_SIZE,
+            max_batch_wait_ms=MAX_BATCH_WAIT_MS,
+            max_batch_audio_s=MAX_BATCH_AUDIO_S,
+            cache=cache,
+            profiler=ProfileSampler(PROFILE_DIR, PROFILE_SAMPLE_RATE) if PROFILE_SAMPLE_RATE > 0 else None,
+            fast_path_max_s=FAST_PATH_MAX_S,
+            fast_path_pipeline=FAST_PATH_PIPELINE,
+            max_vadless_s=MAX_VADLESS_S,
+            queue_while_loading=QUEUE_WHILE_LOADING,
+            retry_after_s=RETRY_AFTER_S,
+            long_audio_min_s=LONG_AUDIO_MIN_S,
+            decode_pool=decode_pool,
+            max_decoded_queue_s=MAX_DECODED_QUEUE_S,
+            job_ttl_s=JOB_TTL_S,
+            max_retained_jobs=MAX_RETAINED_JOBS,
+            webhook_workers=WEBHOOK_WORKERS,
+            webhook_allowed_hosts=WEBHOOK_ALLOWED_HOSTS,
+            upload_spool=uploads,
+            max_audio_duration_s=MAX_AUDIO_DURATION_S,
+            default_deadline_s=DEFAULT_DEADLINE_S,
+            metric_labels={"model": name},
+            **kwargs,
+        )
+
+    # 2. 引擎池 (The Engine)
+    # 会触发模型下载和 MPS 预热；多副本时按内存预算加载 K 个
+    def create_pool(spec: ModelSpec) -> EnginePool:
+        return EnginePool(
+            engine_factory=lambda threads: _create_engine(spec, threads),
+            max_replicas=MAX_REPLICAS,
+            memory_budget_mb=MEMORY_BUDGET_MB,
+            replica_footprint_mb=REPLICA_FOOTPRINT_MB,
+        )
+
+    registry = ModelRegistry(
+        MODELS,
+        DEFAULT_MODEL,
+        service_factory=create_service,
+        pool_factory=create_pool,
+        memory_budget_mb=MODEL_MEMORY_BUDGET_MB,
+        aliases=MODEL_ALIASES,
+    )
+    default_spec = MODELS[DEFAULT_MODEL]
+    pool = create_pool(default_spec)
+    service = registry.add(
+        DEFAULT_MODEL,
+        create_service(
+            DEFAULT_MODEL,
+            default_spec,
+            fanout=ChunkFanout(default_spec.model_id, LONG_AUDIO_WORKERS) if LONG_AUDIO_WORKERS > 0 else None,
+            journal=journal,
+        ),
+        pool,
+    )
+    if journal is not None:
+        # 上次没处理完的任务重新排队，模型加载完成后照常处理
+        await service.recover_jobs()
     
-    # 4. 依赖注入 (Dependency Injection)
-    # 把 service 挂到 app.state 上，让路由层可以用
+    # 3. 依赖注入 (Dependency Injection)
+    # 把 registry 和默认模型的 service 挂到 app.state 上，让路由层可以用
+    app.state.registry = registry
     app.state.service = service
+    app.state.pool = pool
+    app.state.readiness = {"status": "loading", "started_at": time.time(), "ready_at": None, "error": None}
+    app.state.watchdog = MemoryWatchdog(
+        service,
+        idle_unload_s=IDLE_UNLOAD_S,
+        high_watermark_mb=MEMORY_HIGH_WATERMARK_MB,
+        interval_s=WATCHDOG_INTERVAL_S,
+        registry=registry,
+    )
+
+    # 4. 后台加载默认模型，加载完成后启动消费者 (The Worker)
+    app.state.loader = asyncio.create_task(_load_in_background(app))
     
-    print("✅ System ready! Listening for requests...")
+    print("✅ Listening for requests (model loading in background)...")
     
     yield  # --- 服务运行中 ---
     
     print("🛑 System shutting down...")
     # 可以在这里做清理工作，比如等待队列清空 (Graceful Shutdown)
     if hasattr(app.state, "service"):
-        app.state.service.engine.release()
+        # 先停止接收新任务，把各模型队列里的任务做完 (有超时)，再停 worker、释放模型
+        await app.state.registry.drain(DRAIN_TIMEOUT_S)
+        # 加载线程无法中断：已经在加载的副本会加载完，随后和其他副本一起释放
+        app.state.loader.cancel()
+        await asyncio.gather(app.state.loader, return_exceptions=True)
+        await app.state.watchdog.stop()
+        await app.state.registry.stop()
+        # 以下资源各模型共用，只关一次
+        if app.state.service.decode_pool is not None:
+            app.state.service.decode_pool.shutdown()
+        if app.state.service.cache is not None:
+            app.state.service.cache.close()
+        if app.state.service.journal is not None:
+            app.state.service.journal.close()
+
+
+def _create_engine(spec: ModelSpec, threads: Optional[int]) -> SenseVoiceEngine:
+    """按模型配置创建 (未加载的) 引擎：torch 后端为 SenseVoiceEngine，int8 / onnx 为 QuantizedSenseVoiceEngine"""
+    kwargs = dict(
+        model_id=spec.model_id,
+        vad_model=spec.vad_model,
+        punc_model=spec.punc_model,
+        num_threads=threads,
+        warmup_buckets_s=WARMUP_BUCKETS_S,
+    )
+    if spec.backend == "torch":
+        return SenseVoiceEngine(**kwargs)
+    return QuantizedSenseVoiceEngine(backend=spec.backend, **kwargs)
+
+
+async def _load_in_background(app: FastAPI):
+    """加载默认模型 (引擎池加载放在线程池)，完成后启动看门狗、标记就绪"""
+    readiness = app.state.readiness
+    try:
+        await app.state.registry.load(DEFAULT_MODEL)
+    except RuntimeError as e:
+        readiness["status"] = "failed"
+        readiness["error"] = str(e)
+        return
+
+    app.state.watchdog.start()
+    readiness["status"] = "ready"
+    readiness["ready_at"] = time.time()
+    print(f"✅ System ready in {readiness['ready_at'] - readiness['started_at']:.1f}s!")
 
 # === 初始化 FastAPI ===
 app = FastAPI(
@@ -64,13 +299,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求体大小上限：超大的上传在读完之前就拒绝
+app.add_middleware(UploadLimitMiddleware, max_body_bytes=MAX_UPLOAD_MB * 1024 * 1024 + MULTIPART_OVERHEAD_BYTES)
+
 # 注册路由
 app.include_router(api_router)
 
+# === 探针 ===
+# /livez: 进程活着就返回 200 (加载中也是)，编排系统据此决定是否重启
+@app.get("/livez")
+async def livez():
+    return {"status": "alive"}
+
+# /readyz: 模型加载完成才返回 200，否则 503 并附带加载进度，编排系统据此决定是否导流量
+@app.get("/readyz")
+async def readyz(request: Request):
+    readiness = request.app.state.readiness
+    now = readiness["ready_at"] or time.time()
+    body = {
+        "status": readiness["status"],
+        "model": MODEL_ID,
+        "elapsed_s": round(now - readiness["started_at"], 3),
+        "queue_depth": request.app.state.service.queue_depth(),
+        **request.app.state.pool.progress(),
+    }
+    if readiness["error"]:
+        body["error"] = readiness["error"]
+    return JSONResponse(body, status_code=200 if readiness["status"] == "ready" else 503)
+
 # 简单的健康检查
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy", "model": MODEL_ID}
+async def health_check(request: Request):
+    health = {"status": "healthy", "model": MODEL_ID}
+    service = getattr(request.app.state, "service", None)
+    if service is not None:
+        health["ready"] = service.ready
+        health["model_loaded"] = service.models_loaded()
+        # 各模型的加载状态和队列统计
+        health["models"] = request.app.state.registry.status()
+    if service is not None and service.cache is not None:
+        health["cache"] = service.cache.stats()
+    return health
+
+# Prometheus 抓取入口：队列深度/容量、排队与推理耗时、实时率、拒绝数、按语言和格式的成功/失败数 (按 model 标签区分各模型)
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    registry = request.app.state.registry
+    return PlainTextResponse(registry.render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 if __name__ == "__main__":
     # 开发模式启动
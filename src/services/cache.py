@@ -0,0 +1,139 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class TranscriptionCache:
+    """
+    内容寻址的转录结果缓存。
+    Key = 音频字节的哈希 + 影响输出的参数 (language, use_itn, clean_tags, model id)。
+
+    两级存储：
+    1. 内存 LRU (必选)：按条目数和 TTL 淘汰
+    2. SQLite (可选)：进程重启后依然有效
+
+    注意：get/put 可能触发磁盘 IO，Service 层应通过线程池调用。
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_s: Optional[float] = 3600.0, sqlite_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.sqlite_path = sqlite_path
+
+        # OrderedDict 天然就是 LRU：命中时 move_to_end，满了从头部淘汰
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # 线程池里会并发调用，内存表和 SQLite 连接都要加锁
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transcription_cache ("
+                "key TEXT PRIMARY KEY, created_at REAL NOT NULL, result TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+        print(f"🗄️ Cache initialized. Max entries: {max_entries}, TTL: {ttl_s}s, SQLite: {sqlite_path or 'off'}")
+
+    @staticmethod
+    def make_key(data: bytes, params: Dict[str, Any], model_id: str) -> str:
+        """计算缓存 key：音频内容哈希 + 输出相关参数"""
+        return TranscriptionCache.key_for_digest(hashlib.sha256(data).hexdigest(), params, model_id)
+
+    @staticmethod
+    def key_for_digest(digest: str, params: Dict[str, Any], model_id: str) -> str:
+        """已经算好内容哈希 (例如上传时边读边算) 时直接拼 key"""
+        options = "|".join([
+            str(model_id),
+            str(params.get("language", "auto")),
+            str(params.get("use_itn", True)),
+            str(params.get("clean_tags", True)),
+            str(params.get("response_format", "json")),
+            str(params.get("pipeline")),
+        ])
+        return f"{digest}:{options}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查询缓存，未命中或已过期返回 None"""
+        now = time.time()
+        with self._lock:
+            # 1. 内存层
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, result = entry
+                if not self._is_expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return dict(result)
+                del self._memory[key]
+
+            # 2. SQLite 层
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created_at, result FROM transcription_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._is_expired(row[0], now):
+                    result = json.loads(row[1])
+                    # 提升到内存层，下次直接命中
+                    self._put_memory(key, row[0], result)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return dict(result)
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """写入缓存 (两级同时写)"""
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, now, dict(result))
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO transcription_cache (key, created_at, result) VALUES (?, ?, ?)",
+                    (key, now, json.dumps(result, ensure_ascii=False)),
+                )
+                # 顺手清理过期条目，防止数据库无限增长
+                if self.ttl_s is not None:
+                    self._db.execute(
+                        "DELETE FROM transcription_cache WHERE created_at < ?", (now - self.ttl_s,)
+                    )
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计，供 /health 展示"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _put_memory(self, key: str, created_at: float, result: Dict[str, Any]):
+        self._memory[key] = (created_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_s is not None and now - created_at > self.ttl_s
@@ -0,0 +1,52 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.adapters.audio import decode_file
+from src.core.engine import MODEL_SAMPLE_RATE
+
+
+class DecodePool:
+    """
+    音频解码进程池。
+    把排队任务的音频文件解码成 16kHz 单声道 float32，和推理重叠执行：
+    ffmpeg / libsndfile 解码时模型不再空等，引擎拿到的都是可以直接用的采样缓冲区。
+
+    prefetch_audio_s 是已解码、尚未推理完的音频总时长上限 (秒)，
+    由 TranscriptionService 的预取阶段遵守，用来限制常驻内存 (float32 16kHz 约 230MB/小时)。
+    """
+
+    def __init__(self, workers: int = 2, prefetch_audio_s: float = 600.0, start_method: str = "spawn"):
+        """
+        Args:
+            workers: 解码子进程数
+            prefetch_audio_s: 预取 (已解码待推理) 音频的总时长上限
+            start_method: multiprocessing 启动方式
+        """
+        self.workers = max(1, workers)
+        self.prefetch_audio_s = prefetch_audio_s
+        self.start_method = start_method
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+            )
+            print(f"🎧 Decode pool started with {self.workers} process(es), prefetch budget {self.prefetch_audio_s:g}s.")
+
+    async def decode(self, file_path: str) -> Tuple[np.ndarray, int]:
+        """在子进程里解码文件，返回 (samples, sample_rate)"""
+        if self._executor is None:
+            raise RuntimeError("Decode pool not started! Call decode_pool.start() first.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, decode_file, file_path, MODEL_SAMPLE_RATE)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
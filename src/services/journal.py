@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class JobJournal:
+    """
+    异步任务 (/v1/jobs) 的持久化记录，让排队中的任务在进程重启后继续处理。
+
+    - 上传的音频文件移到 spool_dir/<uid><ext> (受管目录，任务结束才删除)
+    - 任务参数、状态、结果记在 SQLite 里
+    调度依然由内存队列负责，这里只是它的预写日志：入队前先写日志，结束后更新状态；
+    启动时把没有结束的任务重新入队，已结束的任务恢复成可查询的结果。
+
+    注意：所有方法都可能触发磁盘 IO，Service 层应通过线程池调用。
+    """
+
+    def __init__(self, sqlite_path: str, spool_dir: str):
+        self.sqlite_path = sqlite_path
+        self.spool_dir = os.path.abspath(spool_dir)
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "uid TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, spool_path TEXT, "
+            "audio_duration REAL, received_at REAL NOT NULL, webhook_url TEXT, "
+            "result TEXT, error TEXT, finished_at REAL)"
+        )
+        self._db.commit()
+        print(f"📒 Job journal at {sqlite_path}, spool dir {self.spool_dir}")
+
+    def spool(self, uid: str, source_path: str) -> str:
+        """把已经落盘的上传文件移进受管目录 (同一文件系统时只是改名)，刷盘后返回新路径"""
+        path = os.path.join(self.spool_dir, f"{uid}{os.path.splitext(source_path)[1] or '.wav'}")
+        shutil.move(source_path, path)
+        with open(path, "rb") as spool_file:
+            os.fsync(spool_file.fileno())
+        return path
+
+    def add(
+        self,
+        uid: str,
+        params: Dict[str, Any],
+        spool_path: str,
+        audio_duration: Optional[float],
+        received_at: float,
+        webhook_url: Optional[str] = None,
+    ):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (uid, status, params, spool_path, audio_duration, received_at, webhook_url) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (uid, json.dumps(params, ensure_ascii=False), spool_path, audio_duration, received_at, webhook_url),
+            )
+            self._db.commit()
+
+    def finish(self, uid: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        """记录结束状态 (succeeded / failed / cancelled)，删除音频"""
+        with self._lock:
+            row = self._db.execute("SELECT spool_path FROM jobs WHERE uid = ?", (uid,)).fetchone()
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE uid = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(), uid),
+            )
+            self._db.commit()
+
+        if row is not None and row[0] and os.path.exists(row[0]):
+            os.remove(row[0])
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """没有结束的任务，按提交顺序"""
+        return self._rows("status = 'queued' ORDER BY received_at")
+
+    def finished(self) -> List[Dict[str, Any]]:
+        return self._rows("status != 'queued' ORDER BY finished_at")
+
+    def remove(self, *uids: str):
+        """删除任务记录 (可以一次删多个，只提交一次)"""
+        with self._lock:
+            self._db.executemany("DELETE FROM jobs WHERE uid = ?", [(uid,) for uid in uids])
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _rows(self, condition: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            cursor = self._db.execute(
+                "SELECT uid, status, params, spool_path, audio_duration, received_at, webhook_url, result, error, finished_at "
+                f"FROM jobs WHERE {condition}"
+            )
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        for row in rows:
+            row["params"] = json.loads(row["params"])
+            row["result"] = json.loads(row["result"]) if row["result"] is not None else None
+        return rows
@@ -0,0 +1,172 @@
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 直方图的桶 (秒)。覆盖从短语音指令到小时级录音
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+AUDIO_DURATION_BUCKETS = (1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+# 实时率 (推理耗时 / 音频时长)：< 1 表示比实时快
+RTF_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)   # 各桶 (非累积) 计数，渲染时再累加
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class ServiceMetrics:
+    """
+    服务指标的收集与渲染 (Prometheus text exposition format 0.0.4)。
+    只有计数器、仪表盘和直方图三种类型，手写实现，不引入 prometheus_client 依赖。
+    所有方法线程安全：worker 线程和事件循环都可以直接调用。
+    """
+
+    def __init__(self, namespace: str = "sensevoice", const_labels: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            namespace: 指标名前缀
+            const_labels: 渲染时附加到每条序列上的固定标签 (例如多模型时的 model)，不影响 get 的查询
+        """
+        self.namespace = namespace
+        self.const_labels = self._labels(const_labels or {})
+        self._lock = threading.Lock()
+        # name -> (type, help)
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+
+    # === 注册 ===
+    def counter(self, name: str, help_text: str):
+        self._register(name, "counter", help_text)
+        self._counters.setdefault(name, {})
+
+    def gauge(self, name: str, help_text: str):
+        self._register(name, "gauge", help_text)
+        self._gauges.setdefault(name, {})
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float]):
+        self._register(name, "histogram", help_text)
+        self._histograms.setdefault(name, {})
+        self._buckets[name] = buckets
+
+    def _register(self, name: str, kind: str, help_text: str):
+        registered = self._meta.get(name)
+        if registered is not None and registered[0] != kind:
+            raise ValueError(f"Metric {name} already registered as {registered[0]}")
+        self._meta[name] = (kind, help_text)
+
+    # === 记录 ===
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: str):
+        with self._lock:
+            self._gauges[name][self._labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = self._labels(labels)
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets[name])
+            histogram.observe(value)
+
+    def get(self, name: str, **labels: str) -> Optional[float]:
+        """读取计数器/仪表盘的当前值 (主要给测试和 /health 用)"""
+        key = self._labels(labels)
+        with self._lock:
+            for store in (self._counters, self._gauges):
+                if name in store:
+                    return store[name].get(key)
+        return None
+
+    # === 渲染 ===
+    def render(self) -> str:
+        return render_all([self])
+
+    def _render_series(self, name: str, kind: str) -> List[str]:
+        full_name = f"{self.namespace}_{name}"
+        lines: List[str] = []
+        with self._lock:
+            if kind == "histogram":
+                for labels, histogram in self._histograms[name].items():
+                    lines.extend(self._render_histogram(full_name, self.const_labels + labels, histogram))
+            else:
+                store = self._counters if kind == "counter" else self._gauges
+                for labels, value in store[name].items():
+                    lines.append(f"{full_name}{self._format_labels(self.const_labels + labels)} {self._format_value(value)}")
+        return lines
+
+    def _render_histogram(self, full_name: str, labels: Labels, histogram: _Histogram) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            bucket_labels = labels + (("le", self._format_value(bound)),)
+            lines.append(f"{full_name}_bucket{self._format_labels(bucket_labels)} {cumulative}")
+        inf_labels = labels + (("le", "+Inf"),)
+        lines.append(f"{full_name}_bucket{self._format_labels(inf_labels)} {histogram.count}")
+        lines.append(f"{full_name}_sum{self._format_labels(labels)} {self._format_value(histogram.sum)}")
+        lines.append(f"{full_name}_count{self._format_labels(labels)} {histogram.count}")
+        return lines
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @staticmethod
+    def _format_labels(labels: Labels) -> str:
+        if not labels:
+            return ""
+        escaped = (
+            (key, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+            for key, value in labels
+        )
+        return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+    @staticmethod
+    def _format_value(value: float) -> str:
+        if float(value).is_integer():
+            return str(int(value))
+        return repr(float(value))
+
+
+def render_all(collectors: Sequence[ServiceMetrics]) -> str:
+    """
+    把多个 ServiceMetrics 渲染成一份文本 (例如每个模型一个)：
+    同名指标只输出一次 HELP/TYPE，各实例的序列靠 const_labels 区分
+    """
+    families: Dict[str, Tuple[str, str]] = {}
+    for collector in collectors:
+        with collector._lock:
+            for name, (kind, help_text) in collector._meta.items():
+                families.setdefault(f"{collector.namespace}_{name}", (kind, help_text))
+
+    lines: List[str] = []
+    for full_name, (kind, help_text) in families.items():
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        for collector in collectors:
+            name = full_name[len(collector.namespace) + 1:]
+            if full_name.startswith(f"{collector.namespace}_") and name in collector._meta:
+                lines.extend(collector._render_series(name, collector._meta[name][0]))
+
+    return "\n".join(lines) + "\n"
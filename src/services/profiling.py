@@ -0,0 +1,66 @@
+import cProfile
+import os
+import random
+import threading
+from typing import Any, Callable, Sequence, Set, Union
+
+from src.core.tracing import JobTrace
+
+
+class ProfileSampler:
+    """
+    按比例抽样请求做性能剖析 (默认关闭)。
+    对抽中的任务输出两个文件，文件名都是任务 uid：
+    - <uid>.prof: 推理调用的 cProfile 结果 (pstats 格式，snakeviz / `python -m pstats` 可读)
+    - <uid>.folded: 阶段耗时树的折叠栈 (与 py-spy --format raw 相同，可生成火焰图)
+    """
+
+    def __init__(self, output_dir: str, sample_rate: float = 0.0):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self._sampled: Set[str] = set()
+        self._lock = threading.Lock()
+        if sample_rate > 0:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def sample(self, uid: str) -> bool:
+        """决定这个任务是否剖析 (每个任务只调用一次)"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            self._sampled.add(uid)
+        return True
+
+    def is_sampled(self, uid: str) -> bool:
+        with self._lock:
+            return uid in self._sampled
+
+    def profile_call(self, uid: Union[str, Sequence[str]], func: Callable[..., Any], /, **kwargs) -> Any:
+        """
+        在 cProfile 下执行 func。必须在执行推理的那个线程里调用 (cProfile 只采集当前线程)。
+        uid 可以是多个：批量推理是一次调用服务整批任务，同一份剖析结果写给这一批里每个抽中的任务。
+        另一个剖析器已经在运行时 (多副本同时抽中) 直接执行，不剖析。
+        """
+        uids = [uid] if isinstance(uid, str) else list(uid)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return func(**kwargs)
+
+        try:
+            return func(**kwargs)
+        finally:
+            profiler.disable()
+            for each in uids:
+                profiler.dump_stats(os.path.join(self.output_dir, f"{each}.prof"))
+
+    def write_trace(self, trace: JobTrace):
+        """trace hook：把抽中任务的阶段树写成折叠栈文件"""
+        with self._lock:
+            if trace.uid not in self._sampled:
+                return
+            self._sampled.discard(trace.uid)
+
+        with open(os.path.join(self.output_dir, f"{trace.uid}.folded"), "w") as folded:
+            folded.write("\n".join(trace.collapsed_stacks()) + "\n")
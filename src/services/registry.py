@@ -0,0 +1,293 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from src.core.pool import EnginePool
+from src.services.metrics import ServiceMetrics, render_all
+from src.services.transcription import TranscriptionJob, TranscriptionService
+
+
+@dataclass
+class ModelSpec:
+    """一个可路由的模型：FunASR 模型 id + 搭配的 VAD / 标点子模型"""
+    model_id: str
+    vad_model: Optional[str] = "fsmn-vad"
+    punc_model: Optional[str] = "ct-punc"
+    backend: str = "torch"                 # 推理后端 (见 src/core/backends.py 的 ENGINE_BACKENDS)
+    footprint_mb: Optional[float] = None   # 常驻内存占用 (所有副本合计)；None 表示加载后按引擎池实测
+
+
+@dataclass
+class _ModelEntry:
+    name: str
+    spec: ModelSpec
+    service: TranscriptionService
+    pool: Optional[EnginePool] = None       # None 表示引擎已经接好，由调用方管理 (例如压测)
+    loader: Optional[asyncio.Task] = None
+    error: Optional[str] = None
+    last_used: float = field(default_factory=time.time)
+
+
+class ModelRegistry:
+    """
+    多模型注册表：请求里的 model 字段按名字路由到对应模型的 TranscriptionService。
+    1. 每个模型一个独立的 Service (队列、worker、指标)，互不排队
+    2. 模型第一次被请求时才在后台加载，加载期间请求在它自己的队列里排队
+    3. 常驻模型合计占用超过 memory_budget_mb 时，按最近使用时间 (LRU) 卸载空闲的模型；
+       被卸载的模型再次被请求时，由它的 worker 在推理前重新加载 (见 TranscriptionService._ensure_loaded)
+    """
+
+    def __init__(
+        self,
+        specs: Dict[str, ModelSpec],
+        default_model: str,
+        service_factory: Optional[Callable[[str, ModelSpec], TranscriptionService]] = None,
+        pool_factory: Optional[Callable[[ModelSpec], EnginePool]] = None,
+        memory_budget_mb: Optional[float] = None,
+        aliases: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Args:
+            specs: 模型名 -> ModelSpec
+            default_model: 请求不带 model 时使用的模型
+            service_factory: 为模型创建 (未接引擎的) Service
+            pool_factory: 为模型创建引擎池；None 表示只能通过 add 注册已经接好引擎的 Service
+            memory_budget_mb: 常驻模型合计可用的内存；None 表示不淘汰
+            aliases: 别名 -> 模型名 (例如 OpenAI SDK 默认发送的 whisper-1)
+        """
+        if default_model not in specs:
+            raise ValueError(f"Default model {default_model} is not in the registry.")
+        self.specs = dict(specs)
+        self.default_model = default_model
+        self.service_factory = service_factory
+        self.pool_factory = pool_factory
+        self.memory_budget_mb = memory_budget_mb
+        self.aliases = dict(aliases or {})
+        # OrderedDict 天然就是 LRU：每次请求 move_to_end，淘汰时从头部找
+        self._entries: "OrderedDict[str, _ModelEntry]" = OrderedDict()
+        # 腾内存预算的检查和卸载串行进行，避免两个模型同时加载时各自以为预算够用
+        self._budget_lock = asyncio.Lock()
+
+        self.metrics = ServiceMetrics()
+        self.metrics.gauge("model_resident", "1 while the model is resident (or loading / has queued work), by model.")
+        self.metrics.gauge("model_footprint_megabytes", "Resident memory of each model (configured or measured at load).")
+        self.metrics.counter("model_loads_total", "Initial loads of each model.")
+        self.metrics.counter("model_evictions_total", "Idle models unloaded to stay within the memory budget, by model.")
+        # 进程级的内存采样 (MemoryWatchdog 写入)，不属于某一个模型
+        self.metrics.gauge("process_rss_bytes", "Resident memory of the service process, sampled by the memory watchdog.")
+        self.metrics.gauge("accelerator_allocated_bytes", "Memory held by the MPS/CUDA allocator, sampled by the memory watchdog.")
+        self.metrics.counter("memory_pressure_total", "Watchdog checks that found RSS above the high watermark.")
+
+        print(
+            f"📚 Model registry initialized. Models: {', '.join(self.specs)}, default: {default_model}, "
+            f"budget: {memory_budget_mb or 'unlimited'}MB"
+        )
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.specs)
+
+    def resolve(self, name: Optional[str]) -> Optional[str]:
+        """请求里的 model 字段 -> 模型名；不填返回默认模型，不认识返回 None"""
+        if not name:
+            return self.default_model
+        name = self.aliases.get(name, name)
+        return name if name in self.specs else None
+
+    def add(self, name: str, service: TranscriptionService, pool: Optional[EnginePool] = None) -> TranscriptionService:
+        """注册一个已经创建好的 Service (例如带 journal / fanout 的默认模型)"""
+        if name not in self.specs:
+            raise ValueError(f"Model {name} is not in the registry.")
+        self._entries[name] = _ModelEntry(name, self.specs[name], service, pool)
+        return service
+
+    def get(self, name: str) -> Optional[TranscriptionService]:
+        """已经创建的 Service (不触发加载)"""
+        entry = self._entries.get(name)
+        return entry.service if entry is not None else None
+
+    def services(self) -> List[TranscriptionService]:
+        return [entry.service for entry in self._entries.values()]
+
+    def find_job(self, uid: str) -> Optional[Tuple[TranscriptionService, TranscriptionJob]]:
+        """异步任务 id 在哪个模型的 Service 里"""
+        for entry in self._entries.values():
+            job = entry.service.get_job(uid)
+            if job is not None:
+                return entry.service, job
+        return None
+
+    # === 路由 ===
+    async def acquire(self, name: str) -> TranscriptionService:
+        """
+        取出模型的 Service 供提交任务，并记一次使用 (LRU)：
+        - 从未加载：在后台开始加载，任务照常入队
+        - 被淘汰或空闲卸载过：先按预算腾出内存，worker 取到任务后重新加载
+        """
+        entry = self._entry(name)
+        entry.last_used = time.time()
+        self._entries.move_to_end(name)
+
+        if entry.pool is not None and not entry.pool.engines:
+            self._start_loading(entry)
+        elif not entry.service.models_loaded():
+            await self._make_room(entry)
+        return entry.service
+
+    async def load(self, name: str):
+        """加载模型并启动它的 worker (已经加载过则直接返回)，失败时抛出 RuntimeError"""
+        entry = self._entry(name)
+        if entry.pool is None or (entry.pool.engines and entry.service.ready):
+            return
+        if not await self._start_loading(entry):
+            raise RuntimeError(entry.error)
+
+    def _entry(self, name: str) -> _ModelEntry:
+        entry = self._entries.get(name)
+        if entry is None:
+            if self.service_factory is None:
+                raise RuntimeError(f"Model {name} is not available.")
+            spec = self.specs[name]
+            pool = self.pool_factory(spec) if self.pool_factory is not None else None
+            entry = self._entries[name] = _ModelEntry(name, spec, self.service_factory(name, spec), pool)
+        return entry
+
+    def _start_loading(self, entry: _ModelEntry) -> asyncio.Task:
+        if entry.loader is None or entry.loader.done():
+            entry.loader = asyncio.create_task(self._load(entry))
+        return entry.loader
+
+    async def _load(self, entry: _ModelEntry) -> bool:
+        """加载引擎池 (阻塞操作，放到线程池)，完成后接入 Service 并启动 worker"""
+        service, pool = entry.service, entry.pool
+        entry.error = None
+        try:
+            await self._make_room(entry)
+            print(f"📦 Loading model '{entry.name}' ({entry.spec.model_id})...")
+            await run_in_threadpool(pool.load)
+        except Exception as e:
+            print(f"❌ Model '{entry.name}' failed to load: {e}")
+            entry.error = str(e)
+            # 加载了一半的副本也释放掉，下一个请求重新加载
+            pool.release()
+            service.fail_pending(RuntimeError(f"Model failed to load: {e}"))
+            return False
+
+        if service.fanout is not None:
+            try:
+                await run_in_threadpool(service.fanout.start)
+            except Exception as e:
+                # 并行池起不来不影响服务：长音频退回单 worker 串行处理
+                print(f"⚠️ Long-audio workers failed to start, falling back to serial: {e}")
+                service.fanout.shutdown()
+                service.fanout = None
+
+        service.attach_engines(pool.engines)
+        await service.start_worker()
+        self.metrics.inc("model_loads_total", model=entry.name)
+        # 之前不知道占用的模型现在实测出来了，再核对一次预算
+        await self._make_room(entry)
+        return True
+
+    # === 内存预算 (LRU 淘汰) ===
+    def _footprint_mb(self, entry: _ModelEntry) -> Optional[float]:
+        if entry.spec.footprint_mb is not None:
+            return entry.spec.footprint_mb
+        if entry.pool is not None and entry.pool.replica_footprint_mb is not None:
+            return entry.pool.replica_footprint_mb * max(len(entry.pool.engines), 1)
+        return None
+
+    def _is_resident(self, entry: _ModelEntry) -> bool:
+        """占着 (或马上要占) 内存：已加载、正在加载，或者有任务等着它重新加载"""
+        loading = entry.loader is not None and not entry.loader.done()
+        return loading or entry.service.models_loaded() or not entry.service.is_idle()
+
+    def _used_mb(self, exclude: _ModelEntry) -> float:
+        return sum(
+            self._footprint_mb(entry) or 0.0
+            for entry in self._entries.values()
+            if entry is not exclude and self._is_resident(entry)
+        )
+
+    async def _make_room(self, target: _ModelEntry):
+        """target 即将常驻：其余常驻模型加上它超过预算时，从最久没用过的开始卸载空闲模型"""
+        if self.memory_budget_mb is None:
+            return
+
+        async with self._budget_lock:
+            needed = self._footprint_mb(target) or 0.0
+            for entry in list(self._entries.values()):
+                if self._used_mb(target) + needed <= self.memory_budget_mb:
+                    return
+                if entry is target or not entry.service.models_loaded():
+                    continue
+                if await entry.service.unload_if_idle(0):
+                    self.metrics.inc("model_evictions_total", model=entry.name)
+                    print(f"♻️ Evicted model '{entry.name}' to make room for '{target.name}'.")
+
+            used = self._used_mb(target) + needed
+            if used > self.memory_budget_mb:
+                # 正在处理任务的模型不能卸载：暂时超出预算，等它们空闲后下一次腾挪
+                print(f"⚠️ Resident models need ~{used:.0f}MB, over the {self.memory_budget_mb:g}MB budget (busy models cannot be evicted).")
+
+    # === 状态与指标 ===
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """各模型的加载状态和队列统计 (供 /health 展示)"""
+        status = {}
+        for name, spec in self.specs.items():
+            entry = self._entries.get(name)
+            if entry is None:
+                status[name] = {"model_id": spec.model_id, "state": "unloaded"}
+                continue
+
+            service = entry.service
+            if entry.loader is not None and not entry.loader.done():
+                state = "loading"
+            elif entry.error:
+                state = "failed"
+            else:
+                state = "loaded" if service.models_loaded() else "unloaded"
+            status[name] = {
+                "model_id": spec.model_id,
+                "state": state,
+                "queue_depth": service.queue_depth(),
+                "idle": service.is_idle(),
+                "footprint_mb": self._footprint_mb(entry),
+                "last_used": entry.last_used,
+            }
+            if entry.error:
+                status[name]["error"] = entry.error
+        return status
+
+    def render_metrics(self) -> str:
+        """所有模型的指标合并成一份 Prometheus 文本 (各 Service 的序列带 model 标签)"""
+        for entry in self._entries.values():
+            entry.service.refresh_metrics()
+            self.metrics.set("model_resident", 1 if self._is_resident(entry) else 0, model=entry.name)
+            footprint = self._footprint_mb(entry)
+            if footprint is not None:
+                self.metrics.set("model_footprint_megabytes", footprint, model=entry.name)
+        return render_all([self.metrics] + [entry.service.metrics for entry in self._entries.values()])
+
+    # === 停机 ===
+    async def drain(self, timeout_s: float):
+        """所有模型同时停止接收新任务，并等待各自的队列清空 (见 TranscriptionService.drain)"""
+        await asyncio.gather(*(entry.service.drain(timeout_s) for entry in self._entries.values()))
+
+    async def stop(self):
+        """停止所有模型的加载和 worker 并释放模型 (共享的缓存、解码池由调用方关闭)"""
+        entries = list(self._entries.values())
+        loaders = [entry.loader for entry in entries if entry.loader is not None]
+        for loader in loaders:
+            loader.cancel()
+        await asyncio.gather(*loaders, return_exceptions=True)
+        for entry in entries:
+            await entry.service.stop_worker()
+            if entry.pool is not None:
+                entry.pool.release()
+            if entry.service.fanout is not None:
+                entry.service.fanout.shutdown()
@@ -0,0 +1,46 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class ShortestJobFirstQueue(asyncio.Queue):
+    """
+    带老化 (Aging) 的最短作业优先队列。
+    接口与 asyncio.Queue 完全一致 (背压、task_done 等都不变)，只是出队顺序不同：
+
+        priority = 估算音频时长 + aging_rate * 入队时间
+
+    等价于"每等待 1 秒，优先级提升 aging_rate 秒音频"。由于所有任务的老化速度相同，
+    这个优先级不随时间变化，普通的堆即可实现，不需要定期重排。
+    一个时长 D 的长任务最多被后来的短任务插队 D / aging_rate 秒，不会饿死。
+    """
+
+    def __init__(self, maxsize: int = 0, aging_rate: float = 5.0, default_duration_s: float = 60.0):
+        self.aging_rate = aging_rate
+        self.default_duration_s = default_duration_s   # 时长未知的任务按这个估算
+        self._epoch = time.time()
+        super().__init__(maxsize=maxsize)
+
+    def priority(self, job) -> float:
+        duration = getattr(job, "audio_duration", None)
+        if duration is None:
+            duration = self.default_duration_s
+        received_at = getattr(job, "received_at", None) or time.time()
+        return duration + self.aging_rate * (received_at - self._epoch)
+
+    # === asyncio.Queue 的存储钩子 (与 asyncio.PriorityQueue 的做法相同) ===
+    def _init(self, maxsize):
+        self._queue = []
+        # 优先级相同时按入队顺序 (FIFO)，也避免比较 job 对象本身
+        self._counter = itertools.count()
+
+    def _put(self, item):
+        heapq.heappush(self._queue, (self.priority(item), next(self._counter), item))
+
+    def _get(self):
+        return heapq.heappop(self._queue)[-1]
+
+    def queued(self) -> list:
+        """按出队顺序列出排队中的任务 (不出队，供查询排队位置)"""
+        return [item for *_, item in sorted(self._queue)]
@@ -0,0 +1,165 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from src.core.engine import MODEL_SAMPLE_RATE
+
+SAMPLES_PER_MS = MODEL_SAMPLE_RATE // 1000
+
+
+class StreamingSession:
+    """
+    一条实时音频流的转录会话 (对应一个 WebSocket 连接)。
+    职责：
+    1. 缓存收到的 PCM 采样，并增量跑流式 VAD
+    2. 语音段结束时，把这一段送进 TranscriptionService 的队列 (依然串行推理)
+    3. 长语音段进行中时，定期对已收到的部分做一次识别，作为 partial 结果
+
+    产出的事件 (dict)：
+    - {"type": "partial", "segment_id", "start", "end", "text"}: 进行中语音段的临时结果
+    - {"type": "final", "segment_id", "start", "end", "text", "raw_text"}: 语音段结束后的最终结果
+    - {"type": "error", "segment_id", "detail"}: 某一段识别失败 (不影响后续)
+    - {"type": "done", "text"}: 流结束，所有 final 文本的拼接
+    """
+
+    def __init__(
+        self,
+        service,
+        params: Dict[str, Any],
+        partial_interval_s: float = 2.0,
+        max_lookback_s: float = 10.0,
+    ):
+        self.service = service
+        self.engine = service.engine
+        self.params = params
+        self.partial_interval_s = partial_interval_s   # 0 表示不发 partial
+        self.max_lookback_s = max_lookback_s           # 没有进行中的语音段时最多保留多少历史音频
+
+        self._vad_cache: Dict[str, Any] = {}
+        # 只保留还可能用到的音频：_buffer[0] 对应流中的第 _buffer_offset 个采样
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_offset = 0
+        self._received = 0
+
+        self._segment_start_ms: Optional[int] = None
+        self._last_partial_at = 0
+        self._next_segment_id = 0
+        self._final_texts: List[str] = []
+
+    async def feed(self, samples: np.ndarray) -> List[Dict[str, Any]]:
+        """喂入一块 16kHz 单声道 float32 音频，返回这一块触发的事件"""
+        if samples.size == 0:
+            return []
+
+        self._buffer = np.concatenate([self._buffer, samples])
+        self._received += len(samples)
+
+        # VAD 很轻，但仍然是同步计算，放进线程池避免卡住事件循环
+        endpoints = await run_in_threadpool(
+            self.engine.detect_speech_stream, samples, self._vad_cache, False
+        )
+        events = await self._handle_endpoints(endpoints)
+        events.extend(await self._maybe_partial())
+        self._trim_buffer()
+        return events
+
+    async def finish(self) -> List[Dict[str, Any]]:
+        """流结束：冲刷 VAD 状态，关闭还没结束的语音段，并返回汇总事件"""
+        # FunASR 遇到空输入会直接返回，不做 final 冲刷，所以补一小段静音
+        padding = np.zeros(10 * SAMPLES_PER_MS, dtype=np.float32)
+        self._buffer = np.concatenate([self._buffer, padding])
+        self._received += len(padding)
+
+        endpoints = await run_in_threadpool(
+            self.engine.detect_speech_stream, padding, self._vad_cache, True
+        )
+        events = await self._handle_endpoints(endpoints)
+
+        if self._segment_start_ms is not None:
+            events.append(await self._close_segment(self._segment_start_ms, self._received // SAMPLES_PER_MS))
+
+        events.append({"type": "done", "text": " ".join(self._final_texts)})
+        return events
+
+    async def _handle_endpoints(self, endpoints: List[List[int]]) -> List[Dict[str, Any]]:
+        events = []
+        for start_ms, end_ms in endpoints:
+            if start_ms != -1 and end_ms == -1:
+                # 语音段开始
+                self._segment_start_ms = start_ms
+                self._last_partial_at = self._received
+            elif end_ms != -1:
+                # 语音段结束 (start_ms == -1 表示开始点在之前的块里已经上报过)
+                start = start_ms if start_ms != -1 else self._segment_start_ms
+                if start is None:
+                    continue
+                events.append(await self._close_segment(start, end_ms))
+        return events
+
+    async def _maybe_partial(self) -> List[Dict[str, Any]]:
+        """进行中的语音段每累积 partial_interval_s 秒新音频，就识别一次"""
+        if self._segment_start_ms is None or self.partial_interval_s <= 0:
+            return []
+        if self._received - self._last_partial_at < self.partial_interval_s * MODEL_SAMPLE_RATE:
+            return []
+
+        self._last_partial_at = self._received
+        end_ms = self._received // SAMPLES_PER_MS
+        try:
+            result = await self.service.submit_array(
+                self._slice(self._segment_start_ms, end_ms), MODEL_SAMPLE_RATE, self.params
+            )
+        except Exception as e:
+            # partial 只是锦上添花，失败了等 final 即可
+            print(f"⚠️ Partial transcription failed: {e}")
+            return []
+
+        return [{
+            "type": "partial",
+            "segment_id": self._next_segment_id,
+            "start": self._segment_start_ms / 1000.0,
+            "end": end_ms / 1000.0,
+            "text": result["text"],
+        }]
+
+    async def _close_segment(self, start_ms: int, end_ms: int) -> Dict[str, Any]:
+        segment_id = self._next_segment_id
+        self._next_segment_id += 1
+        self._segment_start_ms = None
+
+        try:
+            result = await self.service.submit_array(self._slice(start_ms, end_ms), MODEL_SAMPLE_RATE, self.params)
+        except Exception as e:
+            return {"type": "error", "segment_id": segment_id, "detail": str(e)}
+
+        if result["text"]:
+            self._final_texts.append(result["text"])
+
+        return {
+            "type": "final",
+            "segment_id": segment_id,
+            "start": start_ms / 1000.0,
+            "end": end_ms / 1000.0,
+            "text": result["text"],
+            "raw_text": result.get("raw_text"),
+        }
+
+    def _slice(self, start_ms: int, end_ms: int) -> np.ndarray:
+        """按流内的绝对时间截取音频 (已经被裁掉的部分从缓冲区起点开始)"""
+        begin = max(start_ms * SAMPLES_PER_MS - self._buffer_offset, 0)
+        end = max(end_ms * SAMPLES_PER_MS - self._buffer_offset, begin)
+        return self._buffer[begin:end]
+
+    def _trim_buffer(self):
+        """丢掉不会再用到的历史音频，保证长时间的流内存有界"""
+        if self._segment_start_ms is not None:
+            keep_from = self._segment_start_ms * SAMPLES_PER_MS
+        else:
+            # VAD 上报语音起点有延迟，保留一段回看窗口
+            keep_from = self._received - int(self.max_lookback_s * MODEL_SAMPLE_RATE)
+
+        drop = keep_from - self._buffer_offset
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_offset += drop
@@ -1,25 +1,86 @@
 import asyncio
-import shutil
+import functools
+import math
 import os
+import tempfile
 import uuid
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Callable, AsyncIterator, Awaitable, Tuple
+import numpy as np
 from fastapi import UploadFile
 from starlette.concurrency import run_in_threadpool
 
 # 引入我们在上一阶段生成的组件
-from src.core.engine import SenseVoiceEngine
-from src.adapters.text import clean_sensevoice_tags
+from src.core.engine import SenseVoiceEngine, MODEL_SAMPLE_RATE
+from src.core.fanout import ChunkFanout
+from src.adapters.text import parse_sensevoice_output, parse_sensevoice_batch
+from src.adapters.audio import probe_duration, decode_audio
+from src.services.cache import TranscriptionCache
+from src.services.scheduler import ShortestJobFirstQueue
+from src.services.metrics import ServiceMetrics, LATENCY_BUCKETS, AUDIO_DURATION_BUCKETS, RTF_BUCKETS
+from src.services.profiling import ProfileSampler
+from src.services.decoding import DecodePool
+from src.services.webhooks import post_json, check_webhook_url
+from src.services.journal import JobJournal
+from src.services.uploads import UploadSpool
+from src.core.tracing import JobTrace, current_trace, stage
+
+# 指标标签只接受这些取值，防止客户端随意传参撑爆时间序列数量
+METRIC_LANGUAGES = ("auto", "zh", "en", "yue", "ja", "ko")
+METRIC_RESPONSE_FORMATS = ("json", "verbose_json", "text", "srt")
+# 还没有实测数据时，ETA 按这个实时率 (推理耗时 / 音频时长) 估算；时长未知的音频按 ETA_DEFAULT_AUDIO_S 估算
+ETA_DEFAULT_RTF = 0.05
+ETA_DEFAULT_AUDIO_S = 60.0
+# 实时率按音频时长加权：总推理耗时 / 总音频时长，每处理 RTF_HALF_LIFE_AUDIO_S 秒音频，旧数据的权重减半。
+# 默认值相当于已经观测过 RTF_PRIOR_AUDIO_S 秒音频，前几个短请求不会把估计值带偏
+RTF_HALF_LIFE_AUDIO_S = 1800.0
+RTF_PRIOR_AUDIO_S = 60.0
+# 同步请求等待结果期间，每隔多久检查一次客户端是否已经断开
+DISCONNECT_POLL_S = 1.0
+
+
+class DeadlineRejected(RuntimeError):
+    """按 ETA 估算赶不上截止时间的请求 (API 层映射成 503 + Retry-After)"""
+
+    def __init__(self, message: str, retry_after_s: int):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
 
 # 定义一个简单的任务对象，用于在队列中传递
 @dataclass
 class TranscriptionJob:
     uid: str
-    temp_file_path: str
+    temp_file_path: Optional[str]  # 内存解码成功时为 None
     params: Dict[str, Any]
     future: asyncio.Future
     received_at: float
+    audio_duration: Optional[float] = None  # 音频时长 (秒)，未知为 None
+    audio: Optional[np.ndarray] = None  # 内存中解码好的单声道 float32 采样
+    sample_rate: int = MODEL_SAMPLE_RATE
+    on_segment: Optional[Callable[[Dict[str, Any]], None]] = None  # 渐进式输出：每解码完一段回调一次
+    trace: Optional[JobTrace] = None  # 各阶段耗时
+    prefetch_cost: Optional[float] = None  # 在解码预取预算里占用的音频时长 (秒)，None 表示没有经过预取
+    decoded_cost: float = 0.0  # 入队时在内存中解码、排队期间占用的音频时长 (秒)，计入 max_decoded_queue_s
+    started_at: Optional[float] = None  # worker 开始处理的时间，None 表示还在排队
+    finished_at: Optional[float] = None  # 异步任务 (/v1/jobs) 结束的时间
+    webhook_url: Optional[str] = None  # 异步任务结束后回调的地址
+    spool_path: Optional[str] = None  # 持久化任务的音频副本 (JobJournal 管理，任务结束才删除)
+    transcribed_s: float = 0.0  # 分段推理已经完成到的位置 (秒)，中途取消时统计省下的音频时长
+    deadline: Optional[float] = None  # 截止时间 (Unix 时间戳)，出队时已经过了就不再推理
+
+    @property
+    def status(self) -> str:
+        """queued -> running -> succeeded / failed；排队中被取消为 cancelled"""
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.done():
+            return "failed" if self.future.exception() is not None else "succeeded"
+        return "queued" if self.started_at is None else "running"
 
 class TranscriptionService:
     """
@@ -27,118 +88,1394 @@ class TranscriptionService:
     职责：
     1. 管理异步队列 (Async Queue)
     2. 协调 Engine 进行串行推理
-    3. 管理临时文件的生命周期
+    3. 把上传音频分块落盘后解码，必要时直接把文件交给引擎并管理其生命周期
     """
 
-    def __init__(self, engine: SenseVoiceEngine, max_queue_size: int = 50):
+    def __init__(
+        self,
+        engine: Optional[SenseVoiceEngine],
+        max_queue_size: int = 50,
+        max_batch_size: int = 1,
+        max_batch_wait_ms: float = 0.0,
+        max_batch_audio_s: float = 60.0,
+        cache: Optional[TranscriptionCache] = None,
+        replicas: Optional[List[SenseVoiceEngine]] = None,
+        scheduling: str = "fifo",
+        sjf_aging_rate: float = 5.0,
+        profiler: Optional[ProfileSampler] = None,
+        model_id: Optional[str] = None,
+        queue_while_loading: bool = True,
+        retry_after_s: int = 5,
+        fast_path_max_s: float = 0.0,
+        fast_path_pipeline: str = "asr_punc",
+        max_vadless_s: float = 30.0,
+        fanout: Optional[ChunkFanout] = None,
+        long_audio_min_s: float = 300.0,
+        decode_pool: Optional[DecodePool] = None,
+        max_decoded_queue_s: float = 600.0,
+        job_ttl_s: float = 3600.0,
+        max_retained_jobs: int = 1000,
+        webhook_workers: int = 4,
+        webhook_allowed_hosts: Optional[List[str]] = None,
+        journal: Optional[JobJournal] = None,
+        upload_spool: Optional[UploadSpool] = None,
+        max_audio_duration_s: Optional[float] = None,
+        default_deadline_s: Optional[float] = None,
+        metric_labels: Optional[Dict[str, str]] = None,
+    ):
         self.engine = engine
+        # 引擎副本 (EnginePool 加载)：每个副本一个消费者，谁空闲谁取任务
+        # 默认只有 engine 自己，即严格串行
+        self.replicas = replicas or ([engine] if engine is not None else [])
+        self.workers: List[asyncio.Task] = []
+        # === 后台加载 ===
+        # engine 为 None 表示模型还在后台加载：请求照常入队 (受队列上限约束)，加载完成后由 attach_engines 接上 worker
+        # queue_while_loading=False 时，加载完成前的请求直接 503
+        self.ready = bool(self.replicas)
+        self.queue_while_loading = queue_while_loading
+        self.retry_after_s = retry_after_s   # 503 响应里建议客户端多久后重试
+        self.model_id = model_id or getattr(engine, "model_id", None)   # 缓存 key 用，加载前就要知道
+        # 结果缓存 (可选)：相同音频 + 相同参数直接返回，不进队列
+        self.cache = cache
         # 核心设计：使用 asyncio.Queue 实现背压 (Backpressure)
         # 如果队列满 50 个，前端会直接收到 503 错误，保护系统不崩溃
-        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        # scheduling="sjf" 时换成带老化的最短作业优先队列：短音频不用排在长录音后面
+        if scheduling == "sjf":
+            self.queue = ShortestJobFirstQueue(maxsize=max_queue_size, aging_rate=sjf_aging_rate)
+        elif scheduling == "fifo":
+            self.queue = asyncio.Queue(maxsize=max_queue_size)
+        else:
+            raise ValueError(f"Unknown scheduling policy: {scheduling}")
         self.is_running = False
-        print(f"🚦 Service initialized. Queue size: {max_queue_size}")
+        # 多模型时每个模型一个 Service，metric_labels (例如 {"model": 名字}) 区分各自的队列统计
+        self.metrics = self._create_metrics(metric_labels)
+
+        # === 阶段耗时 (Profiling Hooks) ===
+        # 每个任务结束后把它的阶段树交给所有 hook；默认只有一个：各阶段耗时写进 /metrics
+        self.trace_hooks: List[Callable[[JobTrace], None]] = [self._observe_stages]
+        # 抽样剖析 (可选)：抽中的任务额外输出 cProfile 和折叠栈文件
+        self.profiler = profiler
+        if profiler is not None:
+            self.add_trace_hook(profiler.write_trace)
+
+        # === 动态微批 (Dynamic Micro-Batching) ===
+        # max_batch_size=1 时退化为严格的逐个串行处理 (默认)
+        # 大于 1 时，worker 会一次取出多个任务交给 transcribe_batch：各任务分别跑 VAD，语音段合成尽量少的 ASR 前向
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_wait_ms = max_batch_wait_ms      # 凑批最多等待多久
+        self.max_batch_audio_s = max_batch_audio_s      # 一批音频总时长上限 (内存保护)
+
+        # === 短语音快速通道 ===
+        # 时长不超过 fast_path_max_s 的音频自动改走 fast_path_pipeline (跳过 VAD)；0 表示关闭
+        # 客户端可以通过 params["pipeline"] 显式指定
+        self.fast_path_max_s = fast_path_max_s
+        self.fast_path_pipeline = fast_path_pipeline
+        # 跳过 VAD 的流水线整段音频一次前向，激活内存随时长增长：客户端指定 asr / asr_punc 时，
+        # 只有时长已知且不超过 max(max_vadless_s, fast_path_max_s) 的音频照办，其余仍走 full
+        self.max_vadless_s = max_vadless_s
+
+        # === 长音频并行 ===
+        # 时长不少于 long_audio_min_s 的音频：本 worker 只跑 VAD，各语音段分发到 fanout 的进程池并行识别
+        # fanout 为 None 表示关闭，长音频照常由一个 worker 串行处理
+        self.fanout = fanout
+        self.long_audio_min_s = long_audio_min_s
+
+        # === 解码预取 ===
+        # 开启 decode_pool 后，上传只落盘不解码；预取阶段按调度顺序从 queue 取任务交给解码进程池，
+        # 解码好的任务进入 _ready_queue 等待推理。已解码未推理完的音频总时长不超过 decode_pool.prefetch_audio_s
+        # _ready_queue 与 queue 用同一种调度：解码完成的先后是乱序的，SJF 时按同样的优先级重新排序。
+        # 它本身不设上限，解码中和 _ready_queue 里的任务都计入 queue 的容量 (见 queue_depth)
+        # 关闭时 _ready_queue 就是 queue 本身
+        self.decode_pool = decode_pool
+        if decode_pool is None:
+            self._ready_queue: asyncio.Queue = self.queue
+        elif scheduling == "sjf":
+            self._ready_queue = ShortestJobFirstQueue(aging_rate=sjf_aging_rate)
+        else:
+            self._ready_queue = asyncio.Queue()
+        self._prefetched_s = 0.0
+        self._prefetched_jobs = 0
+        self._prefetch_cond = asyncio.Condition()
+        self._prefetcher: Optional[asyncio.Task] = None
+        self._prefetch_waiting = 0   # 预取阶段已经出队、正在等预算的任务 (0 或 1)
+        self._decode_tasks: set = set()
+        # 关闭解码进程池时，上传在入队时就在内存中解码；排队中的已解码音频总时长不超过 max_decoded_queue_s，
+        # 超出的任务只保留落盘的文件，推理时由引擎读取 (与 m4a 等内存解码不了的格式相同)，
+        # 这样 队列长度 x 最长音频 的采样缓冲区不会同时驻留在内存里
+        self.max_decoded_queue_s = max_decoded_queue_s
+        self._decoded_queue_s = 0.0
+
+        # === 异步任务 (/v1/jobs) ===
+        # 提交后立即返回任务 id，客户端轮询或等 webhook；结束的任务保留 job_ttl_s 秒供取结果，
+        # 最多保留 max_retained_jobs 个 (先结束的先清理)
+        self.jobs: "OrderedDict[str, TranscriptionJob]" = OrderedDict()
+        self.job_ttl_s = job_ttl_s
+        self.max_retained_jobs = max_retained_jobs
+        self._job_watchers: set = set()
+        # webhook 投递 (带重试和退避，单次最长几十秒) 用独立的小线程池，
+        # 不占用推理、解码共用的 anyio 线程池，挂掉的回调地址拖不垮服务；首次投递时才创建
+        # webhook_allowed_hosts 为 None 时只允许公网地址，否则只允许列表里的主机 (见 check_webhook_url)
+        self.webhook_workers = webhook_workers
+        self.webhook_allowed_hosts = webhook_allowed_hosts
+        self._webhook_executor: Optional[ThreadPoolExecutor] = None
+        # 实测实时率 (按音频时长加权)，用于估算 ETA
+        self.rtf_estimate = ETA_DEFAULT_RTF
+        self._rtf_elapsed_s = ETA_DEFAULT_RTF * RTF_PRIOR_AUDIO_S
+        self._rtf_audio_s = RTF_PRIOR_AUDIO_S
+
+        # === 持久化与优雅停机 ===
+        # journal 不为 None 时，异步任务入队前先落盘 (音频 + 参数)，重启后由 recover_jobs 继续处理
+        # drain 之后 accepting=False，新请求直接 503
+        self.journal = journal
+        self.accepting = True
+        self._requeue_task: Optional[asyncio.Task] = None
+
+        # === 上传落盘 ===
+        # 上传内容分块写进 upload_spool 的受管目录 (可以是 /dev/shm)，大小上限由它检查；
+        # 时长超过 max_audio_duration_s 的音频只读文件头就拒绝，不解码
+        self.uploads = upload_spool or UploadSpool(os.path.join(tempfile.gettempdir(), "sensevoice-uploads"))
+        self.max_audio_duration_s = max_audio_duration_s
+
+        # === 按截止时间准入 ===
+        # 有截止时间的请求 (客户端传 deadline_s，同步请求默认 default_deadline_s) 入队前估算完成时间：
+        # 排队音频时长 x 实测实时率，赶不上的直接 503，Retry-After 为积压降到能赶上所需的时间。
+        # 光自己的推理就超过客户端截止时间的，重试也没用，直接 422；默认截止时间只限制排队，不限制单个长音频。
+        # 出队时已经过了截止时间的任务不再推理。队列长度上限依然作为内存保护
+        self.default_deadline_s = default_deadline_s
+        self._running_jobs: Dict[str, TranscriptionJob] = {}
+
+        # === 空闲卸载 ===
+        # MemoryWatchdog 在空闲时通过 unload_if_idle 释放所有副本，worker 取到任务后按需重新加载；
+        # 两者都在 _engine_lock 下进行，卸载不会和推理交叉
+        self.last_activity = time.time()
+        self._engine_lock = asyncio.Lock()
+
+        print(
+            f"🚦 Service initialized. Queue size: {max_queue_size}, scheduling: {scheduling}, "
+            f"max batch size: {self.max_batch_size}, workers: {len(self.replicas)}"
+        )
+
+    def attach_engines(self, replicas: List[SenseVoiceEngine]):
+        """后台加载完成后接入引擎副本，之后调用 start_worker 开始消费积压的任务"""
+        self.engine = replicas[0]
+        self.replicas = list(replicas)
+        self.model_id = self.model_id or self.engine.model_id
+        self.ready = True
+
+    def fail_pending(self, error: Exception):
+        """模型加载失败：让所有排队中的任务立即失败，而不是永远等下去"""
+        while not self.queue.empty():
+            job = self.queue.get_nowait()
+            self._remove_job_temp_file(job)
+            self._release_decoded(job)
+            if not job.future.done():
+                job.future.set_exception(error)
+            self.queue.task_done()
 
     async def start_worker(self):
         """启动后台消费者循环 (在 main.py 的 lifespan 中调用)"""
         self.is_running = True
-        asyncio.create_task(self._consume_loop())
-        print("👷 Background worker started.")
+        self.workers = [asyncio.create_task(self._consume_loop(replica)) for replica in self.replicas]
+        if self.decode_pool is not None:
+            self._prefetcher = asyncio.create_task(self._prefetch_loop())
+        print(f"👷 {len(self.replicas)} background worker(s) started.")
+
+    async def stop_worker(self):
+        """停止所有后台消费者 (在 main.py 的 lifespan 关闭阶段调用)"""
+        self.is_running = False
+        pending = list(self.workers) + list(self._decode_tasks) + list(self._job_watchers)
+        for task in (self._prefetcher, self._requeue_task):
+            if task is not None:
+                pending.append(task)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if self._webhook_executor is not None:
+            self._webhook_executor.shutdown(wait=False, cancel_futures=True)
+            self._webhook_executor = None
+        self.workers = []
+        self._prefetcher = None
+        self._requeue_task = None
+
+    async def drain(self, timeout_s: float) -> bool:
+        """
+        优雅停机 (在 stop_worker 之前调用)：不再接收新任务，等队列里的任务处理完，最多等 timeout_s 秒。
+        超时没处理完的任务：持久化的下次启动继续处理，其余随进程退出丢弃。
+        返回是否已经清空。
+        """
+        self.accepting = False
+        if not self.workers:
+            return self.queue.empty()
+
+        try:
+            await asyncio.wait_for(self._wait_idle(), timeout_s)
+            print("✅ Queue drained.")
+            return True
+        except asyncio.TimeoutError:
+            print(f"⚠️ Queue not drained within {timeout_s:g}s, stopping anyway.")
+            return False
 
-    async def submit(self, file: UploadFile, params: Dict[str, Any]) -> Dict[str, Any]:
+    async def _wait_idle(self):
+        await self.queue.join()
+        if self._ready_queue is not self.queue:
+            while self._decode_tasks:
+                await asyncio.gather(*self._decode_tasks, return_exceptions=True)
+            await self._ready_queue.join()
+
+    @staticmethod
+    def _create_metrics(labels: Optional[Dict[str, str]] = None) -> ServiceMetrics:
+        metrics = ServiceMetrics(const_labels=labels)
+        metrics.gauge("queue_depth", "Jobs waiting in the queue.")
+        metrics.gauge("queue_capacity", "Maximum number of jobs the queue accepts before rejecting (503).")
+        metrics.gauge("workers", "Number of inference workers (engine replicas).")
+        metrics.gauge("prefetched_audio_seconds", "Decoded audio held in memory ahead of inference.")
+        metrics.gauge("model_loaded", "1 while the model replicas are resident, 0 after an idle unload.")
+        metrics.gauge("process_rss_bytes", "Resident memory of the service process, sampled by the memory watchdog.")
+        metrics.gauge("accelerator_allocated_bytes", "Memory held by the MPS/CUDA allocator, sampled by the memory watchdog.")
+        metrics.gauge("engine_batch_size_s", "Current FunASR batch_size_s (lowered under memory pressure).")
+        metrics.counter("rejected_total", "Requests rejected before inference, by reason (queue_full, deadline, deadline_unattainable, loading, shutting_down, too_large).")
+        metrics.counter("requests_total", "Finished transcription jobs by language, response format and status.")
+        metrics.counter("cache_lookups_total", "Result cache lookups by outcome.")
+        metrics.counter("model_unloads_total", "Idle unloads of the model replicas.")
+        metrics.counter("model_reloads_total", "On-demand reloads after an idle unload.")
+        metrics.counter("memory_pressure_total", "Watchdog checks that found RSS above the high watermark.")
+        metrics.counter("client_disconnects_total", "Synchronous requests whose client hung up before the result was ready.")
+        metrics.counter("skipped_jobs_total", "Cancelled or expired jobs dropped by the worker, by stage (queued, inference).")
+        metrics.counter("skipped_audio_seconds_total", "Audio seconds not transcribed because the job was cancelled or expired.")
+        metrics.histogram("queue_wait_seconds", "Time from enqueue until a worker picks the job up.", LATENCY_BUCKETS)
+        metrics.histogram("inference_seconds", "Wall time of one engine call (a single job or a whole batch).", LATENCY_BUCKETS)
+        metrics.histogram("audio_duration_seconds", "Duration of the audio of each dequeued job.", AUDIO_DURATION_BUCKETS)
+        metrics.histogram("real_time_factor", "Inference time divided by audio duration, per engine call.", RTF_BUCKETS)
+        metrics.counter("inference_seconds_total", "Total inference wall time.")
+        metrics.counter("audio_seconds_total", "Total audio duration processed by the engine.")
+        metrics.histogram("stage_seconds", "Time spent in each pipeline stage, per job.", LATENCY_BUCKETS)
+        return metrics
+
+    def add_trace_hook(self, hook: Callable[[JobTrace], None]):
+        """注册阶段耗时 hook：每个任务 (无论成败) 结束后调用一次，在事件循环线程里执行，需要尽快返回"""
+        self.trace_hooks.append(hook)
+
+    def _observe_stages(self, trace: JobTrace):
+        for name, ms in trace.stage_totals().items():
+            self.metrics.observe("stage_seconds", ms / 1000.0, stage=name)
+
+    def render_metrics(self) -> str:
+        """刷新瞬时值并渲染 Prometheus 文本"""
+        self.refresh_metrics()
+        return self.metrics.render()
+
+    def refresh_metrics(self):
+        """刷新队列深度、worker 数等瞬时值 (仪表盘)"""
+        self.metrics.set("queue_depth", self.queue_depth())
+        self.metrics.set("queue_capacity", self.queue.maxsize)
+        self.metrics.set("workers", len(self.workers))
+        self.metrics.set("prefetched_audio_seconds", self._prefetched_s)
+        self.metrics.set("model_loaded", 1 if self.models_loaded() else 0)
+
+    # === 空闲卸载 ===
+    def models_loaded(self) -> bool:
+        return bool(self.replicas) and all(engine.model is not None for engine in self.replicas)
+
+    def is_idle(self) -> bool:
+        """没有排队、预取中或正在推理的任务"""
+        return (
+            not self._running_jobs
+            and not self._prefetch_waiting
+            and not self._decode_tasks
+            and self.queue.empty()
+            and self._ready_queue.empty()
+        )
+
+    async def unload_if_idle(self, idle_s: float) -> bool:
+        """
+        空闲超过 idle_s 秒时释放所有副本 (供 MemoryWatchdog 调用)，返回是否卸载。
+        之后的第一个任务由 worker 在推理前重新加载。
+        """
+        async with self._engine_lock:
+            if not self.ready or not self.is_idle() or time.time() - self.last_activity < idle_s:
+                return False
+            loaded = [engine for engine in self.replicas if engine.model is not None]
+            if not loaded:
+                return False
+            for engine in loaded:
+                await run_in_threadpool(engine.release)
+
+        self.metrics.inc("model_unloads_total")
+        print(f"💤 Idle for {time.time() - self.last_activity:.0f}s, unloaded {len(loaded)} replica(s).")
+        return True
+
+    async def _ensure_loaded(self, engine: SenseVoiceEngine):
+        """空闲卸载后的第一个任务：先重新加载这个副本 (不预热)。每批都在锁下检查，避免和卸载交叉"""
+        async with self._engine_lock:
+            if engine.model is not None:
+                return
+            print(f"🔄 Reloading model '{self.model_id}' for queued work...")
+            started_at = time.time()
+            await run_in_threadpool(engine.load, warmup=False)
+            self.metrics.inc("model_reloads_total")
+            print(f"✅ Model reloaded in {time.time() - started_at:.1f}s.")
+
+    def queue_depth(self) -> int:
+        """还没开始推理的任务数：排队中 + 等预取预算 + 解码中 + 已解码等待推理 (关闭解码进程池时只有第一项)"""
+        if self._ready_queue is self.queue:
+            return self.queue.qsize()
+        return self.queue.qsize() + self._prefetch_waiting + len(self._decode_tasks) + self._ready_queue.qsize()
+
+    def _reject_if_full(self):
+        """队列已满 (或模型加载中且不允许排队、正在停机) 时快速失败 (API 层映射成 503)"""
+        if not self.accepting:
+            self.metrics.inc("rejected_total", reason="shutting_down")
+            raise RuntimeError("Service unavailable: Shutting down.")
+        if not self.ready and not self.queue_while_loading:
+            self.metrics.inc("rejected_total", reason="loading")
+            raise RuntimeError("Service unavailable: Model is loading.")
+        # 预取阶段会把任务从 queue 搬走，只看 queue.full() 的话积压可以无限增长
+        if self.queue.maxsize > 0 and self.queue_depth() >= self.queue.maxsize:
+            self.metrics.inc("rejected_total", reason="queue_full")
+            raise RuntimeError("Service busy: Queue is full.")
+
+    async def submit(
+        self,
+        file: UploadFile,
+        params: Dict[str, Any],
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        deadline_s: Optional[float] = None,
+    ) -> Dict[str, Any]:
         """
         提交任务接口 (供 API 层调用)。
         这个方法是非阻塞的：它只是把任务扔进队列，然后等待结果。
+        给了 is_disconnected (例如 Request.is_disconnected) 时，客户端断开后取消任务，worker 不再为它推理。
+        deadline_s: 从现在起最多等多久 (秒)，不填用 default_deadline_s
         """
-        # 1. 检查队列是否已满 (快速失败)
-        if self.queue.full():
-            raise RuntimeError("Service busy: Queue is full.")
+        # 0. 查缓存：命中直接返回，完全跳过队列 (即使队列已满)
+        upload = None
+        cache_key = None
+        trace = JobTrace(uuid.uuid4().hex)
+        if self.cache is not None:
+            # 查缓存要先读完上传，读上传的耗时记在任务自己的阶段树上
+            with trace.span("upload_read"):
+                upload = await self._ingest(file)
+            cache_key, cached = await run_in_threadpool(self._cache_lookup, upload[1], params)
+            self.metrics.inc("cache_lookups_total", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                self._remove_temp_file(upload[0])
+                return cached
+
+        job = await self._enqueue_upload(
+            file, params, upload=upload, trace=trace, deadline_s=deadline_s or self.default_deadline_s,
+            strict_deadline=deadline_s is not None
+        )
+
+        # 等待处理结果 (Await the future)
+        # 这里的 await 会挂起当前请求，直到后台 worker 完成处理
+        result = await self._wait_for_client(job, is_disconnected)
+
+        if cache_key is not None:
+            await self._store_in_cache(cache_key, result)
+        return result
 
-        # 2. "临时文件之舞" (The Temp File Dance)
-        # FunASR 需要一个真实的文件路径，所以我们必须把 UploadFile 落盘
-        # 使用 UUID 防止文件名冲突
-        file_ext = os.path.splitext(file.filename)[1] or ".wav"
-        temp_filename = f"temp_{uuid.uuid4().hex}{file_ext}"
-        temp_path = os.path.abspath(temp_filename)
+    async def _wait_for_client(
+        self, job: TranscriptionJob, is_disconnected: Optional[Callable[[], Awaitable[bool]]]
+    ) -> Dict[str, Any]:
+        """
+        等待任务结果，期间定期检查客户端是否还在。
+        断开后取消任务：排队中的出队时直接丢弃，分段推理中的在两段之间中止。
+        """
+        if is_disconnected is None:
+            return await job.future
+        while True:
+            done, _ = await asyncio.wait({job.future}, timeout=DISCONNECT_POLL_S)
+            if done:
+                return job.future.result()
+            if await is_disconnected():
+                job.future.cancel()
+                self.metrics.inc("client_disconnects_total")
+                raise RuntimeError("Client disconnected before the result was ready.")
+
+    async def _store_in_cache(self, cache_key: str, result: Dict[str, Any]):
+        # 耗时只对这一次请求有意义，不进缓存
+        cached_result = {key: value for key, value in result.items() if key != "timings"}
+        await run_in_threadpool(self.cache.put, cache_key, cached_result)
+
+    # === 异步任务 API ===
+    async def submit_job(
+        self,
+        file: UploadFile,
+        params: Dict[str, Any],
+        webhook_url: Optional[str] = None,
+        deadline_s: Optional[float] = None,
+    ) -> TranscriptionJob:
+        """
+        异步提交 (供 /v1/jobs 调用)：入队后立即返回任务，不占用客户端连接。
+        结果通过 get_job 查询；给了 webhook_url 的，结束后把状态和结果 POST 过去。
+        异步任务默认没有截止时间，只有客户端给了 deadline_s 才做准入判断。
+        """
+        self._purge_jobs()
 
+        upload = None
+        cache_key = None
+        job = None
+        trace = JobTrace(uuid.uuid4().hex)
+        self._reject_if_full()
+        if self.cache is not None:
+            with trace.span("upload_read"):
+                upload = await self._ingest(file)
+            cache_key, cached = await run_in_threadpool(self._cache_lookup, upload[1], params)
+            self.metrics.inc("cache_lookups_total", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                self._remove_temp_file(upload[0])
+                # 命中缓存：直接生成一个已经完成的任务
+                future = asyncio.get_running_loop().create_future()
+                future.set_result(cached)
+                job = TranscriptionJob(
+                    uid=uuid.uuid4().hex, temp_file_path=None, params=params, future=future,
+                    received_at=time.time(), audio_duration=cached.get("duration"), webhook_url=webhook_url
+                )
+                cache_key = None
+
+        if job is None:
+            job = await self._enqueue_upload(
+                file, params, upload=upload, trace=trace, webhook_url=webhook_url, persist=self.journal is not None,
+                deadline_s=deadline_s
+            )
+
+        self.jobs[job.uid] = job
+        self._watch(job, cache_key)
+        return job
+
+    async def recover_jobs(self) -> int:
+        """
+        启动时从 JobJournal 恢复 (在 start_worker 之前调用)：
+        已结束的任务恢复成可查询的结果；没结束的按原提交时间重新入队 (SJF 下老任务自然排在前面)。
+        返回重新入队的任务数。
+        """
+        loop = asyncio.get_running_loop()
+
+        finished = await run_in_threadpool(self.journal.finished)
+        for row in finished:
+            future = loop.create_future()
+            if row["status"] == "succeeded":
+                future.set_result(row["result"])
+            elif row["status"] == "failed":
+                future.set_exception(RuntimeError(row["error"] or "Job failed."))
+            else:
+                future.cancel()
+            job = self._job_from_row(row, future)
+            job.finished_at = row["finished_at"]
+            self.jobs[job.uid] = job
+
+        recovered = []
+        for row in await run_in_threadpool(self.journal.pending):
+            if not row["spool_path"] or not os.path.exists(row["spool_path"]):
+                await run_in_threadpool(self.journal.finish, row["uid"], "failed", None, "Audio was lost before the job ran.")
+                continue
+            job = self._job_from_row(row, loop.create_future())
+            job.temp_file_path = row["spool_path"]
+            self.jobs[job.uid] = job
+            self._watch(job, None)
+            recovered.append(job)
+
+        # 恢复的任务可能超过队列容量：后台逐个 put，有空位就进
+        if recovered:
+            self._requeue_task = asyncio.create_task(self._requeue(recovered))
+        print(f"♻️ Recovered {len(recovered)} pending and {len(finished)} finished job(s) from the journal.")
+        return len(recovered)
+
+    @staticmethod
+    def _job_from_row(row: Dict[str, Any], future: asyncio.Future) -> TranscriptionJob:
+        return TranscriptionJob(
+            uid=row["uid"],
+            temp_file_path=None,
+            params=row["params"],
+            future=future,
+            received_at=row["received_at"],
+            audio_duration=row["audio_duration"],
+            trace=JobTrace(row["uid"]),
+            webhook_url=row["webhook_url"],
+            spool_path=row["spool_path"],
+        )
+
+    async def _requeue(self, jobs: List[TranscriptionJob]):
+        for job in jobs:
+            if not job.future.done():
+                await self.queue.put(job)
+
+    def get_job(self, uid: str) -> Optional[TranscriptionJob]:
+        self._purge_jobs()
+        return self.jobs.get(uid)
+
+    def cancel_job(self, job: TranscriptionJob) -> bool:
+        """取消排队中的任务 (已经开始或结束的任务不能取消)。worker 取到被取消的任务时直接丢弃"""
+        if job.status != "queued":
+            return False
+        return job.future.cancel()
+
+    def job_status(self, job: TranscriptionJob) -> Dict[str, Any]:
+        """任务状态；排队中的任务附带排队位置 (1 表示下一个) 和预计完成时间"""
+        status = {
+            "id": job.uid,
+            "status": job.status,
+            "created_at": job.received_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "queue_position": None,
+            "eta_s": None,
+        }
+        if status["status"] == "queued":
+            pending = [queued for queued in self._queued_jobs() if not queued.future.done()]
+            if job in pending:
+                position = pending.index(job)
+                status["queue_position"] = position + 1
+                # 前面的任务 + 自己，由所有 worker 分摊
+                work_s = sum(self._estimate_job_s(queued) for queued in pending[:position + 1])
+                status["eta_s"] = round(work_s / max(len(self.replicas), 1), 3)
+        elif status["status"] == "running":
+            remaining = self._estimate_job_s(job) - (time.time() - job.started_at)
+            status["eta_s"] = round(max(remaining, 0.0), 3)
+        elif status["status"] == "failed":
+            status["error"] = str(job.future.exception())
+        return status
+
+    def _queued_jobs(self) -> List[TranscriptionJob]:
+        """排队中的任务，按出队顺序 (已经预取/解码好的排在最前面)"""
+        pending = self._queue_order(self.queue)
+        if self._ready_queue is not self.queue:
+            pending = self._queue_order(self._ready_queue) + pending
+        return pending
+
+    @staticmethod
+    def _queue_order(queue: asyncio.Queue) -> List[TranscriptionJob]:
+        if isinstance(queue, ShortestJobFirstQueue):
+            return queue.queued()
+        return list(queue._queue)
+
+    def _estimate_job_s(self, job: TranscriptionJob) -> float:
+        return self._estimate_audio_s(job.audio_duration)
+
+    def _estimate_audio_s(self, audio_duration: Optional[float]) -> float:
+        duration = audio_duration if audio_duration is not None else ETA_DEFAULT_AUDIO_S
+        return duration * self.rtf_estimate
+
+    def _backlog_s(self) -> float:
+        """排队中和正在推理的任务估计还要多少秒才能做完 (由所有 worker 分摊)"""
+        now = time.time()
+        work_s = sum(self._estimate_job_s(job) for job in self._queued_jobs() if not job.future.done())
+        work_s += sum(
+            max(self._estimate_job_s(job) - (now - job.started_at), 0.0) for job in self._running_jobs.values()
+        )
+        return work_s / max(len(self.replicas), 1)
+
+    def _admit(self, deadline: Optional[float], own_s: float, strict: bool = True):
+        """
+        估算的完成时间 (积压 + 自己的推理耗时) 超过截止时间时拒绝，Retry-After 为积压需要先消化掉的时间。
+        光自己的推理耗时就超过截止时间时，等多久都赶不上：strict 时直接拒绝且不可重试，否则只按积压判断。
+        """
+        if deadline is None:
+            return
+        budget_s = deadline - time.time()
+        if own_s > budget_s:
+            if strict:
+                self.metrics.inc("rejected_total", reason="deadline_unattainable")
+                raise RuntimeError(
+                    f"Deadline unattainable: the audio alone needs about {own_s:.1f}s, deadline is in {budget_s:.1f}s."
+                )
+            own_s = 0.0
+        finish_s = self._backlog_s() + own_s
+        if finish_s > budget_s:
+            self.metrics.inc("rejected_total", reason="deadline")
+            raise DeadlineRejected(
+                f"Service busy: Deadline cannot be met (estimated completion in {finish_s:.1f}s, deadline in {budget_s:.1f}s).",
+                retry_after_s=max(1, math.ceil(finish_s - budget_s)),
+            )
+
+    def _watch(self, job: TranscriptionJob, cache_key: Optional[str]):
+        watcher = asyncio.create_task(self._watch_job(job, cache_key))
+        self._job_watchers.add(watcher)
+        watcher.add_done_callback(self._job_watchers.discard)
+
+    async def _watch_job(self, job: TranscriptionJob, cache_key: Optional[str]):
+        """异步任务结束后：记录结束时间、更新持久化记录、写缓存、回调 webhook"""
+        await asyncio.wait({job.future})
+        job.finished_at = time.time()
+        status = job.status
+        result = job.future.result() if status == "succeeded" else None
+
+        if job.spool_path is not None:
+            error = str(job.future.exception()) if status == "failed" else None
+            await run_in_threadpool(self.journal.finish, job.uid, status, result, error)
+
+        if cache_key is not None and result is not None:
+            await self._store_in_cache(cache_key, result)
+
+        if job.webhook_url:
+            payload = self.job_status(job)
+            if result is not None:
+                payload["result"] = result
+            if self._webhook_executor is None:
+                self._webhook_executor = ThreadPoolExecutor(max_workers=self.webhook_workers, thread_name_prefix="webhook")
+            await asyncio.get_running_loop().run_in_executor(
+                self._webhook_executor,
+                functools.partial(post_json, job.webhook_url, payload, allowed_hosts=self.webhook_allowed_hosts),
+            )
+
+    async def check_webhook_url(self, url: str):
+        """提交前检查 webhook 地址 (解析主机名，放到线程池里)；不允许时抛 ValueError"""
+        await run_in_threadpool(check_webhook_url, url, self.webhook_allowed_hosts)
+
+    def _purge_jobs(self):
+        """清理过期的已结束任务；超过保留上限时先清理最早结束的"""
+        now = time.time()
+        finished = [job for job in self.jobs.values() if job.finished_at is not None]
+        finished.sort(key=lambda job: job.finished_at)
+        overflow = len(self.jobs) - self.max_retained_jobs
+        persisted = []
+        for job in finished:
+            if now - job.finished_at > self.job_ttl_s or overflow > 0:
+                del self.jobs[job.uid]
+                overflow -= 1
+                if job.spool_path is not None:
+                    persisted.append(job.uid)
+
+        if persisted:
+            # SQLite 的删除和提交会阻塞：一次性放到线程池里做，不让查询接口卡住事件循环
+            remover = asyncio.create_task(run_in_threadpool(self.journal.remove, *persisted))
+            self._job_watchers.add(remover)
+            remover.add_done_callback(self._job_watchers.discard)
+
+    async def submit_stream(
+        self, file: UploadFile, params: Dict[str, Any], deadline_s: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        渐进式提交 (供 SSE 接口调用)。
+        入队成功后立即返回一个异步迭代器：每解码完一个 VAD 段产出一个 segment 事件，
+        最后产出 done 事件 (内容与 submit 的结果相同)。
+        队列已满等错误在入队阶段直接抛出，方便 API 层在响应开始前返回 503。
+        """
+        loop = asyncio.get_running_loop()
+        segments: asyncio.Queue = asyncio.Queue()
+
+        def on_segment(segment: Dict[str, Any]):
+            # 在 worker 线程里被调用，必须切回事件循环线程
+            loop.call_soon_threadsafe(segments.put_nowait, segment)
+
+        job = await self._enqueue_upload(
+            file, params, on_segment=on_segment, deadline_s=deadline_s or self.default_deadline_s,
+            strict_deadline=deadline_s is not None
+        )
+        return self._stream_events(job, segments)
+
+    async def _stream_events(self, job: "TranscriptionJob", segments: asyncio.Queue) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            while not job.future.done():
+                getter = asyncio.ensure_future(segments.get())
+                try:
+                    done, _ = await asyncio.wait({getter, job.future}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    if not getter.done():
+                        getter.cancel()
+                if getter in done:
+                    yield {"type": "segment", **getter.result()}
+        finally:
+            # 迭代器在任务完成前被关闭 (客户端断开后 StreamingResponse 会取消它)：剩下的段不用再算了
+            if not job.future.done():
+                job.future.cancel()
+                self.metrics.inc("client_disconnects_total")
+
+        # worker 先回调 on_segment 再设置结果，所以此时所有段都已经在队列里了
+        while not segments.empty():
+            yield {"type": "segment", **segments.get_nowait()}
+
+        yield {"type": "done", **job.future.result()}
+
+    async def _ingest(self, file: UploadFile) -> Tuple[str, str]:
+        """把上传内容分块写进受管目录，返回 (文件路径, sha256)"""
+        file_ext = os.path.splitext(file.filename or "")[1] or ".wav"
+        return await self.uploads.ingest(file, file_ext)
+
+    async def _enqueue_upload(
+        self,
+        file: UploadFile,
+        params: Dict[str, Any],
+        upload: Optional[Tuple[str, str]] = None,
+        trace: Optional[JobTrace] = None,
+        on_segment: Optional[Callable[[Dict[str, Any]], None]] = None,
+        webhook_url: Optional[str] = None,
+        persist: bool = False,
+        deadline_s: Optional[float] = None,
+        strict_deadline: bool = True,
+    ) -> "TranscriptionJob":
+        """
+        把上传内容落盘、解码，创建任务并入队。入队之后临时文件由 worker 负责清理。
+        upload 是已经落盘的 (路径, 哈希) (查缓存时读的)，这里接管它的清理。
+        trace 是调用方已经开始记录的阶段树 (读上传的耗时已经记在上面)，不给时在这里新建。
+        persist=True 时先把文件移交给 JobJournal 并写任务记录，再入队。
+        deadline_s 不为 None 时按 ETA 做准入：读上传前先看积压，拿到时长后再算上自己。
+        strict_deadline=False 表示截止时间是服务端默认值：只拒绝排队积压赶不上的，不拒绝本身就很长的音频。
+        """
+        # 本函数持有的上传文件，入队前失败时删除
+        temp_path = upload[0] if upload is not None else None
+        spool_path = None
+        job = None
+        deadline = time.time() + deadline_s if deadline_s is not None else None
         try:
-            # 将上传的文件流写入磁盘
-            with open(temp_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            # 1. 检查队列是否已满、积压是否已经赶不上截止时间 (快速失败，不读上传内容)
+            self._reject_if_full()
+            self._admit(deadline, 0.0)
+            if trace is None:
+                trace = JobTrace(uuid.uuid4().hex)
+
+            # 2. 分块读取上传内容到受管目录，不在事件循环里做整块读写；超过大小上限立即中止
+            if temp_path is None:
+                with trace.span("upload_read"):
+                    temp_path, _ = await self._ingest(file)
+
+            # 3. 只读文件头拿时长，超长的音频在解码之前就拒绝
+            audio_duration = await run_in_threadpool(probe_duration, temp_path)
+            if self.max_audio_duration_s is not None and (audio_duration or 0.0) > self.max_audio_duration_s:
+                self.metrics.inc("rejected_total", reason="too_large")
+                raise RuntimeError(f"Payload too large: audio is longer than {self.max_audio_duration_s:g}s.")
+            self._admit(deadline, self._estimate_audio_s(audio_duration), strict=strict_deadline)
+
+            # 4. 优先在内存中解码 (wav/flac/ogg/mp3 ...)，解码是 CPU 密集操作，放到线程池里跑
+            # 开启解码进程池时这里不解码：排队期间不占用解码后的内存，由预取阶段在推理前解码；
+            # 排队中的已解码音频超出预算 (或时长未知) 时也不解码，保留文件交给引擎
+            decoded = None
+            if self.decode_pool is None and self._fits_decoded_queue(audio_duration):
+                with trace.span("decode"):
+                    decoded = await run_in_threadpool(decode_audio, temp_path)
 
-            # 3. 创建任务对象
+            if persist:
+                # 持久化任务：文件移进受管目录，重启后从这里恢复
+                with trace.span("spool"):
+                    spool_path = await run_in_threadpool(self.journal.spool, trace.uid, temp_path)
+                temp_path = spool_path
+
+            if decoded is not None:
+                samples, sample_rate = decoded
+                audio_duration = len(samples) / float(sample_rate)
+                if temp_path != spool_path:
+                    self._remove_temp_file(temp_path)
+                temp_path = None
+            else:
+                # 5. "临时文件之舞" (The Temp File Dance)
+                # 内存解码不了的格式 (m4a 等) 交给 FunASR 调 ffmpeg，它需要一个真实的文件路径，直接用落盘的文件
+                samples, sample_rate = None, MODEL_SAMPLE_RATE
+
+            # 6. 创建任务对象
             loop = asyncio.get_running_loop()
             future = loop.create_future()
             
             job = TranscriptionJob(
-                uid=uuid.uuid4().hex[:8],
+                uid=trace.uid,
                 temp_file_path=temp_path,
                 params=params,
                 future=future,
-                received_at=time.time()
+                received_at=time.time(),
+                audio_duration=audio_duration,
+                audio=samples,
+                sample_rate=sample_rate,
+                on_segment=on_segment,
+                trace=trace,
+                webhook_url=webhook_url,
+                spool_path=spool_path,
+                deadline=deadline
             )
 
-            # 4. 入队
+            # 7. 先写日志再入队
+            if samples is not None:
+                job.decoded_cost = audio_duration
+                self._decoded_queue_s += audio_duration
+            if persist:
+                await run_in_threadpool(
+                    self.journal.add, job.uid, params, spool_path, audio_duration, job.received_at, webhook_url
+                )
             await self.queue.put(job)
-            
-            # 5. 等待处理结果 (Await the future)
-            # 这里的 await 会挂起当前请求，直到后台 worker 完成处理
-            result = await future
-            return result
+            return job
 
         except Exception as e:
             # 如果在入队前就失败了，确保清理临时文件
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            self._remove_temp_file(temp_path)
+            self._remove_temp_file(spool_path)
+            if job is not None:
+                self._release_decoded(job)
             raise e
 
-    async def _consume_loop(self):
+    async def submit_array(self, samples: np.ndarray, sample_rate: int, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        提交内存中已经解码好的音频 (供流式会话等内部调用)。
+        与 submit 共用同一个队列和 worker，依然保证串行推理和背压。
+        """
+        self._reject_if_full()
+
+        future = asyncio.get_running_loop().create_future()
+        uid = uuid.uuid4().hex
+        job = TranscriptionJob(
+            uid=uid,
+            temp_file_path=None,
+            params=params,
+            future=future,
+            received_at=time.time(),
+            audio_duration=len(samples) / float(sample_rate),
+            audio=samples,
+            sample_rate=sample_rate,
+            trace=JobTrace(uid)
+        )
+
+        await self.queue.put(job)
+        return await future
+
+    def _cache_lookup(self, digest: str, params: Dict[str, Any]):
+        """用上传时算好的内容哈希查缓存 (可能读 SQLite，在线程池里调用)"""
+        cache_key = self.cache.key_for_digest(digest, params, self.model_id)
+        return cache_key, self.cache.get(cache_key)
+
+    @staticmethod
+    def _remove_temp_file(path: Optional[str]):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def _fits_decoded_queue(self, audio_duration: Optional[float]) -> bool:
+        """入队时解码这段音频后，排队中的已解码音频是否还在预算内 (时长未知的不解码，无法预估内存)"""
+        return audio_duration is not None and self._decoded_queue_s + audio_duration <= self.max_decoded_queue_s
+
+    def _release_decoded(self, job: TranscriptionJob):
+        """任务离开队列：归还入队解码占用的预算"""
+        self._decoded_queue_s = max(self._decoded_queue_s - job.decoded_cost, 0.0)
+        job.decoded_cost = 0.0
+
+    def _remove_job_temp_file(self, job: TranscriptionJob):
+        """删除任务的临时文件；持久化任务的音频副本由 JobJournal 在任务结束时删除"""
+        if job.temp_file_path != job.spool_path:
+            self._remove_temp_file(job.temp_file_path)
+
+    async def _consume_loop(self, engine: Optional[SenseVoiceEngine] = None):
         """
         消费者循环 (Strict Serial Execution)。
         这是保护 M4 Pro 显存的关键。
+        开启微批后依然是单消费者：同一时刻只有一个 generate 调用在跑。
+        多副本模式下每个副本各跑一个循环，但每个副本内部依然串行。
         """
+        engine = engine or self.engine
+        # 凑批时取出但不能并入当前批次的任务，留给本循环的下一批
+        carry_over: Optional[TranscriptionJob] = None
+
         while self.is_running:
-            # 从队列获取任务
-            job: TranscriptionJob = await self.queue.get()
-            
+            # 从队列获取任务 (可能是一批)
+            batch, carry_over = await self._collect_batch(carry_over)
+            # 已经出队：不再占用排队中的解码预算 (采样缓冲区随推理结束释放)
+            for job in batch:
+                self._release_decoded(job)
+
+            try:
+                await self._run_batch(batch, engine)
+
+            finally:
+                for job in batch:
+                    # === 打扫战场 ===
+                    # 无论成功失败，必须删除临时文件，否则磁盘会爆
+                    self._running_jobs.pop(job.uid, None)
+                    self.last_activity = time.time()
+                    self._remove_job_temp_file(job)
+                    await self._release_prefetch(job)
+                    # 异步任务结束后还会保留一段时间供查询，不能让它一直拿着采样缓冲区
+                    job.audio = None
+
+                    # 标记队列任务完成
+                    self._ready_queue.task_done()
+
+    async def _prefetch_loop(self):
+        """
+        预取阶段 (仅在开启解码进程池时运行)：
+        按调度顺序从 queue 取任务，在预算允许时提交解码，解码完成后放入 _ready_queue。
+        预算按音频时长计；没有在途任务时总是放行，超过预算的大文件也不会卡死。
+        """
+        while self.is_running:
+            job = await self.queue.get()
+            # 等预算期间任务既不在 queue 里也还没有解码任务：仍然算作排队中 (容量、空闲判断、停机排空)，
+            # 解码任务登记之后才对 queue 调用 task_done
+            self._prefetch_waiting = 1
+            try:
+                cancelled = job.future.cancelled()
+                if cancelled or self._expire_if_late(job):
+                    self._remove_job_temp_file(job)
+                    self._record_skipped(job, "queued", status="cancelled" if cancelled else "expired")
+                    continue
+
+                cost = job.audio_duration if job.audio_duration is not None else self.decode_pool.prefetch_audio_s
+                async with self._prefetch_cond:
+                    await self._prefetch_cond.wait_for(
+                        lambda: self._prefetched_jobs == 0
+                        or self._prefetched_s + cost <= self.decode_pool.prefetch_audio_s
+                    )
+                    self._prefetched_s += cost
+                    self._prefetched_jobs += 1
+                    job.prefetch_cost = cost
+
+                task = asyncio.create_task(self._decode_job(job))
+                self._decode_tasks.add(task)
+                task.add_done_callback(self._decode_tasks.discard)
+            finally:
+                self._prefetch_waiting = 0
+                self.queue.task_done()
+
+    async def _decode_job(self, job: TranscriptionJob):
+        """在解码进程池里把任务的文件解码成采样缓冲区；失败的任务直接结束，不进入推理"""
+        if job.audio is None and job.temp_file_path is not None:
+            try:
+                with job.trace.span("decode") if job.trace is not None else nullcontext():
+                    samples, sample_rate = await self.decode_pool.decode(job.temp_file_path)
+            except Exception as e:
+                print(f"❌ Job {job.uid} failed to decode: {e}")
+                self._remove_job_temp_file(job)
+                await self._release_prefetch(job)
+                self._finish_trace(job)
+                if not job.future.done():
+                    job.future.set_exception(e)
+                self._record_request(job, "failure")
+                return
+
+            self._remove_job_temp_file(job)
+            job.temp_file_path = None
+            job.audio, job.sample_rate = samples, sample_rate
+            if job.audio_duration is None:
+                job.audio_duration = len(samples) / float(sample_rate)
+
+            # 时长未知时按整个预算预留，解码后按实际时长修正
+            async with self._prefetch_cond:
+                self._prefetched_s += job.audio_duration - job.prefetch_cost
+                job.prefetch_cost = job.audio_duration
+                self._prefetch_cond.notify_all()
+
+        self._ready_queue.put_nowait(job)
+
+    async def _release_prefetch(self, job: TranscriptionJob):
+        """任务推理结束 (或解码失败)，归还它占用的预取预算"""
+        if job.prefetch_cost is None:
+            return
+        async with self._prefetch_cond:
+            self._prefetched_s = max(self._prefetched_s - job.prefetch_cost, 0.0)
+            self._prefetched_jobs -= 1
+            job.prefetch_cost = None
+            self._prefetch_cond.notify_all()
+
+    async def _collect_batch(
+        self, carry_over: Optional[TranscriptionJob] = None
+    ) -> Tuple[List[TranscriptionJob], Optional[TranscriptionJob]]:
+        """
+        凑批：先阻塞等待第一个任务，然后在 max_batch_wait_ms 内尽量多取任务，
+        直到达到 max_batch_size 或 max_batch_audio_s 上限。
+        只有推理参数相同的任务才能合并到同一批。
+        返回 (本批任务, 取出但放不进本批的任务)。
+        """
+        first = carry_over if carry_over is not None else await self._ready_queue.get()
+        while await self._discard_if_cancelled(first):
+            first = await self._ready_queue.get()
+
+        batch = [first]
+        # 需要分段结果的任务 (渐进式输出 / verbose_json) 和并行长音频走分段推理，不参与合批
+        if self.max_batch_size <= 1 or self._runs_alone(first):
+            return batch, None
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_batch_wait_ms / 1000.0
+        budget_s = self.max_batch_audio_s - self._batch_cost(first)
+
+        while len(batch) < self.max_batch_size:
             try:
-                # === 核心推理逻辑 ===
-                # run_in_threadpool 是为了把同步的 Engine 代码放到线程池里跑
-                # 防止阻塞 asyncio 的事件循环
-                raw_text = await run_in_threadpool(
-                    self.engine.transcribe_file,
-                    file_path=job.temp_file_path,
-                    language=job.params.get("language", "auto"),
-                    use_itn=True
+                job = self._ready_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                job = await self._get_until(deadline)
+                if job is None:
+                    break
+            if await self._discard_if_cancelled(job):
+                continue
+
+            if (
+                self._runs_alone(job)
+                or self._batch_key(job) != self._batch_key(first)
+                or self._batch_cost(job) > budget_s
+            ):
+                return batch, job
+
+            batch.append(job)
+            budget_s -= self._batch_cost(job)
+
+        return batch, None
+
+    async def _discard_if_cancelled(self, job: TranscriptionJob) -> bool:
+        """
+        排队中被取消 (/v1/jobs DELETE、客户端断开) 或已经超过截止时间的任务出队时直接丢弃：
+        清理临时文件、归还预算、标记完成
+        """
+        cancelled = job.future.cancelled()
+        if not cancelled and not self._expire_if_late(job):
+            return False
+        self._remove_job_temp_file(job)
+        self._release_decoded(job)
+        job.audio = None
+        await self._release_prefetch(job)
+        self._record_skipped(job, "queued", status="cancelled" if cancelled else "expired")
+        self._ready_queue.task_done()
+        return True
+
+    async def _get_until(self, deadline: float) -> Optional[TranscriptionJob]:
+        """在 deadline 之前等待下一个任务，超时返回 None"""
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            return None
+
+        # 不用 asyncio.wait_for：超时和取到任务同时发生时它可能把任务弄丢
+        getter = asyncio.ensure_future(self._ready_queue.get())
+        done, _ = await asyncio.wait({getter}, timeout=remaining)
+        if done:
+            return getter.result()
+
+        getter.cancel()
+        try:
+            # cancel 之前刚好取到任务的话，这里会拿到它
+            return await getter
+        except asyncio.CancelledError:
+            return None
+
+    def _batch_cost(self, job: TranscriptionJob) -> float:
+        """任务占用的批次预算 (秒)。时长未知时按占满整批处理，保证不超内存预算"""
+        if job.audio_duration is None:
+            return self.max_batch_audio_s
+        return job.audio_duration
+
+    def _batch_key(self, job: TranscriptionJob) -> tuple:
+        """影响 generate 调用参数的字段，相同才能合并"""
+        return (job.params.get("language", "auto"), job.sample_rate, self._pipeline_for(job))
+
+    def _pipeline_for(self, job: TranscriptionJob) -> str:
+        """选择推理流水线：客户端指定的优先；需要分段时间戳的任务保留 VAD；短语音走快速通道"""
+        requested = job.params.get("pipeline")
+        if requested:
+            if requested == "full" or self._fits_without_vad(job):
+                return requested
+            return "full"
+        if self._wants_segments(job):
+            return "full"
+        if self.fast_path_max_s > 0 and job.audio_duration is not None and job.audio_duration <= self.fast_path_max_s:
+            return self.fast_path_pipeline
+        return "full"
+
+    def _fits_without_vad(self, job: TranscriptionJob) -> bool:
+        """音频是否短到可以不经 VAD 切分、整段做一次前向"""
+        limit_s = max(self.max_vadless_s, self.fast_path_max_s)
+        return job.audio_duration is not None and job.audio_duration <= limit_s
+
+    async def _run_batch(self, batch: List[TranscriptionJob], engine: SenseVoiceEngine):
+        """执行一批任务，并把结果路由回各自的 future"""
+        language = batch[0].params.get("language", "auto")
+
+        dequeued_at = time.time()
+        for job in batch:
+            job.started_at = dequeued_at
+            self._running_jobs[job.uid] = job
+            queue_wait = max(dequeued_at - job.received_at, 0.0)
+            self.metrics.observe("queue_wait_seconds", queue_wait)
+            if job.trace is not None:
+                job.trace.add_span("queue_wait", queue_wait)
+            if job.audio_duration is not None:
+                self.metrics.observe("audio_duration_seconds", job.audio_duration)
+        self.last_activity = dequeued_at
+
+        # 空闲卸载过的副本先重新加载；加载失败时这一批直接失败
+        try:
+            await self._ensure_loaded(engine)
+        except Exception as e:
+            print(f"❌ Model failed to reload: {e}")
+            for job in batch:
+                self._finish_trace(job)
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError(f"Model failed to reload: {e}"))
+                self._record_request(job, "failure")
+            return
+
+        if len(batch) == 1:
+            raw_texts = None
+        else:
+            try:
+                # === 批量推理 ===
+                started_at = time.time()
+                raw_texts = await self._call_engine(
+                    batch,
+                    engine.transcribe_batch,
+                    inputs=[self._job_input(job) for job in batch],
+                    sample_rate=batch[0].sample_rate,
+                    language=language,
+                    use_itn=True,
+                    pipeline=self._pipeline_for(batch[0])
                 )
+                batch_elapsed = time.time() - started_at
+                self._record_inference(batch, batch_elapsed)
+                for job in batch:
+                    if job.trace is not None:
+                        # 整批一次调用，每个任务都记完整的批耗时
+                        job.trace.add_span("batch_inference", batch_elapsed)
+            except Exception as e:
+                # 一个坏文件不应该拖垮整批：退化成逐个推理
+                print(f"⚠️ Batch of {len(batch)} failed ({e}), retrying one by one.")
+                raw_texts = None
+
+        for index, job in enumerate(batch):
+            # Engine 内部的阶段 (vad/asr/punc ...) 通过 contextvar 记到这个任务上
+            token = current_trace.set(job.trace)
+            try:
+                if raw_texts is not None:
+                    raw_text, segments = raw_texts[index], None
+                elif job.future.cancelled() or self._expire_if_late(job):
+                    # 同一批前面的任务推理期间被取消或过期的
+                    self._record_skipped(job, "queued", status="cancelled" if job.future.cancelled() else "expired")
+                    continue
+                else:
+                    # === 核心推理逻辑 ===
+                    # run_in_threadpool 是为了把同步的 Engine 代码放到线程池里跑
+                    # 防止阻塞 asyncio 的事件循环
+                    started_at = time.time()
+                    with stage("inference"):
+                        raw_text, segments = await self._transcribe_one(job, engine)
+                    self._record_inference([job], time.time() - started_at)
+
+                if job.future.cancelled():
+                    # 推理期间被取消 (客户端断开、DELETE)：结果已经算出来了 (省不下音频)，但不再交付，也不算成功
+                    print(f"🔌 Job {job.uid} cancelled during inference.")
+                    job.transcribed_s = job.audio_duration or 0.0
+                    self._record_skipped(job, "inference", status="cancelled")
+                    continue
+
+                result = self._build_result(job, raw_text, segments)
+                self._finish_trace(job, result)
 
-                # 调用适配器清洗文本
-                # 根据 clean_tags 参数决定是否清理
-                clean_tags = job.params.get("clean_tags", True)
-                cleaned_text = clean_sensevoice_tags(raw_text, clean_tags=clean_tags)
-
-                # 构造结果
-                process_time = time.time() - job.received_at
-                result = {
-                    "text": cleaned_text,  # 主要返回文本（根据 clean_tags 决定是否清理）
-                    "duration": process_time,
-                    "raw_text": raw_text,  # 始终保留原始文本，供需要时使用
-                    "is_cleaned": clean_tags  # 标记是否进行了清理
-                }
-                
                 # 唤醒等待的 API 请求
                 if not job.future.done():
                     job.future.set_result(result)
+                self._record_request(job, "success")
 
             except Exception as e:
+                self._finish_trace(job)
+                if job.future.cancelled():
+                    # 分段推理中途被取消：剩下的段没有算
+                    print(f"🔌 Job {job.uid} cancelled after {job.transcribed_s:.1f}s of audio.")
+                    self._record_skipped(job, "inference")
+                    continue
                 print(f"❌ Job {job.uid} failed: {e}")
                 if not job.future.done():
                     job.future.set_exception(e)
-            
+                self._record_request(job, "failure")
+
             finally:
-                # === 打扫战场 ===
-                # 无论成功失败，必须删除临时文件，否则磁盘会爆
-                if os.path.exists(job.temp_file_path):
-                    os.remove(job.temp_file_path)
-                
-                # 标记队列任务完成
-                self.queue.task_done()
\ No newline at end of file
+                current_trace.reset(token)
+
+    def _finish_trace(self, job: TranscriptionJob, result: Optional[Dict[str, Any]] = None):
+        """结束任务的阶段树：verbose_json 附带 timings，并交给所有 hook"""
+        if job.trace is None:
+            return
+        job.trace.finish()
+        if result is not None and job.params.get("response_format") == "verbose_json":
+            result["timings"] = job.trace.to_dict()
+
+        for hook in self.trace_hooks:
+            try:
+                hook(job.trace)
+            except Exception as e:
+                # 观测代码不能影响请求本身
+                print(f"⚠️ Trace hook failed for job {job.uid}: {e}")
+
+    def _record_inference(self, jobs: List[TranscriptionJob], elapsed: float):
+        """记录一次引擎调用的耗时；音频时长全部已知时才计算实时率"""
+        self.metrics.observe("inference_seconds", elapsed)
+        self.metrics.inc("inference_seconds_total", elapsed)
+
+        durations = [job.audio_duration for job in jobs]
+        if None in durations:
+            return
+        audio_s = sum(durations)
+        self.metrics.inc("audio_seconds_total", audio_s)
+        if audio_s > 0:
+            self.metrics.observe("real_time_factor", elapsed / audio_s)
+            # 给排队任务估算 ETA：按音频时长加权，短音频的固定开销不会把长音频的估计拉高
+            decay = 0.5 ** (audio_s / RTF_HALF_LIFE_AUDIO_S)
+            self._rtf_elapsed_s = self._rtf_elapsed_s * decay + elapsed
+            self._rtf_audio_s = self._rtf_audio_s * decay + audio_s
+            self.rtf_estimate = self._rtf_elapsed_s / self._rtf_audio_s
+
+    def _expire_if_late(self, job: TranscriptionJob) -> bool:
+        """已经超过截止时间的任务：不再推理，直接以超时失败结束"""
+        if job.deadline is None or job.future.done() or time.time() <= job.deadline:
+            return False
+        job.future.set_exception(RuntimeError("Deadline exceeded: Job expired before inference started."))
+        return True
+
+    def _record_skipped(self, job: TranscriptionJob, stage_name: str, status: str = "cancelled"):
+        """被取消或过期的任务没有推理 (或没推理完)：记录请求状态，并统计省下的音频时长"""
+        self.metrics.inc("skipped_jobs_total", stage=stage_name)
+        if job.audio_duration is not None:
+            self.metrics.inc("skipped_audio_seconds_total", max(job.audio_duration - job.transcribed_s, 0.0))
+        self._record_request(job, status)
+
+    def _record_request(self, job: TranscriptionJob, status: str):
+        language = job.params.get("language", "auto")
+        response_format = job.params.get("response_format", "json")
+        self.metrics.inc(
+            "requests_total",
+            language=language if language in METRIC_LANGUAGES else "other",
+            response_format=response_format if response_format in METRIC_RESPONSE_FORMATS else "other",
+            status=status,
+        )
+
+    async def _transcribe_one(
+        self, job: TranscriptionJob, engine: SenseVoiceEngine
+    ) -> Tuple[str, Optional[List[Dict[str, Any]]]]:
+        """
+        单个任务推理：内存缓冲区直接透传，否则读临时文件。
+        需要分段结果的任务走分段推理：时间戳直接取自同一次 VAD 的切分边界。
+        渐进式任务每解码完一段就清洗并回调，其余任务等所有段解码完后批量清洗。
+        """
+        language = job.params.get("language", "auto")
+
+        if self._runs_alone(job):
+            raw_segments: List[Dict[str, Any]] = []
+            segments: List[Dict[str, Any]] = []
+
+            def emit(raw_segment: Dict[str, Any]):
+                # 在 worker 线程里被调用：任务已经被取消 (客户端断开) 就在两段之间中止，后面的段不再推理
+                job.transcribed_s = raw_segment["end"]
+                if job.future.cancelled():
+                    raise RuntimeError("Job cancelled during inference.")
+                raw_segments.append(raw_segment)
+                if job.on_segment is not None:
+                    segment = self._build_segments(job, [raw_segment], first_id=len(segments))[0]
+                    segments.append(segment)
+                    job.on_segment(segment)
+
+            await self._call_engine(
+                [job],
+                engine.transcribe_segments,
+                model_input=self._job_input(job),
+                sample_rate=job.sample_rate,
+                language=language,
+                use_itn=True,
+                on_segment=emit,
+                pipeline=self._pipeline_for(job),
+                fanout=self.fanout if self._uses_fanout(job) else None
+            )
+            raw_text = " ".join(raw_segment["text"] for raw_segment in raw_segments)
+            if not self._wants_segments(job):
+                return raw_text, None
+            if job.on_segment is None:
+                segments = self._build_segments(job, raw_segments)
+            return raw_text, segments
+
+        if job.audio is not None:
+            raw_text = await self._call_engine(
+                [job],
+                engine.transcribe_array,
+                samples=job.audio,
+                sample_rate=job.sample_rate,
+                language=language,
+                use_itn=True,
+                pipeline=self._pipeline_for(job)
+            )
+            return raw_text, None
+
+        raw_text = await self._call_engine(
+            [job],
+            engine.transcribe_file,
+            file_path=job.temp_file_path,
+            language=language,
+            use_itn=True,
+            pipeline=self._pipeline_for(job)
+        )
+        return raw_text, None
+
+    async def _call_engine(self, jobs: List[TranscriptionJob], func: Callable[..., Any], **kwargs) -> Any:
+        """
+        在线程池里调用 Engine；抽样剖析时在同一个线程里包一层 cProfile。
+        jobs 是这次调用服务的所有任务 (批量推理时是整批)，每个任务各自抽样，抽中任意一个就剖析这次调用。
+        """
+        if self.profiler is not None:
+            sampled = [job.uid for job in jobs if self.profiler.sample(job.uid)]
+            if sampled:
+                return await run_in_threadpool(self.profiler.profile_call, sampled, func, **kwargs)
+        return await run_in_threadpool(func, **kwargs)
+
+    @staticmethod
+    def _wants_segments(job: TranscriptionJob) -> bool:
+        """渐进式输出和 verbose_json 都需要逐段的时间戳"""
+        return job.on_segment is not None or job.params.get("response_format") == "verbose_json"
+
+    def _uses_fanout(self, job: TranscriptionJob) -> bool:
+        """已知时长的长音频、且走完整流水线 (有 VAD 才能切段) 时，分发到进程池并行识别"""
+        return (
+            self.fanout is not None
+            and job.audio_duration is not None
+            and job.audio_duration >= self.long_audio_min_s
+            and self._pipeline_for(job) == "full"
+        )
+
+    def _runs_alone(self, job: TranscriptionJob) -> bool:
+        """走分段推理的任务：需要时间戳的，或者并行识别的长音频"""
+        return self._wants_segments(job) or self._uses_fanout(job)
+
+    @staticmethod
+    def _build_segments(
+        job: TranscriptionJob, raw_segments: List[Dict[str, Any]], first_id: int = 0
+    ) -> List[Dict[str, Any]]:
+        """把 Engine 返回的原始分段 (批量) 清洗成对外的 Segment 结构"""
+        clean_tags = job.params.get("clean_tags", True)
+        with stage("clean"):
+            parsed = parse_sensevoice_batch((raw_segment["text"] for raw_segment in raw_segments), clean_tags=clean_tags)
+        return [
+            {
+                "id": first_id + index,
+                "start": raw_segment["start"],
+                "end": raw_segment["end"],
+                "text": segment.text,
+                "raw_text": raw_segment["text"],
+            }
+            for index, (raw_segment, segment) in enumerate(zip(raw_segments, parsed))
+        ]
+
+    @staticmethod
+    def _audio_duration(job: TranscriptionJob, segments: Optional[List[Dict[str, Any]]]) -> float:
+        """音频总时长：优先用入队时测得的时长，测不出时用最后一个语音段的结束时间兜底"""
+        if job.audio_duration is not None:
+            return job.audio_duration
+        if segments:
+            return segments[-1]["end"]
+        return 0.0
+
+    @staticmethod
+    def _job_input(job: TranscriptionJob) -> Any:
+        return job.audio if job.audio is not None else job.temp_file_path
+
+    def _build_result(
+        self,
+        job: TranscriptionJob,
+        raw_text: str,
+        segments: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """清洗文本并构造返回给 API 层的结果字典"""
+        # 调用适配器清洗文本
+        # 根据 clean_tags 参数决定是否清理
+        clean_tags = job.params.get("clean_tags", True)
+        # 同一次扫描顺便取出模型识别的语言、情感和音频事件
+        with stage("clean"):
+            parsed = parse_sensevoice_output(raw_text, clean_tags=clean_tags)
+
+        # 构造结果
+        process_time = time.time() - job.received_at
+        return {
+            "text": parsed.text,  # 主要返回文本（根据 clean_tags 决定是否清理）
+            "duration": self._audio_duration(job, segments),
+            "processing_time": process_time,
+            "raw_text": raw_text,  # 始终保留原始文本，供需要时使用
+            "is_cleaned": clean_tags,  # 标记是否进行了清理
+            "language": parsed.tags.language,  # 模型识别出的语言，没有语言标签时为 None
+            "emotion": parsed.tags.emotion,
+            "events": parsed.tags.events,
+            "pipeline": self._pipeline_for(job),  # 实际使用的推理流水线
+            "segments": segments  # 分段推理时才有
+        }
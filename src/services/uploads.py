@@ -0,0 +1,132 @@
+import hashlib
+import os
+import time
+import uuid
+from typing import BinaryIO, Optional, Tuple
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+# 每次从上传流里读多少字节。读和写都在线程池里完成，单次调用不会长时间占用事件循环
+UPLOAD_CHUNK_BYTES = 1 << 20
+# 受管目录里上传文件的前缀：upload_<pid>_<进程启动时间>_<uuid><ext>，用来判断文件是否属于已经退出的进程。
+# 只看 pid 不够：容器重启后新进程常常拿到同一个 pid (例如 PID 1)，上一个进程的文件就永远清不掉
+_PREFIX = "upload_"
+# 本进程 (大致的) 启动时刻：拿不到进程启动时间的平台上，早于它的本 pid 文件一定是上一个进程留下的
+_STARTED_AT = time.time()
+
+
+class UploadSpool:
+    """
+    上传文件的落盘目录 (可以指向 /dev/shm 这样的 tmpfs)。
+    - ingest: 分块异步读取上传内容，边读边写边算哈希，超过 max_bytes 立即中止
+    - sweep: 清理已经退出 (包括崩溃) 的进程留下的文件；启动时自动执行一次
+    """
+
+    def __init__(self, spool_dir: str, max_bytes: Optional[int] = None, chunk_bytes: int = UPLOAD_CHUNK_BYTES):
+        self.spool_dir = os.path.abspath(spool_dir)
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+        os.makedirs(self.spool_dir, exist_ok=True)
+        swept = self.sweep()
+        if swept:
+            print(f"🧹 Removed {swept} stale upload file(s) from {self.spool_dir}")
+
+    def new_path(self, file_ext: str) -> str:
+        pid = os.getpid()
+        return os.path.join(self.spool_dir, f"{_PREFIX}{pid}_{_process_start(pid) or 0}_{uuid.uuid4().hex}{file_ext}")
+
+    async def ingest(self, file: UploadFile, file_ext: str) -> Tuple[str, str]:
+        """
+        把上传内容分块写进受管目录。
+
+        Returns:
+            (文件路径, 内容的 sha256 十六进制摘要)
+        Raises:
+            RuntimeError: 超过 max_bytes (API 层映射成 413)
+        """
+        path = self.new_path(file_ext)
+        digest = hashlib.sha256()
+        size = 0
+        out = await run_in_threadpool(open, path, "wb")
+        try:
+            while True:
+                chunk = await file.read(self.chunk_bytes)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if self.max_bytes is not None and size > self.max_bytes:
+                    raise RuntimeError(f"Payload too large: upload exceeds {self.max_bytes} bytes.")
+                # 写盘和哈希都是阻塞操作，放到线程池
+                await run_in_threadpool(_write_chunk, out, digest, chunk)
+        except BaseException:
+            out.close()
+            _remove(path)
+            raise
+
+        await run_in_threadpool(out.close)
+        return path, digest.hexdigest()
+
+    def sweep(self) -> int:
+        """删除属于已退出进程的上传文件，返回删除的数量"""
+        removed = 0
+        for name in os.listdir(self.spool_dir):
+            if not name.startswith(_PREFIX):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            if _owner_alive(name, path):
+                continue
+            _remove(path)
+            removed += 1
+        return removed
+
+
+def _owner_alive(name: str, path: str) -> bool:
+    """文件名里的进程是否还在运行：pid 存在，并且启动时间对得上 (不是复用了这个 pid 的新进程)"""
+    pid, _, rest = name[len(_PREFIX):].partition("_")
+    started, _, _ = rest.partition("_")
+    if not pid.isdigit() or not _pid_alive(int(pid)):
+        return False
+    current = _process_start(int(pid))
+    if current is not None:
+        return started == current
+    # 没有 /proc (macOS 等)：本进程只保留自己启动之后写的文件，其他进程只能按 pid 判断
+    try:
+        return int(pid) != os.getpid() or os.path.getmtime(path) >= _STARTED_AT
+    except FileNotFoundError:
+        return True
+
+
+def _write_chunk(out: BinaryIO, digest, chunk: bytes):
+    out.write(chunk)
+    digest.update(chunk)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 进程存在，只是属于别的用户
+        return True
+    return True
+
+
+def _process_start(pid: int) -> Optional[str]:
+    """进程的启动时间 (开机以来的时钟滴答数，/proc/<pid>/stat 第 22 个字段)；没有 /proc 时返回 None"""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            # 第 2 个字段 (进程名) 可能含空格和括号，从最后一个 ")" 之后开始数
+            return stat.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
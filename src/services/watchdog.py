@@ -0,0 +1,118 @@
+import asyncio
+from typing import List, Optional, TYPE_CHECKING
+
+from src.adapters.memory import process_rss_bytes
+from src.core.engine import BATCH_SIZE_S, MERGE_LENGTH_S, SenseVoiceEngine
+
+if TYPE_CHECKING:
+    from src.services.registry import ModelRegistry
+    from src.services.transcription import TranscriptionService
+
+# 内存吃紧时 batch_size_s / merge_length_s 最多降到这里 (再小 VAD 段切得太碎，识别效果下降)
+MIN_BATCH_SIZE_S = 10
+MIN_MERGE_LENGTH_S = 5
+
+
+class MemoryWatchdog:
+    """
+    内存看门狗 (事件循环里的后台任务)，每 interval_s 秒检查一次：
+    1. 采样进程 RSS 和 MPS/CUDA 分配器占用，写进 /metrics
+    2. RSS 超过 high_watermark_mb：各副本的 batch_size_s / merge_length_s 减半 (有下限)，
+       回落到 high_watermark_mb * low_watermark_ratio 以下后逐步翻倍恢复到默认值
+    3. 服务空闲超过 idle_unload_s 秒：卸载所有副本，下一个任务到来时由 worker 重新加载
+    传入 registry 时看管其中所有已创建的模型 (各自按空闲时间卸载)，内存采样写进 registry 的指标
+    """
+
+    def __init__(
+        self,
+        service: "TranscriptionService",
+        idle_unload_s: Optional[float] = None,
+        high_watermark_mb: Optional[float] = None,
+        low_watermark_ratio: float = 0.8,
+        interval_s: float = 10.0,
+        registry: Optional["ModelRegistry"] = None,
+    ):
+        """
+        Args:
+            service: 被看管的转录服务 (引擎副本取自 service.replicas)
+            idle_unload_s: 空闲多久后卸载模型；None 表示不卸载
+            high_watermark_mb: 触发缩小分批参数的 RSS；None 表示不调整
+            low_watermark_ratio: RSS 低于 高水位 x 该比例 时恢复分批参数
+            interval_s: 检查间隔
+            registry: 多模型注册表；None 表示只看管 service
+        """
+        self.service = service
+        self.idle_unload_s = idle_unload_s
+        self.high_watermark_mb = high_watermark_mb
+        self.low_watermark_ratio = low_watermark_ratio
+        self.interval_s = interval_s
+        self.registry = registry
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            print(
+                f"🐕 Memory watchdog started. Idle unload: {self.idle_unload_s or 'off'}s, "
+                f"high watermark: {self.high_watermark_mb or 'off'}MB"
+            )
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                await self.check()
+            except Exception as e:
+                # 看门狗自己出错不能影响服务
+                print(f"⚠️ Memory watchdog check failed: {e}")
+
+    async def check(self):
+        """一次检查：采样内存，按水位调整分批参数，空闲时卸载模型"""
+        services = self.registry.services() if self.registry is not None else [self.service]
+        metrics = self.registry.metrics if self.registry is not None else self.service.metrics
+        engines = [engine for service in services for engine in service.replicas]
+
+        rss = process_rss_bytes()
+        if rss is not None:
+            metrics.set("process_rss_bytes", rss)
+        allocated = [engine.allocator_bytes() for engine in engines if hasattr(engine, "allocator_bytes")]
+        allocated = [value for value in allocated if isinstance(value, int)]
+        if allocated:
+            metrics.set("accelerator_allocated_bytes", sum(allocated))
+
+        if self.high_watermark_mb is not None and rss is not None:
+            rss_mb = rss / (1024 * 1024)
+            if rss_mb > self.high_watermark_mb:
+                metrics.inc("memory_pressure_total")
+                self._shrink(engines, rss_mb)
+            elif rss_mb < self.high_watermark_mb * self.low_watermark_ratio:
+                self._grow(engines)
+        for service in services:
+            if service.replicas:
+                service.metrics.set("engine_batch_size_s", service.replicas[0].batch_size_s)
+
+        if self.idle_unload_s is not None:
+            for service in services:
+                await service.unload_if_idle(self.idle_unload_s)
+
+    def _shrink(self, engines: List[SenseVoiceEngine], rss_mb: float):
+        for engine in engines:
+            batch_size_s = max(MIN_BATCH_SIZE_S, engine.batch_size_s // 2)
+            merge_length_s = max(MIN_MERGE_LENGTH_S, engine.merge_length_s // 2)
+            if (batch_size_s, merge_length_s) != (engine.batch_size_s, engine.merge_length_s):
+                print(
+                    f"📉 RSS {rss_mb:.0f}MB above {self.high_watermark_mb:g}MB: "
+                    f"batch_size_s {engine.batch_size_s} -> {batch_size_s}, merge_length_s {engine.merge_length_s} -> {merge_length_s}"
+                )
+            engine.batch_size_s, engine.merge_length_s = batch_size_s, merge_length_s
+
+    def _grow(self, engines: List[SenseVoiceEngine]):
+        for engine in engines:
+            engine.batch_size_s = min(BATCH_SIZE_S, engine.batch_size_s * 2)
+            engine.merge_length_s = min(MERGE_LENGTH_S, engine.merge_length_s * 2)
@@ -0,0 +1,93 @@
+import ipaddress
+import json
+import socket
+import time
+import urllib.request
+from typing import Any, Dict, Optional, Sequence
+from urllib.parse import urlsplit
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """不跟随重定向：否则一个公网地址 302 到内网就绕过了地址检查 (3xx 按投递失败处理)"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def check_webhook_url(url: str, allowed_hosts: Optional[Sequence[str]] = None):
+    """
+    检查 webhook 地址，防止把服务当成访问内网的跳板 (SSRF)。
+    allowed_hosts 为 None 时：只允许 http(s)，且主机名解析出的所有地址都必须是公网地址
+    (拒绝回环、私有网段、链路本地 (含云厂商的元数据地址 169.254.169.254)、组播等)；
+    给了 allowed_hosts 时只允许列表里的主机 ("hooks.example.com" 精确匹配，".example.com" 匹配所有子域名)，
+    列表里的主机视为可信，可以是内网地址。
+    解析主机名会阻塞，需要在线程里调用。
+
+    Raises:
+        ValueError: 地址不允许
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("webhook_url must be an http(s) URL.")
+    host = parts.hostname.lower()
+
+    if allowed_hosts is not None:
+        for allowed in allowed_hosts:
+            allowed = allowed.lower()
+            if host == allowed or (allowed.startswith(".") and host.endswith(allowed)):
+                return
+        raise ValueError(f"webhook_url host '{host}' is not in the allowed list.")
+
+    try:
+        infos = socket.getaddrinfo(host, parts.port or (443 if parts.scheme == "https" else 80), proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"webhook_url host '{host}' cannot be resolved.") from e
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0])
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"webhook_url must point to a public address ('{host}' resolves to {address}).")
+
+
+def post_json(
+    url: str,
+    payload: Dict[str, Any],
+    attempts: int = 3,
+    timeout_s: float = 10.0,
+    backoff_s: float = 1.0,
+    allowed_hosts: Optional[Sequence[str]] = None,
+) -> bool:
+    """
+    把任务结果 POST 给客户端的 webhook (同步阻塞，在 Service 专用的 webhook 线程池里调用)。
+    非 2xx 或网络错误时按指数退避重试，最终失败只打日志：结果依然可以通过 GET /v1/jobs/{id}/result 取回。
+    每次投递前重新检查地址 (提交之后 DNS 可能已经指向内网)，不允许的地址不重试。
+
+    Returns:
+        是否投递成功
+    """
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    for attempt in range(attempts):
+        try:
+            check_webhook_url(url, allowed_hosts)
+        except ValueError as e:
+            print(f"⚠️ Webhook {url} refused: {e}")
+            return False
+
+        request = urllib.request.Request(
+            url, data=body, method="POST", headers={"Content-Type": "application/json"}
+        )
+        try:
+            with _opener.open(request, timeout=timeout_s) as response:
+                if 200 <= response.status < 300:
+                    return True
+                error = f"HTTP {response.status}"
+        except Exception as e:
+            error = str(e)
+
+        print(f"⚠️ Webhook {url} failed (attempt {attempt + 1}/{attempts}): {error}")
+        if attempt + 1 < attempts:
+            time.sleep(backoff_s * (2 ** attempt))
+
+    return False
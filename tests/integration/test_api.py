@@ -1,4 +1,5 @@
 import pytest
+import time
 from fastapi.testclient import TestClient
 from unittest.mock import MagicMock, patch
 from src.main import app
@@ -23,10 +24,16 @@ def client(mock_engine_class):
     
     # Mock 推理结果
     mock_instance.transcribe_file.return_value = "Integration Test Result"
+    mock_instance.warmup_results = [{"bucket_s": 1, "cold_ms": 20.0, "warm_ms": 5.0}]
     
     # 2. 启动 Client
     # 使用 with 语句触发 lifespan (startup/shutdown)
+    # 模型在后台加载，等 /readyz 变成 200 再开始测试
     with TestClient(app) as c:
+        for _ in range(100):
+            if c.get("/readyz").status_code == 200:
+                break
+            time.sleep(0.01)
         yield c
 
 def test_health_check(client):
@@ -34,6 +41,62 @@ def test_health_check(client):
     response = client.get("/health")
     assert response.status_code == 200
     assert response.json()["status"] == "healthy"
+    assert "hits" in response.json()["cache"]
+
+def test_probes(client):
+    """测试 /livez 和 /readyz (fixture 已经等到就绪)"""
+    assert client.get("/livez").json() == {"status": "alive"}
+
+    readiness = client.get("/readyz")
+    assert readiness.status_code == 200
+    assert readiness.json()["status"] == "ready"
+    assert readiness.json()["replicas_loaded"] == 1
+    assert readiness.json()["warmup"][0]["warm_ms"] == 5.0
+
+def test_requests_queue_while_loading(mock_engine_class):
+    """测试模型还在加载时：探针立即可用，请求先排队，加载完成后返回结果"""
+    import threading
+
+    release = threading.Event()
+    mock_instance = MagicMock()
+    mock_instance.load.side_effect = lambda: release.wait(5)
+    mock_instance.load_stage = "loading model"
+    mock_instance.transcribe_file.return_value = "Loaded Later"
+    mock_engine_class.return_value = mock_instance
+
+    with TestClient(app) as c:
+        assert c.get("/livez").status_code == 200
+        readiness = c.get("/readyz")
+        assert readiness.status_code == 503
+        assert readiness.json()["status"] == "loading"
+        assert readiness.json()["loading_stage"] == "loading model"
+
+        results = []
+        request = threading.Thread(target=lambda: results.append(
+            c.post("/v1/audio/transcriptions", files={"file": ("test.wav", b"fake audio bytes", "audio/wav")})
+        ))
+        request.start()
+        for _ in range(100):
+            if c.get("/readyz").json()["queue_depth"] == 1:
+                break
+            time.sleep(0.01)
+        assert c.get("/readyz").json()["queue_depth"] == 1
+
+        release.set()
+        request.join(5)
+        assert results[0].status_code == 200
+        assert results[0].json()["text"] == "Loaded Later"
+
+def test_metrics_endpoint(client):
+    """测试 /metrics 返回 Prometheus 文本格式"""
+    client.post("/v1/audio/transcriptions", files={"file": ("test.wav", b"fake audio bytes", "audio/wav")})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    # 每个模型一套队列统计，用 model 标签区分
+    assert 'sensevoice_queue_capacity{model="sensevoice-small"} 50' in response.text
+    assert 'sensevoice_requests_total{model="sensevoice-small",language="auto",response_format="json",status="success"} 1' in response.text
 
 def test_transcribe_endpoint(client):
     """测试转录接口"""
@@ -60,6 +123,73 @@ def test_transcribe_endpoint(client):
     assert "raw_text" in result  # 新增：验证 raw_text 字段
     assert "is_cleaned" in result  # 新增：验证 is_cleaned 字段
 
+def test_transcribe_invalid_pipeline(client):
+    """测试不支持的 pipeline 返回 400"""
+    files = {"file": ("test.wav", b"fake audio bytes", "audio/wav")}
+    response = client.post("/v1/audio/transcriptions", files=files, data={"pipeline": "turbo"})
+    assert response.status_code == 400
+
+def test_async_job_api(client):
+    """测试异步任务：提交立即返回 202，轮询到完成后取结果；未知任务 404，已完成的任务不能取消"""
+    files = {"file": ("job.wav", b"async job bytes", "audio/wav")}
+    response = client.post("/v1/jobs", files=files, data={"language": "zh"})
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+
+    for _ in range(100):
+        status = client.get(f"/v1/jobs/{job_id}").json()
+        if status["status"] == "succeeded":
+            break
+        time.sleep(0.01)
+    assert status["status"] == "succeeded"
+
+    result = client.get(f"/v1/jobs/{job_id}/result")
+    assert result.status_code == 200
+    assert result.json()["text"] == "Integration Test Result"
+
+    assert client.delete(f"/v1/jobs/{job_id}").status_code == 409
+    assert client.get("/v1/jobs/unknown").status_code == 404
+    assert client.post("/v1/jobs", files=files, data={"webhook_url": "ftp://x"}).status_code == 400
+    # SSRF：默认不允许回调内网、回环和云元数据地址
+    assert client.post("/v1/jobs", files=files, data={"webhook_url": "http://169.254.169.254/latest"}).status_code == 400
+
+def test_upload_too_large(client):
+    """测试超过上传大小上限返回 413"""
+    client.app.state.service.uploads.max_bytes = 8
+    files = {"file": ("big.wav", b"more than eight bytes", "audio/wav")}
+    assert client.post("/v1/audio/transcriptions", files=files).status_code == 413
+    assert client.post("/v1/jobs", files=files).status_code == 413
+
+def test_deadline_admission(client):
+    """测试音频本身就比截止时间长时 422 (不可重试)；默认截止时间不拒绝长音频"""
+    client.app.state.service.rtf_estimate = 10.0   # 时长未知按 60s 估算，推理需要 600s
+    files = {"file": ("test.wav", b"fake audio bytes", "audio/wav")}
+    response = client.post("/v1/audio/transcriptions", files=files, data={"deadline_s": "5"})
+    assert response.status_code == 422
+    assert "Retry-After" not in response.headers
+    assert client.post("/v1/audio/transcriptions", files=files, data={"deadline_s": "0"}).status_code == 422
+    # 600s > 默认截止时间 300s，但没有积压，照常处理
+    assert client.post("/v1/audio/transcriptions", files=files).status_code == 200
+
+def test_model_routing(client, mock_engine_class):
+    """测试按 model 字段路由：其他模型按需加载，别名落到默认模型，不认识的模型返回 400"""
+    files = {"file": ("test.wav", b"fake audio bytes", "audio/wav")}
+    assert client.get("/health").json()["models"]["paraformer-zh"]["state"] == "unloaded"
+
+    response = client.post("/v1/audio/transcriptions", files=files, data={"model": "paraformer-zh"})
+    assert response.status_code == 200
+    assert client.get("/health").json()["models"]["paraformer-zh"]["state"] == "loaded"
+    assert any(call.kwargs.get("model_id") == "paraformer-zh" for call in mock_engine_class.call_args_list)
+    assert 'sensevoice_requests_total{model="paraformer-zh",' in client.get("/metrics").text
+
+    job = client.post("/v1/jobs", files=files, data={"model": "paraformer-zh"}).json()
+    assert client.get(f"/v1/jobs/{job['id']}").status_code == 200
+
+    assert client.post("/v1/audio/transcriptions", files=files, data={"model": "whisper-1"}).status_code == 200
+    response = client.post("/v1/audio/transcriptions", files=files, data={"model": "whisper-large"})
+    assert response.status_code == 400
+    assert "sensevoice-small" in response.json()["detail"]
+
 def test_transcribe_no_file(client):
     """测试缺少文件的情况"""
     response = client.post("/v1/audio/transcriptions", data={"language": "zh"})
@@ -100,3 +230,111 @@ def test_transcribe_default_clean_tags(client):
     assert result["text"] == "Integration Test Result"
     assert result["is_cleaned"] is True  # 默认应该清理
     assert "raw_text" in result
+
+def test_transcribe_reports_detected_language(client, mock_engine_class):
+    """测试 language 字段返回模型识别出的语言，并附带情感和音频事件"""
+    mock_engine_class.return_value.transcribe_file.return_value = "<|en|><|HAPPY|><|Laughter|><|withitn|>Hello."
+    files = {"file": ("test.wav", b"fake audio bytes", "audio/wav")}
+    result = client.post("/v1/audio/transcriptions", files=files, data={"language": "auto"}).json()
+
+    assert result["text"] == "Hello."
+    assert result["language"] == "en"
+    assert result["emotion"] == "HAPPY"
+    assert result["events"] == ["Laughter"]
+
+def test_transcribe_verbose_json(client, mock_engine_class):
+    """测试 verbose_json：返回分段时间戳，duration 为音频时长"""
+    import io
+    import wave
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(b"\x00\x00" * 16000 * 3)   # 3 秒静音
+
+    def fake_segments(model_input, on_segment=None, **kwargs):
+        on_segment({"start": 0.5, "end": 2.5, "text": "<|zh|>你好。"})
+
+    mock_engine_class.return_value.transcribe_segments.side_effect = fake_segments
+
+    files = {"file": ("test.wav", buffer.getvalue(), "audio/wav")}
+    response = client.post(
+        "/v1/audio/transcriptions", files=files, data={"language": "zh", "response_format": "verbose_json"}
+    )
+
+    assert response.status_code == 200
+    result = response.json()
+    assert result["duration"] == pytest.approx(3.0)
+    assert result["segments"] == [{"id": 0, "start": 0.5, "end": 2.5, "text": "你好。"}]
+
+def test_transcribe_sse_stream(client, mock_engine_class):
+    """测试 stream=true：返回 text/event-stream，逐段推送后发送 done"""
+    import json
+
+    def fake_segments(model_input, on_segment=None, **kwargs):
+        for segment in [{"start": 0.0, "end": 2.0, "text": "<|zh|>你好。"}, {"start": 2.0, "end": 4.0, "text": "<|zh|>世界。"}]:
+            on_segment(segment)
+
+    mock_engine_class.return_value.transcribe_segments.side_effect = fake_segments
+
+    files = {"file": ("long.m4a", b"fake audio bytes", "audio/mp4")}
+    response = client.post("/v1/audio/transcriptions", files=files, data={"language": "zh", "stream": "true"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+
+    assert [name for name, _ in events] == ["segment", "segment", "done"]
+    assert events[0][1] == {"id": 0, "start": 0.0, "end": 2.0, "text": "你好。"}
+    assert events[2][1]["text"] == "你好。 世界。"
+    assert len(events[2][1]["segments"]) == 2
+
+def test_stream_websocket(client, mock_engine_class):
+    """测试 WebSocket 流式转录：语音段结束即返回 final，结束时返回 done"""
+    import numpy as np
+
+    mock_instance = mock_engine_class.return_value
+    mock_instance.detect_speech_stream.side_effect = [[[0, -1]], [[-1, 200]], []]
+    mock_instance.transcribe_array.return_value = "<|zh|><|NEUTRAL|>你好"
+
+    chunk = np.zeros(1600, dtype="<i2").tobytes()  # 100ms
+    with client.websocket_connect("/v1/audio/stream?language=zh&partial_interval_s=0") as ws:
+        ws.send_bytes(chunk)
+        ws.send_bytes(chunk)
+        final = ws.receive_json()
+        ws.send_text("end")
+        done = ws.receive_json()
+
+    assert final["type"] == "final"
+    assert final["text"] == "你好"
+    assert (final["start"], final["end"]) == (0.0, 0.2)
+    assert done == {"type": "done", "text": "你好"}
+
+
+def test_stream_websocket_end_frame_is_exact(client, mock_engine_class):
+    """只有 "end" / {"event": "end"} 结束会话；"endpoint"、{"event": "append"} 这类文本帧被忽略"""
+    import numpy as np
+
+    mock_instance = mock_engine_class.return_value
+    mock_instance.detect_speech_stream.side_effect = [[[0, -1]], [[-1, 200]], []]
+    mock_instance.transcribe_array.return_value = "<|zh|><|NEUTRAL|>你好"
+
+    chunk = np.zeros(1600, dtype="<i2").tobytes()
+    with client.websocket_connect("/v1/audio/stream?language=zh&partial_interval_s=0") as ws:
+        ws.send_bytes(chunk)
+        ws.send_text("endpoint")
+        ws.send_text('{"event": "append", "note": "end"}')
+        ws.send_bytes(chunk)
+        final = ws.receive_json()
+        ws.send_text('{"event": "end"}')
+        done = ws.receive_json()
+
+    assert final["type"] == "final"
+    assert final["text"] == "你好"
+    assert done == {"type": "done", "text": "你好"}
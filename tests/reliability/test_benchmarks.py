@@ -0,0 +1,87 @@
+import pytest
+from benchmarks.audio import AudioLibrary, sample_durations, synth_wav
+from benchmarks.backends import corpus_cer, load_test_set, measure_engine, model_weights_mb, summarize
+from benchmarks.fake_engine import FakeEngine
+from benchmarks.load import build_app, in_process_client, run_open_loop
+from src.adapters.audio import decode_audio
+
+@pytest.mark.asyncio
+class TestBenchmarkSuite:
+    """
+    压测套件的冒烟测试：保证 benchmarks/ 跟得上服务接口的变化 (数值本身不做断言)
+    """
+
+    async def test_synthetic_audio_is_deterministic(self):
+        assert synth_wav(0.5) == synth_wav(0.5)
+        samples, sample_rate = decode_audio(synth_wav(0.5))
+        assert sample_rate == 16000 and len(samples) == 8000
+        assert sample_durations("mixed", 20, seed=1) == sample_durations("mixed", 20, seed=1)
+        # nonce 改变内容哈希，避免命中结果缓存
+        library = AudioLibrary()
+        assert library.get(1.0, nonce=1) != library.get(1.0, nonce=2)
+
+    async def test_open_loop_in_process(self):
+        """跑一个极小的场景：队列很小、到达率很高，应该同时看到成功和 503"""
+        app = build_app(FakeEngine(rtf=0.05, overhead_s=0.02), max_queue_size=1)
+        service = app.state.service
+        await service.start_worker()
+        try:
+            async with in_process_client(app) as client:
+                report = await run_open_loop(client, rate_rps=40, duration_s=0.5, mix="short", seed=3)
+        finally:
+            await service.stop_worker()
+
+        summary = report.summary()
+        assert summary["requests"] == 20
+        assert summary["ok"] > 0
+        assert summary["rejected_rate"] > 0
+        assert summary["error_rate"] == 0
+        assert summary["p50_s"] <= summary["p99_s"]
+
+    async def test_backend_comparison_on_fake_engine(self, tmp_path):
+        """后端对比脚本：测试集读取、CER 计算和汇总行 (用假引擎代替真实后端)"""
+        for name, duration in (("a", 0.5), ("b", 1.0)):
+            (tmp_path / f"{name}.wav").write_bytes(synth_wav(duration))
+        (tmp_path / "a.txt").write_text("fake transcript of 0.5s", encoding="utf-8")
+        (tmp_path / "notes.md").write_text("ignored", encoding="utf-8")
+
+        samples = load_test_set(str(tmp_path))
+        assert [reference for _, reference in samples] == ["fake transcript of 0.5s", None]
+        # 标签、标点、空白和大小写不计入字错
+        assert corpus_cer([("你好，世界", "<|zh|><|NEUTRAL|><|Speech|><|woitn|>你好世界")]) == 0
+        assert corpus_cer([("abcd", "abed")]) == pytest.approx(0.25)
+
+        measurement = measure_engine(FakeEngine(rtf=0.01, overhead_s=0.0), [path for path, _ in samples])
+        row = summarize("fake", measurement, samples, threads=2, baseline=measurement)
+        assert row["files"] == 2
+        assert row["audio_s"] == pytest.approx(1.5)
+        assert row["cer"] == 0 and row["cer_vs_baseline"] == 0
+        assert row["speedup"] == pytest.approx(1.0)
+        assert row["p50_s"] <= row["p95_s"]
+        assert row["weights_mb"] is None  # 假引擎没有真实的子模型
+
+
+class TestBackendWeights:
+    """
+    benchmarks/backends.py 的权重统计 (同步测试，不继承上面的 asyncio 标记)
+    """
+
+    def test_weights_count_the_swapped_in_model(self):
+        """weights MB 统计替换后实际在用的子模型：int8 量化的 Linear 按 int8 权重算，ONNX 会话统计不到"""
+        import torch
+        from types import SimpleNamespace
+        from src.core.backends import OnnxSenseVoiceModel, QuantizedSenseVoiceEngine
+
+        engine = QuantizedSenseVoiceEngine(backend="int8")
+        fp32 = torch.nn.Linear(256, 256)
+        engine.model = SimpleNamespace(model=fp32, vad_model=None, punc_model=None)
+        fp32_mb = model_weights_mb(engine)
+        assert fp32_mb == pytest.approx((256 * 256 + 256) * 4 / (1024 * 1024))
+
+        engine.model.model = torch.ao.quantization.quantize_dynamic(
+            torch.nn.Sequential(torch.nn.Linear(256, 256)), {torch.nn.Linear}, dtype=torch.qint8
+        )
+        assert model_weights_mb(engine) < fp32_mb / 3
+
+        engine.model.model = OnnxSenseVoiceModel(session=None)
+        assert model_weights_mb(engine) is None
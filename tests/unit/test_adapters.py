@@ -1,5 +1,11 @@
 import pytest
-from src.adapters.text import clean_sensevoice_tags
+import subprocess
+import sys
+import wave
+import numpy as np
+from src.adapters.text import clean_sensevoice_tags, parse_sensevoice_output, parse_sensevoice_batch
+from unittest.mock import patch
+from src.adapters.audio import probe_duration, pcm_to_float32, merge_vad_segments, synth_speech_like, decode_file
 
 class TestTextAdapter:
     """
@@ -47,3 +53,157 @@ class TestTextAdapter:
         expected = "你好，世界。Hello, World."
         assert clean_sensevoice_tags(raw_text) == expected
 
+    def test_structured_tags(self):
+        """测试清洗的同时提取语言、情感、音频事件和 ITN 标记 (带空格的标签也能识别)"""
+        parsed = parse_sensevoice_output("<|en|><|HAPPY|><|BGM|><|withitn|>Hi. < | S pe ech | ><|zh|><|BGM|>你好")
+        assert parsed.text == "Hi. 你好"
+        assert parsed.tags.language == "en"   # 多个片段时取第一个
+        assert parsed.tags.emotion == "HAPPY"
+        assert parsed.tags.events == ["BGM", "Speech"]
+        assert parsed.tags.itn is True
+
+        raw_text = "<|ja|><|woitn|>テスト"
+        parsed = parse_sensevoice_output(raw_text, clean_tags=False)
+        assert parsed.text == raw_text
+        assert parsed.tags.language == "ja" and parsed.tags.itn is False
+        assert parse_sensevoice_output("plain").tags.language is None
+
+    def test_batch_matches_single(self):
+        """测试批量清洗与逐段清洗结果一致，分段之间互不影响"""
+        texts = ["<|zh|><|NEUTRAL|>你好，，", "，世界。。  ", "", None, "<|en|><|Laughter|>Hi.. there"]
+        batch = parse_sensevoice_batch(texts)
+        assert batch == [parse_sensevoice_output(text) for text in texts]
+        assert [segment.text for segment in batch] == ["你好，", "，世界。", "", "", "Hi. there"]
+        assert batch[4].tags.events == ["Laughter"]
+        assert [segment.text for segment in parse_sensevoice_batch(texts[:1], clean_tags=False)] == texts[:1]
+
+
+class TestAudioAdapter:
+    """
+    测试 src/adapters/audio.py 中的音频探测逻辑
+    """
+
+    def test_probe_wav_duration(self, tmp_path):
+        """测试从 WAV 文件头读取时长"""
+        file_path = tmp_path / "two_seconds.wav"
+        with wave.open(str(file_path), "w") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(16000)
+            wav_file.writeframes(b"\x00\x00" * 32000)
+
+        assert probe_duration(str(file_path)) == pytest.approx(2.0)
+
+    def test_probe_mp4_duration(self, tmp_path):
+        """测试从 MP4 (m4a) 的 moov/mvhd 读取时长，moov 在 mdat 之后也能找到"""
+        import struct
+
+        def box(box_type, payload):
+            return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+        # mvhd v0: version/flags, creation, modification, timescale=1000, duration=90500
+        mvhd = box(b"mvhd", b"\x00\x00\x00\x00" + struct.pack(">IIII", 0, 0, 1000, 90500) + b"\x00" * 80)
+        data = box(b"ftyp", b"M4A \x00\x00\x00\x00") + box(b"mdat", b"\xff" * 64) + box(b"moov", mvhd)
+        file_path = tmp_path / "voice.m4a"
+        file_path.write_bytes(data)
+
+        assert probe_duration(str(file_path)) == pytest.approx(90.5)
+
+    def test_probe_unknown_format(self, tmp_path):
+        """测试无法识别的格式返回 None"""
+        file_path = tmp_path / "garbage.mp3"
+        file_path.write_bytes(b"fake audio bytes")
+
+        assert probe_duration(str(file_path)) is None
+
+    def test_decode_file_resamples_to_target_rate(self, tmp_path):
+        """测试解码进程池用的 decode_file：立体声 8kHz wav 转成单声道 16kHz float32"""
+        file_path = tmp_path / "stereo_8k.wav"
+        with wave.open(str(file_path), "w") as wav_file:
+            wav_file.setnchannels(2)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(8000)
+            wav_file.writeframes(np.full(8000 * 2, 16384, dtype="<i2").tobytes())
+
+        samples, sample_rate = decode_file(str(file_path), target_rate=16000)
+
+        assert sample_rate == 16000
+        assert samples.dtype == np.float32
+        assert samples.ndim == 1
+        assert len(samples) == 16000
+
+    def test_decode_file_without_ffmpeg(self, tmp_path):
+        """测试 libsndfile 读不了、又没有 ffmpeg 时明确报错"""
+        file_path = tmp_path / "garbage.m4a"
+        file_path.write_bytes(b"fake audio bytes")
+
+        with patch("src.adapters.audio.shutil.which", return_value=None):
+            with pytest.raises(RuntimeError, match="ffmpeg not found"):
+                decode_file(str(file_path))
+
+    def test_heavy_imports_are_lazy(self):
+        """测试导入服务入口不会带上 torch / funasr / scipy (冷启动时间)，scipy 留到第一次重采样时才导入"""
+        code = "import sys, src.main; print(sorted(m for m in ('torch', 'funasr', 'scipy') if m in sys.modules))"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        assert output.strip() == "[]"
+
+    def test_pcm_s16le_conversion(self):
+        """测试 16-bit PCM 转 float32"""
+        data = np.array([0, 16384, -32768], dtype="<i2").tobytes()
+        samples = pcm_to_float32(data)
+
+        assert samples.dtype == np.float32
+        assert samples.tolist() == [0.0, 0.5, -1.0]
+
+    def test_pcm_invalid_payload(self):
+        """测试非法 PCM 负载报错"""
+        with pytest.raises(ValueError):
+            pcm_to_float32(b"\x00\x00\x00")
+        with pytest.raises(ValueError, match="Unsupported"):
+            pcm_to_float32(b"\x00\x00", encoding="mulaw")
+
+    def test_merge_vad_segments(self):
+        """测试相邻短段合并，且不超过最大跨度、不吞掉段间静音"""
+        segments = [[0, 1000], [1500, 4000], [4200, 9000], [30000, 31000]]
+
+        assert merge_vad_segments(segments, max_length_ms=5000) == [[0, 4000], [4200, 9000], [30000, 31000]]
+        assert merge_vad_segments([], max_length_ms=5000) == []
+
+    def test_synth_speech_like(self):
+        """测试预热用的合成信号：长度正确、可复现、幅度在 [-1, 1] 内、带停顿"""
+        audio = synth_speech_like(3.0, 16000)
+
+        assert audio.dtype == np.float32
+        assert len(audio) == 48000
+        assert np.array_equal(audio, synth_speech_like(3.0, 16000))
+        assert np.abs(audio).max() <= 1.0
+        # 1.7s ~ 2.0s 是停顿，只有很弱的底噪
+        assert np.abs(audio[int(1.8 * 16000):int(1.9 * 16000)]).max() < 0.05
+
+
+class TestMemoryAdapter:
+    """
+    测试 src/adapters/memory.py 中的 RSS 读取
+    """
+
+    def test_reads_current_rss(self):
+        """测试读到的是当前 RSS：释放一大块内存后读数会回落 (峰值 RSS 不会)"""
+        from src.adapters.memory import process_rss_bytes
+
+        if process_rss_bytes() is None:
+            pytest.skip("current RSS is not available on this platform")
+        block = np.ones(64 * 1024 * 1024, dtype=np.uint8)
+        with_block = process_rss_bytes()
+        del block
+        assert process_rss_bytes() < with_block
+
+    def test_no_current_rss_returns_none(self):
+        """测试拿不到当前 RSS 时返回 None，而不是退化成只增不减的峰值"""
+        from src.adapters import memory
+
+        with patch.object(sys, "platform", "linux"), patch("src.adapters.memory.open", side_effect=OSError, create=True):
+            assert memory.process_rss_bytes() is None
+        if sys.platform != "darwin":
+            # 走 macOS 分支，但这里的 libc 没有 mach_task_self_：同样返回 None
+            with patch.object(sys, "platform", "darwin"):
+                assert memory.process_rss_bytes() is None
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+import torch
+from unittest.mock import MagicMock, patch
+
+from src.core.backends import OnnxSenseVoiceModel, QuantizedSenseVoiceEngine
+
+
+class TestQuantizedBackends:
+    """
+    测试 src/core/backends.py
+    Mock 掉 funasr.AutoModel 和 funasr_onnx，不加载真实模型
+    """
+
+    @pytest.fixture
+    def mock_auto_model(self):
+        with patch("src.core.engine.AutoModel") as mock:
+            yield mock
+
+    @pytest.fixture
+    def onnx_session(self):
+        """funasr_onnx.SenseVoiceSmall：返回带标签的原始文本 (内容为样本数，便于核对)"""
+        session = MagicMock(side_effect=lambda waveform, **kwargs: [f"<|zh|><|NEUTRAL|>{len(waveform)}"])
+        with patch("src.core.backends.SenseVoiceSmallOnnx", return_value=session) as onnx_class:
+            onnx_class.session = session
+            yield onnx_class
+
+    def test_backend_is_validated(self):
+        with pytest.raises(ValueError):
+            QuantizedSenseVoiceEngine(backend="torch")
+        with pytest.raises(ValueError):
+            QuantizedSenseVoiceEngine(backend="fp16")
+
+    def test_int8_quantizes_linear_layers(self, mock_auto_model):
+        """测试 int8 后端：强制 CPU，ASR 子模型的 Linear 换成动态量化版本，VAD/标点照常加载"""
+        mock_auto_model.return_value.model = torch.nn.Sequential(torch.nn.Linear(8, 8), torch.nn.ReLU())
+        engine = QuantizedSenseVoiceEngine(backend="int8")
+        engine.load(warmup=False)
+
+        assert engine.device == "cpu"
+        assert mock_auto_model.call_args.kwargs["device"] == "cpu"
+        assert mock_auto_model.call_args.kwargs["vad_model"] == "fsmn-vad"
+        assert isinstance(engine.model.model[0], torch.ao.nn.quantized.dynamic.Linear)
+        assert engine.model.model(torch.randn(2, 8)).shape == (2, 8)
+
+    def test_onnx_replaces_asr_model(self, mock_auto_model, onnx_session):
+        """测试 onnx 后端：按线程数创建 onnxruntime 会话，替换 ASR 子模型，推理接口不变"""
+        engine = QuantizedSenseVoiceEngine(backend="onnx", num_threads=2)
+        engine.load(warmup=False)
+
+        onnx_session.assert_called_once_with("iic/SenseVoiceSmall", quantize=True, intra_op_num_threads=2)
+        model = engine.model.model
+        assert isinstance(model, OnnxSenseVoiceModel)
+
+        results, meta = model.inference(
+            data_in=[np.zeros(1600, dtype=np.float32), torch.zeros(3200), np.zeros(0, dtype=np.float32)],
+            key=["a", "b", "c"],
+            language="zh",
+            use_itn=True,
+        )
+        assert results == [
+            {"key": "a", "text": "<|zh|><|NEUTRAL|>1600"},
+            {"key": "b", "text": "<|zh|><|NEUTRAL|>3200"},
+            {"key": "c", "text": ""},   # 空片段不调用 onnxruntime
+        ]
+        assert meta["batch_data_time"] == pytest.approx(0.3)
+        assert onnx_session.session.call_args.kwargs == {"language": "zh", "textnorm": "withitn"}
+
+    def test_onnx_model_runs_inside_funasr(self, onnx_session):
+        """测试包装后的模型可以直接交给 FunASR 的 AutoModel.inference (generate / 分段推理都经过这里)"""
+        from funasr import AutoModel
+
+        auto_model = AutoModel.__new__(AutoModel)
+        auto_model.kwargs = {"disable_pbar": True}
+        model = OnnxSenseVoiceModel(onnx_session.return_value)
+        res = AutoModel.inference(
+            auto_model, np.zeros(16000, dtype=np.float32), model=model,
+            kwargs={"batch_size": 1, "disable_pbar": True}, language="auto", use_itn=False,
+        )
+        assert [item["text"] for item in res] == ["<|zh|><|NEUTRAL|>16000"]
+        assert onnx_session.session.call_args.kwargs == {"language": "auto", "textnorm": "woitn"}
+
+    def test_onnx_requires_optional_dependency(self, mock_auto_model):
+        """测试没装 funasr-onnx 时加载失败并提示安装"""
+        with patch.dict("sys.modules", {"funasr_onnx": None}):
+            engine = QuantizedSenseVoiceEngine(backend="onnx")
+            with pytest.raises(RuntimeError, match="funasr-onnx"):
+                engine.load(warmup=False)
+        assert engine.load_stage == "failed"
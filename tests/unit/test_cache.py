@@ -0,0 +1,75 @@
+import pytest
+from unittest.mock import patch
+from src.services.cache import TranscriptionCache
+
+class TestTranscriptionCache:
+    """
+    测试 src/services/cache.py 中的两级结果缓存
+    """
+
+    def test_key_depends_on_audio_and_params(self):
+        """测试 key 由音频内容和影响输出的参数共同决定"""
+        base = TranscriptionCache.make_key(b"audio", {"language": "zh"}, "model-a")
+
+        assert base == TranscriptionCache.make_key(b"audio", {"language": "zh"}, "model-a")
+        assert base != TranscriptionCache.make_key(b"other", {"language": "zh"}, "model-a")
+        assert base != TranscriptionCache.make_key(b"audio", {"language": "en"}, "model-a")
+        assert base != TranscriptionCache.make_key(b"audio", {"language": "zh", "clean_tags": False}, "model-a")
+        assert base != TranscriptionCache.make_key(b"audio", {"language": "zh"}, "model-b")
+        assert base != TranscriptionCache.make_key(b"audio", {"language": "zh", "response_format": "verbose_json"}, "model-a")
+        assert base != TranscriptionCache.make_key(b"audio", {"language": "zh", "pipeline": "asr"}, "model-a")
+
+    def test_hit_and_miss_counters(self):
+        """测试命中/未命中统计"""
+        cache = TranscriptionCache(max_entries=4)
+
+        assert cache.get("k") is None
+        cache.put("k", {"text": "hello"})
+        assert cache.get("k") == {"text": "hello"}
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["entries"] == 1
+
+    def test_lru_eviction(self):
+        """测试超过容量时淘汰最久未使用的条目"""
+        cache = TranscriptionCache(max_entries=2)
+        cache.put("a", {"text": "A"})
+        cache.put("b", {"text": "B"})
+        cache.get("a")  # a 变成最近使用
+        cache.put("c", {"text": "C"})
+
+        assert cache.get("b") is None
+        assert cache.get("a") == {"text": "A"}
+        assert cache.get("c") == {"text": "C"}
+
+    def test_ttl_expiry(self):
+        """测试过期条目不再命中"""
+        cache = TranscriptionCache(ttl_s=10)
+        with patch("src.services.cache.time.time", return_value=1000.0):
+            cache.put("k", {"text": "old"})
+        with patch("src.services.cache.time.time", return_value=1005.0):
+            assert cache.get("k") == {"text": "old"}
+        with patch("src.services.cache.time.time", return_value=1011.0):
+            assert cache.get("k") is None
+
+    def test_sqlite_tier_survives_restart(self, tmp_path):
+        """测试 SQLite 层在"重启" (新建实例) 后依然命中"""
+        db_path = str(tmp_path / "cache.db")
+        cache = TranscriptionCache(sqlite_path=db_path)
+        cache.put("k", {"text": "persisted", "duration": 1.5})
+        cache.close()
+
+        restarted = TranscriptionCache(sqlite_path=db_path)
+        assert restarted.get("k") == {"text": "persisted", "duration": 1.5}
+        assert restarted.stats()["disk_hits"] == 1
+        restarted.close()
+
+    def test_returned_result_is_a_copy(self):
+        """测试调用方修改返回值不会污染缓存"""
+        cache = TranscriptionCache()
+        cache.put("k", {"text": "hello"})
+        cache.get("k")["text"] = "mutated"
+
+        assert cache.get("k") == {"text": "hello"}
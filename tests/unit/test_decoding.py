@@ -0,0 +1,38 @@
+import asyncio
+import wave
+import numpy as np
+import pytest
+from src.services.decoding import DecodePool
+
+
+@pytest.mark.asyncio
+class TestDecodePool:
+    """
+    测试 src/services/decoding.py
+    用 fork 启动子进程，避免 spawn 重新导入整个测试环境
+    """
+
+    async def test_decode_in_subprocess(self, tmp_path):
+        """测试子进程把 44.1kHz wav 解码成 16kHz float32"""
+        file_path = tmp_path / "tone.wav"
+        with wave.open(str(file_path), "w") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(44100)
+            wav_file.writeframes(np.zeros(44100, dtype="<i2").tobytes())
+
+        pool = DecodePool(workers=1, start_method="fork")
+        pool.start()
+        try:
+            samples, sample_rate = await asyncio.wait_for(pool.decode(str(file_path)), timeout=30)
+        finally:
+            pool.shutdown()
+
+        assert sample_rate == 16000
+        assert len(samples) == 16000
+        assert samples.dtype == np.float32
+
+    async def test_decode_before_start(self):
+        """测试未启动时解码直接报错"""
+        with pytest.raises(RuntimeError, match="not started"):
+            await DecodePool().decode("missing.wav")
@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 from unittest.mock import MagicMock, patch
 from src.core.engine import SenseVoiceEngine
 
@@ -50,6 +51,46 @@ class TestSenseVoiceEngine:
         # 验证 engine.model 是否被赋值
         assert engine.model is not None
 
+    def test_load_model_with_thread_slice(self, mock_auto_model):
+        """测试指定线程数时传给 FunASR 的 ncpu"""
+        SenseVoiceEngine(device="cpu", num_threads=3).load()
+        assert mock_auto_model.call_args.kwargs["ncpu"] == 3
+
+        SenseVoiceEngine(device="cpu").load()
+        assert "ncpu" not in mock_auto_model.call_args.kwargs
+
+    def test_warmup_buckets(self, mock_auto_model):
+        """测试预热：每个时长档位合成对应长度的音频，完整流水线各跑两遍 (冷/热)"""
+        mock_instance = MagicMock()
+        mock_instance.generate.return_value = [{"text": "warm"}]
+        mock_auto_model.return_value = mock_instance
+
+        engine = SenseVoiceEngine(device="cpu", warmup_buckets_s=(1, 3))
+        engine.load()
+
+        inputs = [call.kwargs["input"] for call in mock_instance.generate.call_args_list]
+        assert [len(audio) for audio in inputs] == [16000, 16000, 48000, 48000]
+        assert [r["bucket_s"] for r in engine.warmup_results] == [1, 3]
+        assert all("cold_ms" in r and "warm_ms" in r for r in engine.warmup_results)
+        assert engine.load_stage == "ready"
+
+        # 空闲卸载后按需重新加载时跳过预热
+        engine.release()
+        mock_instance.generate.reset_mock()
+        engine.load(warmup=False)
+        mock_instance.generate.assert_not_called()
+        assert engine.load_stage == "ready"
+
+    def test_warmup_failure_does_not_block_load(self, mock_auto_model):
+        """测试预热失败只记录错误，模型照常可用"""
+        mock_auto_model.return_value.generate.side_effect = RuntimeError("boom")
+
+        engine = SenseVoiceEngine(device="cpu", warmup_buckets_s=(1,))
+        engine.load()
+
+        assert engine.model is not None
+        assert engine.warmup_results == [{"bucket_s": 1, "error": "boom"}]
+
     def test_load_model_idempotency(self, mock_auto_model):
         """测试重复加载（幂等性）"""
         engine = SenseVoiceEngine()
@@ -90,6 +131,14 @@ class TestSenseVoiceEngine:
         assert call_kwargs["input"] == "test.wav"
         assert call_kwargs["language"] == "en"
         assert call_kwargs["use_itn"] is True
+        assert call_kwargs["batch_size_s"] == 60
+        assert call_kwargs["merge_length_s"] == 15
+
+        # 看门狗调小分批参数后，下一次推理立即生效
+        engine.batch_size_s, engine.merge_length_s = 30, 7
+        engine.transcribe_file("test.wav")
+        assert mock_instance.generate.call_args.kwargs["batch_size_s"] == 30
+        assert mock_instance.generate.call_args.kwargs["merge_length_s"] == 7
 
     def test_transcribe_language_fallback(self, mock_auto_model):
         """测试语言参数回退逻辑"""
@@ -160,3 +209,255 @@ class TestSenseVoiceEngine:
         mock_torch.mps.empty_cache.assert_called()
         mock_gc.collect.assert_called_once()
 
+    def test_fast_path_pipelines(self, mock_auto_model):
+        """测试快速通道：跳过 VAD 直接调用 ASR 子模型，asr_punc 再过一遍标点"""
+        mock_instance = MagicMock()
+        mock_auto_model.return_value = mock_instance
+
+        def fake_inference(model_input, model=None, kwargs=None, **cfg):
+            if model is mock_instance.punc_model:
+                return [{"text": model_input + "。"}]
+            return [{"key": "k", "text": "打开灯"}]
+
+        mock_instance.inference.side_effect = fake_inference
+
+        engine = SenseVoiceEngine(device="cpu")
+        engine.load()
+        samples = np.zeros(16000, dtype=np.float32)
+
+        assert engine.transcribe_array(samples, pipeline="asr") == "打开灯"
+        assert engine.transcribe_array(samples, pipeline="asr_punc") == "打开灯。"
+        mock_instance.generate.assert_not_called()
+        assert mock_instance.inference.call_args_list[0].kwargs["model"] is mock_instance.model
+
+        with pytest.raises(ValueError, match="Unknown pipeline"):
+            engine.transcribe_array(samples, pipeline="turbo")
+
+    def test_transcribe_segments_without_vad(self, mock_auto_model):
+        """测试不走 VAD 的流水线：整段音频作为一个分段"""
+        mock_instance = MagicMock()
+        mock_instance.inference.return_value = [{"text": "整段"}]
+        mock_auto_model.return_value = mock_instance
+
+        engine = SenseVoiceEngine(device="cpu")
+        engine.load()
+
+        segments = engine.transcribe_segments(np.zeros(24000, dtype=np.float32), pipeline="asr")
+        assert segments == [{"start": 0.0, "end": 1.5, "text": "整段"}]
+        assert mock_instance.inference.call_count == 1  # 只有 ASR，没有 VAD 和标点
+
+    def test_transcribe_batch_packs_segments(self, mock_auto_model):
+        """测试批量推理：每个输入各跑一次 VAD，所有语音段合成一次 ASR 前向，静音输入返回空串"""
+        mock_instance = MagicMock()
+        mock_auto_model.return_value = mock_instance
+        vad_results = {16000: [[0, 400], [600, 1000]], 32000: [], 48000: [[0, 3000]]}
+
+        def fake_inference(model_input, model=None, kwargs=None, **cfg):
+            if model is mock_instance.vad_model:
+                return [{"value": vad_results[len(model_input)]}]
+            if model is mock_instance.punc_model:
+                return [{"text": model_input + "。"}]
+            return [{"text": f"<|zh|>{len(piece)}"} for piece in model_input]
+
+        mock_instance.inference.side_effect = fake_inference
+        engine = SenseVoiceEngine(device="cpu")
+        engine.load()
+        engine.merge_length_s = 0   # 不合并，保留两个语音段
+
+        inputs = [np.zeros(n, dtype=np.float32) for n in (16000, 32000, 48000)]
+        result = engine.transcribe_batch(inputs, language="zh")
+
+        assert result == ["<|zh|>6400 <|zh|>6400。", "", "<|zh|>48000。"]
+        asr_calls = [c for c in mock_instance.inference.call_args_list if c.kwargs["model"] is mock_instance.model]
+        assert len(asr_calls) == 1
+        # 按长度排序打包；CPU 上 AutoModel 默认 batch_size=1，必须显式指定
+        assert [len(piece) for piece in asr_calls[0].args[0]] == [6400, 6400, 48000]
+        assert asr_calls[0].kwargs["kwargs"]["batch_size"] == 3
+        assert asr_calls[0].kwargs["language"] == "zh"
+
+        # batch_size_s 调小 (内存水位) 后拆成多次前向，每包 最长段 x 段数 不超过预算
+        mock_instance.inference.reset_mock()
+        engine.batch_size_s = 1
+        assert engine.transcribe_batch(inputs, language="zh") == result
+        asr_calls = [c for c in mock_instance.inference.call_args_list if c.kwargs["model"] is mock_instance.model]
+        assert [len(c.args[0]) for c in asr_calls] == [2, 1]
+
+    def test_transcribe_batch_shares_forward_pass_in_funasr(self):
+        """
+        在真实的 AutoModel 调度代码里数 ASR 前向次数：
+        generate 在 VAD 流水线上逐个输入处理 (3 次前向)，transcribe_batch 跨输入打包 (1 次)，结果相同
+        """
+        import torch
+        from funasr import AutoModel
+
+        class FakeSubModel:
+            def __init__(self, infer):
+                self.infer = infer
+                self.forwards = []
+
+            def eval(self):
+                return self
+
+            def parameters(self):
+                yield torch.zeros(0)
+
+            def inference(self, data_in, data_lengths=None, key=None, **kwargs):
+                self.forwards.append(len(data_in))
+                return [self.infer(x, k) for x, k in zip(data_in, key)], {"batch_data_time": 1.0}
+
+        vad = FakeSubModel(lambda x, k: {"key": k, "value": [[0, 1000], [1500, len(x) * 1000 // 16000]]})
+        asr = FakeSubModel(lambda x, k: {"key": k, "text": f"<|zh|>{len(x)}"})
+        auto_model = AutoModel.__new__(AutoModel)
+        auto_model.kwargs = {"disable_pbar": True, "device": "cpu", "batch_size": 1, "frontend": None}
+        auto_model.vad_kwargs = {"disable_pbar": True, "device": "cpu"}
+        auto_model.model, auto_model.vad_model, auto_model.punc_model, auto_model.spk_model = asr, vad, None, None
+
+        inputs = [np.zeros(16000 * seconds, dtype=np.float32) for seconds in (3, 4, 5)]
+        expected = [item["text"] for item in auto_model.generate(
+            input=inputs, cache={}, language="auto", use_itn=True, batch_size_s=60, merge_vad=True, merge_length_s=15
+        )]
+        assert asr.forwards == [1, 1, 1]
+
+        asr.forwards.clear()
+        engine = SenseVoiceEngine(device="cpu")
+        engine.model = auto_model
+        assert engine.transcribe_batch(inputs) == expected
+        assert asr.forwards == [3]
+
+    def test_transcribe_batch_empty(self, mock_auto_model):
+        """测试空批次不调用模型"""
+        engine = SenseVoiceEngine(device="cpu")
+        engine.load()
+
+        assert engine.transcribe_batch([]) == []
+        engine.model.generate.assert_not_called()
+        engine.model.inference.assert_not_called()
+
+    def test_transcribe_array_zero_copy(self, mock_auto_model):
+        """测试内存推理：16kHz float32 缓冲区原样透传给模型"""
+        mock_instance = MagicMock()
+        mock_auto_model.return_value = mock_instance
+        mock_instance.generate.return_value = [{"key": "rand_key", "text": "Array"}]
+
+        engine = SenseVoiceEngine(device="cpu")
+        engine.load()
+
+        samples = np.zeros(16000, dtype=np.float32)
+        assert engine.transcribe_array(samples, sample_rate=16000, language="en") == "Array"
+
+        call_kwargs = mock_instance.generate.call_args.kwargs
+        assert np.shares_memory(call_kwargs["input"], samples)
+        assert call_kwargs["language"] == "en"
+
+    def test_transcribe_array_resample(self, mock_auto_model):
+        """测试非 16kHz 的缓冲区会被重采样"""
+        mock_instance = MagicMock()
+        mock_auto_model.return_value = mock_instance
+        mock_instance.generate.return_value = [{"key": "rand_key", "text": "Array"}]
+
+        engine = SenseVoiceEngine(device="cpu")
+        engine.load()
+
+        engine.transcribe_array(np.zeros(8000, dtype=np.float32), sample_rate=8000)
+
+        model_input = mock_instance.generate.call_args.kwargs["input"]
+        assert model_input.shape[0] == 16000
+
+    def test_transcribe_batch_result_mismatch(self, mock_auto_model):
+        """测试 ASR 返回的结果数量对不上时报错 (交给 Service 逐个重试)"""
+        mock_instance = MagicMock()
+        mock_auto_model.return_value = mock_instance
+        mock_instance.inference.return_value = [{"text": "only one"}]
+
+        engine = SenseVoiceEngine(device="cpu")
+        engine.load()
+
+        inputs = [np.zeros(16000, dtype=np.float32), np.zeros(16000, dtype=np.float32)]
+        with pytest.raises(RuntimeError, match="1 result"):
+            engine.transcribe_batch(inputs, pipeline="asr")
+
+    def test_detect_speech_stream(self, mock_auto_model):
+        """测试流式 VAD：懒加载 CPU 上的 fsmn-vad，并透传流状态 cache"""
+        vad_instance = MagicMock()
+        vad_instance.generate.return_value = [{"key": "rand_key", "value": [[120, -1]]}]
+        mock_auto_model.return_value = vad_instance
+
+        engine = SenseVoiceEngine(device="mps")
+        cache = {}
+        samples = np.zeros(3200, dtype=np.float32)
+
+        assert engine.detect_speech_stream(samples, cache) == [[120, -1]]
+        engine.detect_speech_stream(samples, cache, is_final=True)
+
+        # 只加载一次，且固定在 CPU 上
+        mock_auto_model.assert_called_once()
+        assert mock_auto_model.call_args.kwargs["model"] == "fsmn-vad"
+        assert mock_auto_model.call_args.kwargs["device"] == "cpu"
+        call_kwargs = vad_instance.generate.call_args.kwargs
+        assert call_kwargs["cache"] is cache
+        assert call_kwargs["is_final"] is True
+
+    def test_transcribe_segments(self, mock_auto_model):
+        """测试分段推理：VAD 一次，按时间顺序逐段 ASR + 标点，并逐段回调"""
+        mock_instance = MagicMock()
+        mock_auto_model.return_value = mock_instance
+
+        def fake_inference(model_input, model=None, kwargs=None, **cfg):
+            if model is mock_instance.vad_model:
+                return [{"key": "k", "value": [[0, 1000], [20000, 21000]]}]
+            if model is mock_instance.model:
+                return [{"key": "k", "text": f"<|zh|>seg{len(model_input)}"}]
+            return [{"key": "k", "text": model_input + "。"}]  # punc
+
+        mock_instance.inference.side_effect = fake_inference
+
+        engine = SenseVoiceEngine(device="cpu")
+        engine.load()
+
+        received = []
+        segments = engine.transcribe_segments(
+            np.zeros(16000 * 22, dtype=np.float32), language="zh", on_segment=received.append
+        )
+
+        assert segments == [
+            {"start": 0.0, "end": 1.0, "text": "<|zh|>seg16000。"},
+            {"start": 20.0, "end": 21.0, "text": "<|zh|>seg16000。"},
+        ]
+        assert received == segments
+        asr_calls = [c for c in mock_instance.inference.call_args_list if c.kwargs.get("model") is mock_instance.model]
+        assert all(c.kwargs["language"] == "zh" for c in asr_calls)
+
+    def test_transcribe_segments_fanout(self, mock_auto_model):
+        """测试并行分段推理：本进程只跑 VAD，各段分发给 fanout，结果和时间戳按顺序拼回"""
+        from concurrent.futures import Future
+
+        mock_instance = MagicMock()
+        mock_instance.inference.return_value = [{"key": "k", "value": [[0, 10000], [10500, 20000], [20500, 30000]]}]
+        mock_auto_model.return_value = mock_instance
+
+        submitted = []
+
+        class FakeFanout:
+            def submit(self, samples, language, use_itn, pipeline):
+                submitted.append((len(samples), language, pipeline))
+                future = Future()
+                future.set_result(f"chunk{len(submitted)}")
+                return future
+
+        engine = SenseVoiceEngine(device="cpu")
+        engine.load()
+
+        received = []
+        segments = engine.transcribe_segments(
+            np.zeros(16000 * 31, dtype=np.float32), language="ja", on_segment=received.append, fanout=FakeFanout()
+        )
+
+        assert segments == [
+            {"start": 0.0, "end": 10.0, "text": "chunk1"},
+            {"start": 10.5, "end": 20.0, "text": "chunk2"},
+            {"start": 20.5, "end": 30.0, "text": "chunk3"},
+        ]
+        assert received == segments
+        assert submitted == [(160000, "ja", "asr_punc"), (152000, "ja", "asr_punc"), (152000, "ja", "asr_punc")]
+        # 只有 VAD 在本进程里跑
+        assert mock_instance.inference.call_count == 1
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock, patch
+from src.core.fanout import ChunkFanout
+
+
+class TestChunkFanout:
+    """
+    测试 src/core/fanout.py
+    用 fork 启动子进程，让子进程继承被 Mock 掉的 SenseVoiceEngine，不加载真实模型
+    """
+
+    @pytest.fixture
+    def mock_engine_cls(self):
+        with patch("src.core.fanout.SenseVoiceEngine") as mock:
+            engine = MagicMock()
+            engine.transcribe_array.side_effect = lambda samples, language, use_itn, pipeline: f"{language}:{pipeline}:{len(samples)}"
+            mock.return_value = engine
+            yield mock
+
+    def test_submit_before_start(self):
+        """测试未启动时提交任务直接报错"""
+        fanout = ChunkFanout("test/model", workers=2)
+        with pytest.raises(RuntimeError, match="not started"):
+            fanout.submit(np.zeros(10, dtype=np.float32), "zh", True)
+
+    def test_fanout_across_processes(self, mock_engine_cls):
+        """测试子进程各自加载引擎，并按提交顺序返回结果"""
+        fanout = ChunkFanout("test/model", workers=2, num_threads=1, start_method="fork")
+        fanout.start()
+        try:
+            futures = [fanout.submit(np.zeros(n, dtype=np.float32), "zh", True) for n in (100, 200, 300)]
+            assert [future.result(timeout=30) for future in futures] == [
+                "zh:asr_punc:100", "zh:asr_punc:200", "zh:asr_punc:300"
+            ]
+        finally:
+            fanout.shutdown()
+
+    def test_threads_split_across_workers(self):
+        """测试默认按 CPU 核数平分线程"""
+        with patch("src.core.fanout.os.cpu_count", return_value=8):
+            assert ChunkFanout("test/model", workers=4).num_threads == 2
+            assert ChunkFanout("test/model", workers=16).num_threads == 1
@@ -0,0 +1,40 @@
+import os
+from src.services.journal import JobJournal
+
+
+class TestJobJournal:
+    """
+    测试 src/services/journal.py
+    """
+
+    def test_roundtrip(self, tmp_path):
+        """测试落盘、记录、结束后删除音频，并在重新打开后依然可读"""
+        journal = JobJournal(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "spool"))
+        upload = tmp_path / "upload_1.m4a"
+        upload.write_bytes(b"audio bytes")
+        path = journal.spool("job1", str(upload))
+        assert open(path, "rb").read() == b"audio bytes"
+        assert path.endswith("job1.m4a") and not upload.exists()
+
+        journal.add("job1", {"language": "zh"}, path, 12.5, 100.0, "http://client/hook")
+        (tmp_path / "upload_2").write_bytes(b"x")
+        journal.add("job2", {}, journal.spool("job2", str(tmp_path / "upload_2")), None, 50.0)
+
+        pending = journal.pending()
+        assert [row["uid"] for row in pending] == ["job2", "job1"]  # 按提交时间
+        assert pending[1]["params"] == {"language": "zh"}
+        assert pending[1]["webhook_url"] == "http://client/hook"
+
+        journal.finish("job1", "succeeded", {"text": "你好"})
+        assert not os.path.exists(path)
+        journal.close()
+
+        reopened = JobJournal(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "spool"))
+        assert [row["uid"] for row in reopened.pending()] == ["job2"]
+        finished = reopened.finished()
+        assert finished[0]["status"] == "succeeded"
+        assert finished[0]["result"] == {"text": "你好"}
+
+        reopened.remove("job1")
+        assert reopened.finished() == []
+        reopened.close()
@@ -0,0 +1,54 @@
+import pytest
+from src.services.metrics import ServiceMetrics
+
+class TestServiceMetrics:
+    """
+    测试 src/services/metrics.py 中的 Prometheus 文本渲染
+    """
+
+    def test_counter_and_gauge(self):
+        """测试计数器按标签累加，仪表盘直接覆盖"""
+        metrics = ServiceMetrics(namespace="t")
+        metrics.counter("requests_total", "Requests.")
+        metrics.gauge("queue_depth", "Depth.")
+
+        metrics.inc("requests_total", language="zh", status="success")
+        metrics.inc("requests_total", language="zh", status="success")
+        metrics.inc("requests_total", language="en", status="failure")
+        metrics.set("queue_depth", 3)
+        metrics.set("queue_depth", 1)
+
+        text = metrics.render()
+        assert "# TYPE t_requests_total counter" in text
+        assert 't_requests_total{language="zh",status="success"} 2' in text
+        assert 't_requests_total{language="en",status="failure"} 1' in text
+        assert "t_queue_depth 1\n" in text
+        assert metrics.get("requests_total", language="zh", status="success") == 2
+
+    def test_histogram_buckets_are_cumulative(self):
+        """测试直方图：桶计数累积，边界值落在 le 等于它的桶里"""
+        metrics = ServiceMetrics(namespace="t")
+        metrics.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+
+        for value in (0.05, 0.1, 0.5, 5.0):
+            metrics.observe("latency_seconds", value)
+
+        text = metrics.render()
+        assert 't_latency_seconds_bucket{le="0.1"} 2' in text
+        assert 't_latency_seconds_bucket{le="1"} 3' in text
+        assert 't_latency_seconds_bucket{le="+Inf"} 4' in text
+        assert "t_latency_seconds_count 4" in text
+        assert "t_latency_seconds_sum 5.65" in text
+
+    def test_label_values_are_escaped(self):
+        metrics = ServiceMetrics(namespace="t")
+        metrics.counter("errors_total", "Errors.")
+        metrics.inc("errors_total", detail='bad "input"\n')
+
+        assert 't_errors_total{detail="bad \\"input\\"\\n"} 1' in metrics.render()
+
+    def test_type_conflict(self):
+        metrics = ServiceMetrics()
+        metrics.counter("x", "X.")
+        with pytest.raises(ValueError):
+            metrics.gauge("x", "X.")
@@ -0,0 +1,94 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from src.core.pool import EnginePool
+
+class TestEnginePool:
+    """
+    测试 src/core/pool.py
+    用工厂函数返回 Mock 引擎，不加载真实模型
+    """
+
+    @pytest.fixture
+    def factory(self):
+        created = []
+
+        def make_engine(threads):
+            engine = MagicMock()
+            engine.device = "cpu"
+            engine.num_threads = threads
+            created.append(engine)
+            return engine
+
+        make_engine.created = created
+        return make_engine
+
+    def test_default_is_single_replica(self, factory):
+        """测试默认只加载一个副本，且不限制线程数"""
+        pool = EnginePool(engine_factory=factory)
+        pool.load()
+
+        assert len(pool.engines) == 1
+        assert pool.engines[0].num_threads is None
+        pool.engines[0].load.assert_called_once()
+
+    def test_replicas_limited_by_memory_budget(self, factory):
+        """测试副本数受内存预算 / 单副本占用限制，并按上限切分线程"""
+        pool = EnginePool(
+            engine_factory=factory, max_replicas=4, memory_budget_mb=2500,
+            replica_footprint_mb=1000, cpu_count=16
+        )
+        pool.load()
+
+        assert len(pool.engines) == 2
+        assert all(engine.num_threads == 4 for engine in pool.engines)
+
+    def test_progress(self, factory):
+        """测试加载进度：加载前未知，加载完成后报告已加载/计划的副本数"""
+        pool = EnginePool(engine_factory=factory, max_replicas=2, cpu_count=4)
+        assert pool.progress() == {"replicas_loaded": 0, "replicas_planned": None, "loading_stage": None, "warmup": []}
+
+        pool.load()
+        progress = pool.progress()
+        assert progress["replicas_loaded"] == 2
+        assert progress["replicas_planned"] == 2
+        assert progress["loading_stage"] is None
+
+    def test_replicas_limited_by_cpu_count(self, factory):
+        """测试副本数不超过 CPU 核数"""
+        pool = EnginePool(engine_factory=factory, max_replicas=8, cpu_count=3)
+        pool.load()
+
+        assert len(pool.engines) == 3
+
+    def test_measures_footprint_when_unknown(self, factory):
+        """测试未配置单副本占用时，用加载第一个副本前后的 RSS 差值估算"""
+        rss = iter([1000 * 1024 * 1024, 1800 * 1024 * 1024])
+        with patch("src.core.pool.process_rss_bytes", side_effect=lambda: next(rss)):
+            pool = EnginePool(engine_factory=factory, max_replicas=4, memory_budget_mb=2000, cpu_count=8)
+            pool.load()
+
+        assert pool.replica_footprint_mb == pytest.approx(800)
+        assert len(pool.engines) == 2
+
+    def test_accelerator_stays_single_replica(self, factory):
+        """测试 MPS/CUDA 设备不允许多副本 (ADR-001 显存保护)"""
+        def make_mps_engine(threads):
+            engine = factory(threads)
+            engine.device = "mps"
+            return engine
+
+        pool = EnginePool(engine_factory=make_mps_engine, max_replicas=4, cpu_count=8)
+        pool.load()
+
+        assert len(pool.engines) == 1
+
+    def test_release_all(self, factory):
+        """测试释放所有副本"""
+        pool = EnginePool(engine_factory=factory, max_replicas=2, cpu_count=4)
+        pool.load()
+        engines = list(pool.engines)
+        pool.release()
+
+        assert pool.engines == []
+        for engine in engines:
+            engine.release.assert_called_once()
@@ -0,0 +1,31 @@
+import pstats
+from src.core.tracing import JobTrace
+from src.services.profiling import ProfileSampler
+
+class TestProfileSampler:
+    """
+    测试 src/services/profiling.py 中的抽样剖析
+    """
+
+    def test_disabled_by_default(self, tmp_path):
+        sampler = ProfileSampler(str(tmp_path))
+        assert sampler.sample("abc") is False
+
+    def test_sampled_job_writes_prof_and_folded(self, tmp_path):
+        """测试抽中的任务输出 cProfile 和折叠栈文件"""
+        sampler = ProfileSampler(str(tmp_path), sample_rate=1.0)
+        assert sampler.sample("abc") is True
+
+        assert sampler.profile_call("abc", lambda value: value * 2, value=21) == 42
+        trace = JobTrace("abc")
+        trace.finish()
+        sampler.write_trace(trace)
+
+        pstats.Stats(str(tmp_path / "abc.prof"))  # 能被 pstats 读取
+        assert (tmp_path / "abc.folded").read_text().startswith("job ")
+        assert not sampler.is_sampled("abc")
+
+    def test_unsampled_trace_is_ignored(self, tmp_path):
+        sampler = ProfileSampler(str(tmp_path), sample_rate=1.0)
+        sampler.write_trace(JobTrace("other"))
+        assert not (tmp_path / "other.folded").exists()
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+from io import BytesIO
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import UploadFile
+
+from src.core.pool import EnginePool
+from src.services.registry import ModelRegistry, ModelSpec
+from src.services.transcription import TranscriptionService
+
+
+def _upload():
+    return UploadFile(file=BytesIO(b"fake audio"), filename="a.m4a")
+
+
+@pytest.fixture
+def engines():
+    """每个模型 id 对应的 Mock 引擎 (可卸载/重新加载，识别结果为模型 id)"""
+    created = {}
+
+    def make_engine(model_id):
+        engine = MagicMock()
+        engine.model = None
+        engine.model_id = model_id
+        engine.transcribe_file.return_value = model_id
+        engine.load.side_effect = lambda warmup=True: setattr(engine, "model", object())
+        engine.release.side_effect = lambda: setattr(engine, "model", None)
+        created[model_id] = engine
+        return engine
+
+    make_engine.created = created
+    return make_engine
+
+
+def _registry(engines, memory_budget_mb=None, footprint_mb=600):
+    specs = {
+        "small": ModelSpec(model_id="small-id", footprint_mb=footprint_mb),
+        "para": ModelSpec(model_id="para-id", punc_model=None, footprint_mb=footprint_mb),
+    }
+    return ModelRegistry(
+        specs,
+        "small",
+        service_factory=lambda name, spec: TranscriptionService(engine=None, model_id=name, metric_labels={"model": name}),
+        pool_factory=lambda spec: EnginePool(engine_factory=lambda threads: engines(spec.model_id)),
+        memory_budget_mb=memory_budget_mb,
+        aliases={"whisper-1": "small"},
+    )
+
+
+@pytest.mark.asyncio
+class TestModelRegistry:
+    """
+    测试 src/services/registry.py
+    用工厂函数返回 Mock 引擎，不加载真实模型
+    """
+
+    async def test_resolve(self, engines):
+        """测试不填 model 用默认模型，别名映射到目标模型，不认识的名字返回 None"""
+        registry = _registry(engines)
+        assert registry.resolve(None) == "small"
+        assert registry.resolve("whisper-1") == "small"
+        assert registry.resolve("para") == "para"
+        assert registry.resolve("whisper-large") is None
+
+    async def test_routes_to_lazily_loaded_models(self, engines):
+        """测试模型第一次被请求时才加载，请求在各自的队列里排队，结果来自对应的模型"""
+        registry = _registry(engines)
+        assert registry.status()["para"]["state"] == "unloaded"
+
+        try:
+            service = await registry.acquire("para")
+            assert "small-id" not in engines.created
+            result = await service.submit(_upload(), {})
+
+            assert result["text"] == "para-id"
+            assert registry.get("small") is None
+            assert registry.status()["para"]["state"] == "loaded"
+            assert registry.metrics.get("model_loads_total", model="para") == 1
+            # 每个模型一套指标，渲染时用 model 标签区分，同名指标只有一份 HELP
+            service = await registry.acquire("small")
+            await service.submit(_upload(), {})
+            text = registry.render_metrics()
+            assert text.count("# HELP sensevoice_queue_capacity ") == 1
+            assert 'sensevoice_queue_capacity{model="para"} 50' in text
+            assert 'sensevoice_requests_total{model="small",language="auto",response_format="json",status="success"} 1' in text
+        finally:
+            await registry.stop()
+
+    async def test_lru_eviction_within_budget(self, engines):
+        """测试预算只够一个模型时：加载新模型前卸载最久没用过的空闲模型，再次请求时重新加载"""
+        registry = _registry(engines, memory_budget_mb=1000)
+        try:
+            await (await registry.acquire("small")).submit(_upload(), {})
+            await (await registry.acquire("para")).submit(_upload(), {})
+
+            assert engines.created["small-id"].model is None
+            assert registry.metrics.get("model_evictions_total", model="small") == 1
+            assert registry.status()["small"]["state"] == "unloaded"
+
+            # 被淘汰的模型再次被请求：para 让位，small 由 worker 重新加载
+            result = await (await registry.acquire("small")).submit(_upload(), {})
+            assert result["text"] == "small-id"
+            assert engines.created["para-id"].model is None
+            assert registry.metrics.get("model_evictions_total", model="para") == 1
+            engines.created["small-id"].load.assert_called_with(warmup=False)
+        finally:
+            await registry.stop()
+
+    async def test_busy_model_is_not_evicted(self, engines):
+        """测试正在推理的模型不会被淘汰 (暂时超出预算)"""
+        registry = _registry(engines, memory_budget_mb=1000)
+        started, release = threading.Event(), threading.Event()
+        try:
+            await registry.load("small")
+            small = engines.created["small-id"]
+            small.transcribe_file.side_effect = lambda *args, **kwargs: (started.set(), release.wait(5), "slow")[-1]
+
+            pending = asyncio.create_task(registry.get("small").submit(_upload(), {}))
+            await asyncio.to_thread(started.wait, 5)
+            await (await registry.acquire("para")).submit(_upload(), {})
+
+            assert small.model is not None
+            assert registry.metrics.get("model_evictions_total", model="small") is None
+            release.set()
+            assert (await pending)["text"] == "slow"
+        finally:
+            release.set()
+            await registry.stop()
+
+    async def test_failed_load_is_retried(self, engines):
+        """测试加载失败时排队的任务立即失败，下一个请求重新加载"""
+        registry = _registry(engines)
+        service = registry.add("para", TranscriptionService(engine=None, model_id="para"), EnginePool(
+            engine_factory=lambda threads: MagicMock(load=MagicMock(side_effect=RuntimeError("download failed")))
+        ))
+
+        with pytest.raises(RuntimeError, match="download failed"):
+            await registry.load("para")
+        assert registry.status()["para"]["state"] == "failed"
+        pending = asyncio.create_task(service.submit(_upload(), {}))
+        while service.queue.empty():
+            await asyncio.sleep(0.01)
+        await registry.acquire("para")
+        with pytest.raises(RuntimeError, match="Model failed to load"):
+            await asyncio.wait_for(pending, 5)
+        await registry.stop()
+
+    async def test_find_job(self, engines):
+        """测试按异步任务 id 找到所属模型的 Service"""
+        registry = _registry(engines)
+        try:
+            service = await registry.acquire("para")
+            job = await service.submit_job(_upload(), {})
+            assert registry.find_job(job.uid) == (service, job)
+            assert registry.find_job("missing") is None
+            await job.future
+        finally:
+            await registry.stop()
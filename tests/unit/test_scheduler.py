@@ -0,0 +1,64 @@
+import pytest
+import asyncio
+from types import SimpleNamespace
+from src.services.scheduler import ShortestJobFirstQueue
+
+def make_job(uid, audio_duration, received_at):
+    """调度只关心时长和入队时间，用轻量对象代替 TranscriptionJob"""
+    return SimpleNamespace(uid=uid, audio_duration=audio_duration, received_at=received_at)
+
+@pytest.mark.asyncio
+class TestShortestJobFirstQueue:
+    """
+    测试 src/services/scheduler.py 中的 SJF + Aging 队列
+    """
+
+    async def test_shortest_job_first(self):
+        """测试同时到达时短任务先出队"""
+        queue = ShortestJobFirstQueue(aging_rate=1.0)
+        now = queue._epoch
+        await queue.put(make_job("long", 7200, now))
+        await queue.put(make_job("short", 5, now))
+        await queue.put(make_job("medium", 60, now))
+
+        order = [queue.get_nowait().uid for _ in range(3)]
+        assert order == ["short", "medium", "long"]
+
+    async def test_aging_prevents_starvation(self):
+        """测试长任务等得足够久之后，优先级超过新来的短任务"""
+        queue = ShortestJobFirstQueue(aging_rate=10.0)
+        now = queue._epoch
+        await queue.put(make_job("long", 600, now))
+        # 30 秒后到达的短任务：30 * 10 + 5 < 600，仍然插队
+        await queue.put(make_job("early_short", 5, now + 30))
+        # 70 秒后到达的短任务：70 * 10 + 5 > 600，长任务已经老化到更高优先级
+        await queue.put(make_job("late_short", 5, now + 70))
+
+        order = [queue.get_nowait().uid for _ in range(3)]
+        assert order == ["early_short", "long", "late_short"]
+
+    async def test_unknown_duration_and_fifo_ties(self):
+        """测试时长未知按默认值估算，优先级相同时保持 FIFO"""
+        queue = ShortestJobFirstQueue(aging_rate=0.0, default_duration_s=60)
+        now = queue._epoch
+        await queue.put(make_job("unknown_1", None, now))
+        await queue.put(make_job("unknown_2", None, now))
+        await queue.put(make_job("known_30s", 30, now))
+        await queue.put(make_job("known_90s", 90, now))
+
+        order = [queue.get_nowait().uid for _ in range(4)]
+        assert order == ["known_30s", "unknown_1", "unknown_2", "known_90s"]
+
+    async def test_backpressure_unchanged(self):
+        """测试 maxsize / full / task_done 行为与 asyncio.Queue 一致"""
+        queue = ShortestJobFirstQueue(maxsize=2)
+        await queue.put(make_job("a", 1, queue._epoch))
+        await queue.put(make_job("b", 1, queue._epoch))
+
+        assert queue.full()
+        with pytest.raises(asyncio.QueueFull):
+            queue.put_nowait(make_job("c", 1, queue._epoch))
+
+        queue.get_nowait()
+        queue.task_done()
+        assert not queue.full()
@@ -1,10 +1,14 @@
 import pytest
 import asyncio
 import os
-from unittest.mock import MagicMock, AsyncMock
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock, AsyncMock, patch
 from io import BytesIO
+import numpy as np
 from fastapi import UploadFile
 from src.services.transcription import TranscriptionService
+from src.services.uploads import UploadSpool
 
 # 使用 pytest-asyncio 处理异步测试
 @pytest.mark.asyncio
@@ -98,6 +102,42 @@ class TestTranscriptionService:
         with pytest.raises(RuntimeError, match="Queue is full"):
             await service.submit(mock_upload_file, {})
 
+        # 3. 拒绝计数和队列深度都反映在指标里
+        assert service.metrics.get("rejected_total", reason="queue_full") == 1
+        text = service.render_metrics()
+        assert "sensevoice_queue_depth 2" in text
+        assert "sensevoice_queue_capacity 2" in text
+
+    async def test_metrics_after_success_and_failure(self, service):
+        """测试成功/失败计数、排队与推理耗时、实时率"""
+        service.engine.transcribe_array.side_effect = ["ok", Exception("boom")]
+        service.is_running = True
+        worker_task = asyncio.create_task(service._consume_loop())
+
+        try:
+            samples = np.zeros(16000, dtype=np.float32)   # 1 秒
+            await service.submit_array(samples, 16000, {"language": "zh"})
+            with pytest.raises(Exception, match="boom"):
+                await service.submit_array(samples, 16000, {"language": "xx", "response_format": "srt"})
+
+            metrics = service.metrics
+            assert metrics.get("requests_total", language="zh", response_format="json", status="success") == 1
+            # 未知语言归到 other，避免标签取值无限增长
+            assert metrics.get("requests_total", language="other", response_format="srt", status="failure") == 1
+            assert metrics.get("audio_seconds_total") == pytest.approx(1.0)
+
+            text = service.render_metrics()
+            assert "sensevoice_queue_wait_seconds_count 2" in text
+            assert "sensevoice_inference_seconds_count 1" in text   # 失败的调用不计入耗时
+            assert "sensevoice_real_time_factor_count 1" in text
+        finally:
+            service.is_running = False
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
+
     async def test_temp_file_lifecycle(self, service, mock_upload_file):
         """测试临时文件的创建与删除"""
         # 1. 启动 Worker
@@ -133,6 +173,726 @@ class TestTranscriptionService:
             except asyncio.CancelledError:
                 pass
 
+    async def test_submit_in_memory_decode(self, service):
+        """测试可解码的上传在内存中直接转成采样数组，不落盘"""
+        import wave
+
+        buffer = BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(16000)
+            wav_file.writeframes(b"\x00\x00" * 8000)
+        buffer.seek(0)
+        upload = UploadFile(file=buffer, filename="clip.wav")
+
+        service.engine.transcribe_array.return_value = "In Memory"
+        service.is_running = True
+        worker_task = asyncio.create_task(service._consume_loop())
+
+        try:
+            result = await service.submit(upload, {"language": "zh"})
+
+            assert result["text"] == "In Memory"
+            service.engine.transcribe_file.assert_not_called()
+            call_kwargs = service.engine.transcribe_array.call_args.kwargs
+            assert call_kwargs["samples"].dtype == np.float32
+            assert call_kwargs["samples"].shape == (8000,)
+            assert call_kwargs["sample_rate"] == 16000
+            assert call_kwargs["language"] == "zh"
+
+        finally:
+            service.is_running = False
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
+
+    async def test_upload_limits(self, mock_engine, tmp_path):
+        """测试超过大小或时长上限的上传在入队前被拒绝，落盘的文件被清理"""
+        import wave
+
+        buffer = BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(16000)
+            wav_file.writeframes(b"\x00\x00" * 16000)
+        service = TranscriptionService(
+            engine=mock_engine,
+            upload_spool=UploadSpool(str(tmp_path), max_bytes=64 * 1024),
+            max_audio_duration_s=0.5,
+        )
+
+        buffer.seek(0)
+        with pytest.raises(RuntimeError, match="Payload too large: audio"):
+            await service.submit(UploadFile(file=buffer, filename="long.wav"), {})
+        with pytest.raises(RuntimeError, match="Payload too large: upload"):
+            await service.submit(UploadFile(file=BytesIO(b"x" * 65537), filename="big.wav"), {})
+
+        assert service.queue.empty()
+        assert os.listdir(tmp_path) == []
+        assert service.metrics.get("rejected_total", reason="too_large") == 1
+
+    async def test_cache_hit_skips_queue(self, mock_engine, tmp_path):
+        """测试缓存命中时直接返回，不进队列 (即使队列已满)，上传的文件随即删除"""
+        from src.services.cache import TranscriptionCache
+
+        mock_engine.model_id = "test/model"
+        service = TranscriptionService(
+            engine=mock_engine, max_queue_size=1, cache=TranscriptionCache(), upload_spool=UploadSpool(str(tmp_path))
+        )
+        traces = []
+        service.add_trace_hook(traces.append)
+        service.is_running = True
+        worker_task = asyncio.create_task(service._consume_loop())
+
+        try:
+            params = {"language": "zh"}
+            first = await service.submit(UploadFile(file=BytesIO(b"same audio"), filename="a.wav"), params)
+
+            # 停掉 worker 并填满队列：第二次提交只能靠缓存返回
+            worker_task.cancel()
+            await service.queue.put("job1")
+
+            second = await service.submit(UploadFile(file=BytesIO(b"same audio"), filename="b.wav"), params)
+
+            assert second == first
+            mock_engine.transcribe_file.assert_called_once()
+            assert service.cache.stats()["hits"] == 1
+            assert os.listdir(tmp_path) == []
+            # 查缓存前读上传的耗时记在了任务的阶段树上
+            assert "upload_read" in traces[0].stage_totals()
+
+        finally:
+            service.is_running = False
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
+
+    async def test_submit_stream_yields_segments(self, service, mock_upload_file):
+        """测试渐进式提交：先逐段产出 segment 事件，最后产出 done 汇总"""
+        def fake_segments(model_input, on_segment=None, **kwargs):
+            raw = [
+                {"start": 0.0, "end": 1.5, "text": "<|zh|>第一段。"},
+                {"start": 1.5, "end": 3.0, "text": "<|zh|>第二段。"},
+            ]
+            for segment in raw:
+                on_segment(segment)
+            return raw
+
+        service.engine.transcribe_segments.side_effect = fake_segments
+        service.is_running = True
+        worker_task = asyncio.create_task(service._consume_loop())
+
+        try:
+            events = await service.submit_stream(mock_upload_file, {"language": "zh"})
+            collected = [event async for event in events]
+
+            assert [e["type"] for e in collected] == ["segment", "segment", "done"]
+            assert collected[0]["text"] == "第一段。"
+            assert collected[1]["id"] == 1
+            assert collected[1]["start"] == 1.5
+            assert collected[2]["text"] == "第一段。 第二段。"
+            assert len(collected[2]["segments"]) == 2
+
+        finally:
+            service.is_running = False
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
+
+    async def test_verbose_json_segments_and_audio_duration(self, service):
+        """测试 verbose_json：分段来自同一次 VAD 切分，duration 是音频时长而不是处理耗时"""
+        def fake_segments(model_input, on_segment=None, **kwargs):
+            raw = [
+                {"start": 0.2, "end": 1.0, "text": "<|zh|>你好。"},
+                {"start": 1.4, "end": 1.9, "text": "<|zh|>再见。"},
+            ]
+            for segment in raw:
+                on_segment(segment)
+            return raw
+
+        service.engine.transcribe_segments.side_effect = fake_segments
+        service.is_running = True
+        worker_task = asyncio.create_task(service._consume_loop())
+
+        try:
+            samples = np.zeros(32000, dtype=np.float32)   # 2 秒
+            result = await service.submit_array(
+                samples, 16000, {"language": "zh", "response_format": "verbose_json"}
+            )
+
+            assert result["duration"] == pytest.approx(2.0)
+            assert "processing_time" in result
+            assert [s["text"] for s in result["segments"]] == ["你好。", "再见。"]
+            assert result["segments"][1]["start"] == 1.4
+            assert result["language"] == "zh"
+            service.engine.transcribe_array.assert_not_called()
+
+        finally:
+            service.is_running = False
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
+
+    async def test_verbose_json_timings(self, service):
+        """测试 verbose_json 返回各阶段耗时，Engine 在线程池里记录的阶段也能挂到任务上"""
+        from src.core.tracing import stage
+
+        def fake_segments(model_input, on_segment=None, **kwargs):
+            with stage("vad"):
+                pass
+            on_segment({"start": 0.0, "end": 1.0, "text": "<|zh|>你好。"})
+
+        service.engine.transcribe_segments.side_effect = fake_segments
+        service.engine.transcribe_array.return_value = "<|zh|>你好。"
+        traces = []
+        service.add_trace_hook(traces.append)
+        service.is_running = True
+        worker_task = asyncio.create_task(service._consume_loop())
+
+        try:
+            samples = np.zeros(16000, dtype=np.float32)
+            result = await service.submit_array(samples, 16000, {"response_format": "verbose_json"})
+            plain = await service.submit_array(samples, 16000, {"response_format": "json"})
+
+            stages = result["timings"]["stages"]
+            assert {"queue_wait", "inference", "vad", "clean"} <= set(stages)
+            assert "timings" not in plain
+            # 每个任务 (不论格式) 都会交给 hook
+            assert len(traces) == 2
+            assert "sensevoice_stage_seconds_count{stage=\"vad\"} 1" in service.render_metrics()
+
+        finally:
+            service.is_running = False
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
+
+    async def test_replicas_run_in_parallel(self):
+        """测试多副本：每个副本一个消费者，空闲的副本立刻接手下一个任务"""
+
+        barrier = threading.Barrier(2, timeout=5)
+
+        def make_replica(name):
+            replica = MagicMock()
+            # 两个任务必须同时在两个副本上跑，barrier 才能放行
+            replica.transcribe_file.side_effect = lambda **kwargs: barrier.wait() is not None and name
+            return replica
+
+        replicas = [make_replica("r0"), make_replica("r1")]
+        service = TranscriptionService(engine=replicas[0], max_queue_size=10, replicas=replicas)
+        await service.start_worker()
+
+        try:
+            jobs = [self._make_job("a"), self._make_job("b")]
+            for job in jobs:
+                await service.queue.put(job)
+
+            results = await asyncio.wait_for(asyncio.gather(*(job.future for job in jobs)), timeout=5)
+
+            assert sorted(r["raw_text"] for r in results) == ["r0", "r1"]
+
+        finally:
+            await service.stop_worker()
+
+    async def test_background_loading(self, mock_engine):
+        """测试模型加载完成前：请求先排队，接入引擎后被消费；加载失败时排队的请求立即失败"""
+        service = TranscriptionService(engine=None, model_id="m", max_queue_size=5)
+        assert service.ready is False
+
+        samples = np.zeros(1600, dtype=np.float32)
+        pending = asyncio.create_task(service.submit_array(samples, 16000, {}))
+        await asyncio.sleep(0)
+        assert service.queue.qsize() == 1
+
+        mock_engine.transcribe_array.return_value = "late"
+        service.attach_engines([mock_engine])
+        await service.start_worker()
+        try:
+            assert (await pending)["text"] == "late"
+        finally:
+            await service.stop_worker()
+
+        failing = TranscriptionService(engine=None, max_queue_size=5)
+        pending = asyncio.create_task(failing.submit_array(samples, 16000, {}))
+        await asyncio.sleep(0)
+        failing.fail_pending(RuntimeError("Model failed to load"))
+        with pytest.raises(RuntimeError, match="failed to load"):
+            await pending
+
+    async def test_reject_while_loading(self):
+        """测试 queue_while_loading=False：加载完成前直接拒绝"""
+        service = TranscriptionService(engine=None, queue_while_loading=False)
+        with pytest.raises(RuntimeError, match="Model is loading"):
+            await service.submit_array(np.zeros(1600, dtype=np.float32), 16000, {})
+        assert service.metrics.get("rejected_total", reason="loading") == 1
+
+    async def test_long_audio_uses_fanout(self, mock_engine):
+        """测试长音频走并行分段推理，拼接文本；短音频照常整段推理"""
+        fanout = MagicMock()
+        service = TranscriptionService(engine=mock_engine, fanout=fanout, long_audio_min_s=10)
+
+        def fake_segments(model_input, on_segment=None, **kwargs):
+            for index, text in enumerate(["<|zh|>前半", "<|zh|>后半"]):
+                on_segment({"start": index * 8.0, "end": index * 8.0 + 8.0, "text": text})
+
+        mock_engine.transcribe_segments.side_effect = fake_segments
+        mock_engine.transcribe_array.return_value = "短"
+        await service.start_worker()
+
+        try:
+            result = await service.submit_array(np.zeros(16000 * 20, dtype=np.float32), 16000, {})
+            assert result["text"] == "前半 后半"
+            assert result["segments"] is None  # json 格式不返回分段
+            assert mock_engine.transcribe_segments.call_args.kwargs["fanout"] is fanout
+
+            result = await service.submit_array(np.zeros(16000 * 2, dtype=np.float32), 16000, {})
+            assert result["text"] == "短"
+            assert mock_engine.transcribe_segments.call_count == 1
+        finally:
+            await service.stop_worker()
+
+    async def test_decode_prefetch_respects_budget(self, mock_engine):
+        """测试解码预取：上传只落盘，解码后的缓冲区交给引擎，在途的已解码音频不超过预算"""
+        in_flight = {"now": 0.0, "peak": 0.0}
+
+        class FakeDecodePool:
+            prefetch_audio_s = 3.0
+
+            async def decode(self, file_path):
+                assert os.path.exists(file_path)
+                await asyncio.sleep(0.01)
+                return np.zeros(16000 * 2, dtype=np.float32), 16000
+
+        def fake_transcribe(samples, **kwargs):
+            in_flight["peak"] = max(in_flight["peak"], service._prefetched_s)
+            return "decoded"
+
+        mock_engine.transcribe_array.side_effect = fake_transcribe
+        service = TranscriptionService(engine=mock_engine, max_queue_size=10, decode_pool=FakeDecodePool())
+        await service.start_worker()
+
+        try:
+            uploads = [UploadFile(file=BytesIO(b"fake audio content"), filename=f"{i}.mp3") for i in range(4)]
+            results = await asyncio.gather(*(service.submit(upload, {}) for upload in uploads))
+
+            assert [result["text"] for result in results] == ["decoded"] * 4
+            assert mock_engine.transcribe_file.call_count == 0
+            # 时长未知的任务按整个预算预留，解码后修正为 2 秒：同时最多一个任务的已解码音频在内存里
+            assert 0 < in_flight["peak"] <= 3.0
+            assert service._prefetched_s == 0 and service._prefetched_jobs == 0
+            assert not os.listdir(service.uploads.spool_dir)
+        finally:
+            await service.stop_worker()
+
+    async def test_prefetched_jobs_count_towards_capacity(self, mock_engine):
+        """测试预取搬走的任务仍计入队列容量，已解码的任务按 SJF 顺序等待推理"""
+        from src.services.transcription import TranscriptionJob
+        import time
+
+        decode_pool = MagicMock(prefetch_audio_s=1000.0)
+        service = TranscriptionService(engine=mock_engine, max_queue_size=2, scheduling="sjf", decode_pool=decode_pool)
+        loop = asyncio.get_running_loop()
+        jobs = [
+            TranscriptionJob(
+                uid=uid, temp_file_path=None, params={}, future=loop.create_future(), received_at=time.time(),
+                audio_duration=duration, audio=np.zeros(16, dtype=np.float32)
+            )
+            for uid, duration in (("long", 30.0), ("short", 2.0))
+        ]
+        service.is_running = True
+        prefetcher = asyncio.create_task(service._prefetch_loop())
+        try:
+            # 长任务先解码完，短任务后到：_ready_queue 里仍然是短任务先推理
+            for count, job in enumerate(jobs, 1):
+                await service.queue.put(job)
+                while service._ready_queue.qsize() < count:
+                    await asyncio.sleep(0.01)
+
+            assert service.queue.empty()
+            assert service.queue_depth() == 2
+            with pytest.raises(RuntimeError, match="Queue is full"):
+                service._reject_if_full()
+            assert [job.uid for job in service._queued_jobs()] == ["short", "long"]
+            assert service._ready_queue.get_nowait().uid == "short"
+        finally:
+            service.is_running = False
+            prefetcher.cancel()
+            await asyncio.gather(prefetcher, return_exceptions=True)
+
+    async def test_job_waiting_for_prefetch_budget_is_pending(self, mock_engine):
+        """测试预取阶段出队后等预算的任务仍算排队中：占容量、不空闲、排空时要等它"""
+        from src.services.transcription import TranscriptionJob
+        import time
+
+        decode_pool = MagicMock(prefetch_audio_s=10.0)
+        service = TranscriptionService(engine=mock_engine, max_queue_size=1, decode_pool=decode_pool)
+        # 预算已经被一个在途任务占满
+        service._prefetched_jobs, service._prefetched_s = 1, 10.0
+        job = TranscriptionJob(
+            uid="waiting", temp_file_path=None, params={}, future=asyncio.get_running_loop().create_future(),
+            received_at=time.time(), audio_duration=5.0, audio=np.zeros(16, dtype=np.float32)
+        )
+        await service.queue.put(job)
+
+        service.is_running = True
+        prefetcher = asyncio.create_task(service._prefetch_loop())
+        try:
+            while not service.queue.empty():
+                await asyncio.sleep(0.01)
+
+            assert service.queue_depth() == 1
+            assert not service.is_idle()
+            with pytest.raises(RuntimeError, match="Queue is full"):
+                service._reject_if_full()
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(service._wait_idle(), 0.05)
+        finally:
+            service.is_running = False
+            prefetcher.cancel()
+            await asyncio.gather(prefetcher, return_exceptions=True)
+
+    async def test_decode_failure_fails_job(self, mock_engine, mock_upload_file):
+        """测试解码失败的任务直接失败，不进入推理，也不占用预算"""
+        decode_pool = MagicMock(prefetch_audio_s=60.0)
+        decode_pool.decode = AsyncMock(side_effect=RuntimeError("ffmpeg failed to decode"))
+        service = TranscriptionService(engine=mock_engine, decode_pool=decode_pool)
+        await service.start_worker()
+
+        try:
+            with pytest.raises(RuntimeError, match="ffmpeg failed"):
+                await service.submit(mock_upload_file, {})
+            mock_engine.transcribe_file.assert_not_called()
+            mock_engine.transcribe_array.assert_not_called()
+            assert service._prefetched_jobs == 0
+            assert service.metrics.get("requests_total", language="auto", response_format="json", status="failure") == 1
+        finally:
+            await service.stop_worker()
+
+    async def test_async_job_lifecycle(self, mock_engine):
+        """测试异步任务：排队位置和 ETA、取消排队中的任务 (worker 直接丢弃)、完成后的状态"""
+        service = TranscriptionService(engine=mock_engine, max_queue_size=5, scheduling="fifo")
+        first = await service.submit_job(UploadFile(file=BytesIO(b"fake audio content"), filename="a.m4a"), {})
+        second = await service.submit_job(UploadFile(file=BytesIO(b"fake audio content"), filename="b.m4a"), {})
+
+        status = service.job_status(second)
+        assert status["status"] == "queued"
+        assert status["queue_position"] == 2
+        assert status["eta_s"] > service.job_status(first)["eta_s"] > 0
+
+        assert service.cancel_job(second) is True
+        assert service.job_status(second)["status"] == "cancelled"
+        assert service.job_status(first)["queue_position"] == 1
+
+        await service.start_worker()
+        try:
+            await asyncio.wait_for(asyncio.wait({first.future}), timeout=5)
+            await asyncio.sleep(0)  # 让 watcher 记录结束时间
+            status = service.job_status(first)
+            assert status["status"] == "succeeded"
+            assert status["finished_at"] is not None
+            assert service.get_job(first.uid).future.result()["text"] == "Mocked Transcription"
+            assert service.cancel_job(first) is False
+
+            await asyncio.sleep(0.05)
+            mock_engine.transcribe_file.assert_called_once()
+            assert service.metrics.get("requests_total", language="auto", response_format="json", status="cancelled") == 1
+            assert not os.listdir(service.uploads.spool_dir)
+        finally:
+            await service.stop_worker()
+
+    async def test_async_job_webhook(self, service, mock_upload_file):
+        """测试异步任务结束后回调 webhook，附带状态和结果"""
+        delivered = []
+        with patch("src.services.transcription.post_json", side_effect=lambda url, payload, **kwargs: delivered.append((url, payload, threading.current_thread().name))):
+            await service.start_worker()
+            try:
+                job = await service.submit_job(mock_upload_file, {}, webhook_url="http://client/hook")
+                for _ in range(100):
+                    if delivered:
+                        break
+                    await asyncio.sleep(0.01)
+            finally:
+                await service.stop_worker()
+
+        url, payload, thread_name = delivered[0]
+        assert url == "http://client/hook"
+        # 在专用线程池里投递，不占用推理共用的线程池
+        assert thread_name.startswith("webhook")
+        assert payload["id"] == job.uid
+        assert payload["status"] == "succeeded"
+        assert payload["result"]["text"] == "Mocked Transcription"
+
+    async def test_journal_recovers_jobs_after_restart(self, mock_engine, tmp_path):
+        """测试持久化：进程 "崩溃" 前排队的任务，重启后自动继续处理，结果在下一次重启后依然可查"""
+        from src.services.journal import JobJournal
+
+        def make_service():
+            journal = JobJournal(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "spool"))
+            return TranscriptionService(engine=mock_engine, journal=journal)
+
+        crashed = make_service()
+        job = await crashed.submit_job(UploadFile(file=BytesIO(b"fake audio content"), filename="a.m4a"), {"language": "zh"})
+        await crashed.stop_worker()  # 没有 worker 处理过，相当于进程直接退出
+        assert len(os.listdir(tmp_path / "spool")) == 1
+
+        restarted = make_service()
+        assert await restarted.recover_jobs() == 1
+        await restarted.start_worker()
+        try:
+            recovered = restarted.get_job(job.uid)
+            result = await asyncio.wait_for(recovered.future, timeout=5)
+            assert result["text"] == "Mocked Transcription"
+            assert mock_engine.transcribe_file.call_args.kwargs["file_path"].startswith(str(tmp_path / "spool"))
+            for _ in range(100):
+                if not os.listdir(tmp_path / "spool"):
+                    break
+                await asyncio.sleep(0.01)
+            assert os.listdir(tmp_path / "spool") == []
+        finally:
+            await restarted.stop_worker()
+
+        again = make_service()
+        assert await again.recover_jobs() == 0
+        assert again.get_job(job.uid).status == "succeeded"
+        assert again.get_job(job.uid).future.result()["text"] == "Mocked Transcription"
+
+        # 过期清理：内存里立即移除，持久化记录在线程池里删除 (不在事件循环里做 SQLite 提交)
+        again.job_ttl_s = 0.0
+        with patch.object(again.journal, "remove", wraps=again.journal.remove) as remove:
+            assert again.get_job(job.uid) is None
+            remove.assert_not_called()
+            await asyncio.gather(*again._job_watchers)
+        remove.assert_called_once_with(job.uid)
+        assert again.journal.finished() == []
+
+    async def test_drain_finishes_queue_then_rejects(self, service, mock_engine, mock_upload_file):
+        """测试优雅停机：等排队的任务处理完，之后的新请求直接拒绝"""
+        await service.start_worker()
+        try:
+            job = await service.submit_job(mock_upload_file, {})
+            assert await service.drain(timeout_s=5) is True
+            assert job.status == "succeeded"
+
+            with pytest.raises(RuntimeError, match="Shutting down"):
+                await service.submit(UploadFile(file=BytesIO(b"late"), filename="late.wav"), {})
+            assert service.metrics.get("rejected_total", reason="shutting_down") == 1
+        finally:
+            await service.stop_worker()
+
+    @staticmethod
+    def _wav_upload(seconds: float, filename: str = "clip.wav") -> UploadFile:
+        import wave
+
+        buffer = BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(16000)
+            wav_file.writeframes(b"\x00\x00" * int(16000 * seconds))
+        buffer.seek(0)
+        return UploadFile(file=buffer, filename=filename)
+
+    async def test_disconnected_client_job_is_skipped(self, mock_engine):
+        """测试客户端断开后排队中的任务被取消，worker 出队时直接丢弃，不做推理"""
+        service = TranscriptionService(engine=mock_engine)
+
+        async def is_disconnected():
+            return True
+
+        with patch("src.services.transcription.DISCONNECT_POLL_S", 0.01):
+            with pytest.raises(RuntimeError, match="Client disconnected"):
+                await service.submit(self._wav_upload(4.0), {}, is_disconnected=is_disconnected)
+
+        await service.start_worker()
+        try:
+            await asyncio.wait_for(service._ready_queue.join(), timeout=5)
+            mock_engine.transcribe_array.assert_not_called()
+            assert service.metrics.get("client_disconnects_total") == 1
+            assert service.metrics.get("skipped_jobs_total", stage="queued") == 1
+            assert service.metrics.get("skipped_audio_seconds_total") == pytest.approx(4.0)
+            assert service.metrics.get("requests_total", language="auto", response_format="json", status="cancelled") == 1
+        finally:
+            await service.stop_worker()
+
+    async def test_closed_stream_cancels_job(self, service, mock_upload_file):
+        """测试 SSE 迭代器在任务完成前被关闭 (客户端断开) 时取消任务"""
+        events = await service.submit_stream(mock_upload_file, {})
+        job = service.queue.get_nowait()
+        service.queue.put_nowait(job)
+
+        next_event = asyncio.ensure_future(events.__anext__())
+        await asyncio.sleep(0.01)
+        next_event.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await next_event
+
+        assert job.future.cancelled()
+        assert service.metrics.get("client_disconnects_total") == 1
+
+    async def test_disconnect_aborts_between_segments(self, mock_engine):
+        """测试分段推理中客户端断开：在两段之间中止，后面的段不再推理"""
+        import time as time_module
+
+        service = TranscriptionService(engine=mock_engine)
+        emitted = []
+
+        def fake_segments(model_input, on_segment=None, **kwargs):
+            for index in range(3):
+                if index == 1:
+                    # 等 API 层发现断开并取消任务
+                    while not service.metrics.get("client_disconnects_total"):
+                        time_module.sleep(0.005)
+                on_segment({"start": index * 2.0, "end": index * 2.0 + 2.0, "text": f"<|zh|>第{index}段"})
+                emitted.append(index)
+
+        mock_engine.transcribe_segments.side_effect = fake_segments
+
+        async def is_disconnected():
+            return bool(emitted)
+
+        await service.start_worker()
+        try:
+            with patch("src.services.transcription.DISCONNECT_POLL_S", 0.01):
+                with pytest.raises(RuntimeError, match="Client disconnected"):
+                    await service.submit(
+                        self._wav_upload(6.0), {"response_format": "verbose_json"}, is_disconnected=is_disconnected
+                    )
+            await asyncio.wait_for(service._ready_queue.join(), timeout=5)
+
+            assert emitted == [0]
+            assert service.metrics.get("skipped_jobs_total", stage="inference") == 1
+            # 第二段已经算完才发现取消，省下的是最后一段
+            assert service.metrics.get("skipped_audio_seconds_total") == pytest.approx(2.0)
+            assert service.metrics.get("requests_total", language="auto", response_format="verbose_json", status="failure") is None
+        finally:
+            await service.stop_worker()
+
+    async def test_deadline_admission(self, mock_engine):
+        """测试按 ETA 准入：积压 + 自己的推理耗时赶不上截止时间时拒绝，Retry-After 为需要先消化的积压"""
+        from src.services.transcription import DeadlineRejected
+
+        service = TranscriptionService(engine=mock_engine, max_queue_size=10)
+        service.rtf_estimate = 1.0   # 推理耗时 = 音频时长，方便计算
+        await service.submit_job(self._wav_upload(10.0), {})   # 没有截止时间，照常排队
+
+        with pytest.raises(DeadlineRejected, match="Deadline cannot be met") as error:
+            await service.submit_job(self._wav_upload(1.0), {}, deadline_s=5.0)
+        assert error.value.retry_after_s == 6   # 10s 积压 + 1s 自己 - 5s 截止
+        assert service.metrics.get("rejected_total", reason="deadline") == 1
+
+        # 积压已经超过截止时间的，不读上传内容就拒绝
+        upload = self._wav_upload(1.0)
+        with pytest.raises(DeadlineRejected):
+            await service.submit_job(upload, {}, deadline_s=2.0)
+        assert upload.file.tell() == 0
+
+        job = await service.submit_job(self._wav_upload(1.0), {}, deadline_s=20.0)
+        assert job.deadline is not None
+        assert service._backlog_s() == pytest.approx(11.0)
+
+        # 光自己的推理就超过客户端截止时间：重试也赶不上，不是 DeadlineRejected (没有 Retry-After)
+        with pytest.raises(RuntimeError, match="Deadline unattainable") as error:
+            await service.submit_job(self._wav_upload(30.0), {}, deadline_s=20.0)
+        assert not isinstance(error.value, DeadlineRejected)
+        assert service.metrics.get("rejected_total", reason="deadline_unattainable") == 1
+
+        # 服务端默认截止时间只限制排队积压，不拒绝本身就很长的音频
+        service.default_deadline_s = 20.0
+        await service.submit_stream(self._wav_upload(30.0), {})
+        assert service.queue.qsize() == 3
+
+    async def test_decoded_queue_budget(self, mock_engine):
+        """测试排队中已解码的音频有上限：超出的任务只保留文件，推理时交给引擎读取；结束后不再持有采样"""
+        mock_engine.transcribe_array.return_value = "from memory"
+        service = TranscriptionService(engine=mock_engine, max_decoded_queue_s=1.5)
+
+        first = await service.submit_job(self._wav_upload(1.0), {})
+        second = await service.submit_job(self._wav_upload(1.0), {})
+        assert first.audio is not None and first.temp_file_path is None
+        assert second.audio is None and os.path.exists(second.temp_file_path)
+        assert service._decoded_queue_s == pytest.approx(1.0)
+
+        await service.start_worker()
+        try:
+            assert (await asyncio.wait_for(first.future, 5))["text"] == "from memory"
+            assert (await asyncio.wait_for(second.future, 5))["text"] == "Mocked Transcription"
+            mock_engine.transcribe_file.assert_called_once()
+            # 任务结束后留在 jobs 里供查询，但不能继续占着采样缓冲区
+            assert first.audio is None
+            assert service._decoded_queue_s == 0.0
+        finally:
+            await service.stop_worker()
+
+    async def test_rtf_estimate_is_weighted_by_audio(self, mock_engine):
+        """测试 ETA 用的实时率按音频时长加权：大量短音频的固定开销不会把长音频的估计拉高"""
+        service = TranscriptionService(engine=mock_engine)
+        for _ in range(20):
+            service._record_inference([SimpleNamespace(audio_duration=1.0)], 0.5)   # 短音频 RTF 0.5 (开销为主)
+        service._record_inference([SimpleNamespace(audio_duration=3600.0)], 36.0)   # 长音频 RTF 0.01
+
+        total_rtf = (20 * 0.5 + 36.0) / (20 * 1.0 + 3600.0)
+        assert service.rtf_estimate == pytest.approx(total_rtf, rel=0.3)
+        assert service.rtf_estimate < 0.02
+
+    async def test_expired_job_is_dropped(self, mock_engine):
+        """测试出队时已经超过截止时间的任务不再推理，以超时失败结束"""
+        service = TranscriptionService(engine=mock_engine)
+        service.rtf_estimate = 0.0   # 准入时估算能赶上
+        job = await service.submit_job(self._wav_upload(1.0), {}, deadline_s=0.2)
+        await asyncio.sleep(0.3)
+
+        await service.start_worker()
+        try:
+            await asyncio.wait_for(service._ready_queue.join(), timeout=5)
+            with pytest.raises(RuntimeError, match="Deadline exceeded"):
+                job.future.result()
+            mock_engine.transcribe_array.assert_not_called()
+            assert service.metrics.get("requests_total", language="auto", response_format="json", status="expired") == 1
+            assert service.metrics.get("skipped_jobs_total", stage="queued") == 1
+        finally:
+            await service.stop_worker()
+
+    async def test_fast_path_routing(self, mock_engine):
+        """测试短语音自动走快速通道，长音频和需要时间戳的任务保留 VAD，客户端可以在时长上限内显式覆盖"""
+        service = TranscriptionService(engine=mock_engine, fast_path_max_s=5.0)
+        mock_engine.transcribe_array.return_value = "ok"
+        mock_engine.transcribe_segments.return_value = []
+        await service.start_worker()
+
+        async def pipeline_used(seconds, params):
+            result = await service.submit_array(np.zeros(int(seconds * 16000), dtype=np.float32), 16000, params)
+            return result["pipeline"]
+
+        try:
+            assert await pipeline_used(2, {}) == "asr_punc"
+            assert mock_engine.transcribe_array.call_args.kwargs["pipeline"] == "asr_punc"
+            assert await pipeline_used(30, {}) == "full"
+            assert await pipeline_used(2, {"response_format": "verbose_json"}) == "full"
+            assert await pipeline_used(30, {"pipeline": "asr"}) == "asr"
+            assert mock_engine.transcribe_array.call_args.kwargs["pipeline"] == "asr"
+            # 超过 max_vadless_s 的长音频不能跳过 VAD：显式的 asr 也退回 full
+            assert await pipeline_used(120, {"pipeline": "asr"}) == "full"
+            assert mock_engine.transcribe_array.call_args.kwargs["pipeline"] == "full"
+        finally:
+            await service.stop_worker()
+
+    async def test_unknown_scheduling_policy(self, mock_engine):
+        """测试未知调度策略直接报错"""
+        with pytest.raises(ValueError, match="Unknown scheduling"):
+            TranscriptionService(engine=mock_engine, scheduling="random")
+
     async def test_worker_error_handling(self, service, mock_upload_file):
         """测试 Worker 遇到异常时的行为"""
         service.is_running = True
@@ -156,3 +916,202 @@ class TestTranscriptionService:
                 await worker_task
             except asyncio.CancelledError:
                 pass
+
+    def _make_job(self, uid, language="zh", audio_duration=1.0):
+        """直接构造任务 (绕过 submit)，方便精确控制批次内容"""
+        from src.services.transcription import TranscriptionJob
+        import time
+
+        return TranscriptionJob(
+            uid=uid,
+            temp_file_path=f"temp_{uid}.wav",  # 文件不存在没关系，mock engine 不会读
+            params={"language": language},
+            future=asyncio.get_running_loop().create_future(),
+            received_at=time.time(),
+            audio_duration=audio_duration
+        )
+
+    async def test_micro_batching(self, mock_engine):
+        """测试微批：队列里积压的同语言任务合并成一次 transcribe_batch 调用"""
+        service = TranscriptionService(engine=mock_engine, max_queue_size=10, max_batch_size=4)
+        mock_engine.transcribe_batch.side_effect = lambda inputs, **kwargs: [
+            f"text for {path}" for path in inputs
+        ]
+
+        jobs = [self._make_job(f"j{i}") for i in range(3)]
+        for job in jobs:
+            await service.queue.put(job)
+
+        service.is_running = True
+        worker_task = asyncio.create_task(service._consume_loop())
+
+        try:
+            results = [await job.future for job in jobs]
+
+            # 每个结果都路由回了自己的 future
+            assert [r["text"] for r in results] == [f"text for temp_j{i}.wav" for i in range(3)]
+            mock_engine.transcribe_batch.assert_called_once()
+            mock_engine.transcribe_file.assert_not_called()
+
+        finally:
+            service.is_running = False
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
+
+    async def test_micro_batching_is_profiled(self, mock_engine, tmp_path):
+        """测试抽样剖析覆盖批量推理：整批一次调用，抽中的每个任务都拿到这次调用的 .prof"""
+        from src.services.profiling import ProfileSampler
+
+        service = TranscriptionService(
+            engine=mock_engine, max_queue_size=10, max_batch_size=4,
+            profiler=ProfileSampler(str(tmp_path), sample_rate=1.0)
+        )
+        mock_engine.transcribe_batch.side_effect = lambda inputs, **kwargs: [f"text for {path}" for path in inputs]
+
+        jobs = [self._make_job(f"j{i}") for i in range(2)]
+        for job in jobs:
+            await service.queue.put(job)
+
+        service.is_running = True
+        worker_task = asyncio.create_task(service._consume_loop())
+
+        try:
+            for job in jobs:
+                await job.future
+            mock_engine.transcribe_batch.assert_called_once()
+            assert sorted(os.listdir(tmp_path)) == ["j0.prof", "j1.prof"]
+
+        finally:
+            service.is_running = False
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
+
+    async def test_micro_batching_limits(self, mock_engine):
+        """测试微批的切分条件：音频总时长上限、语言不同、时长未知"""
+        service = TranscriptionService(
+            engine=mock_engine, max_queue_size=10, max_batch_size=8, max_batch_audio_s=10.0
+        )
+        batches = []
+
+        def fake_batch(inputs, **kwargs):
+            batches.append(list(inputs))
+            return ["ok"] * len(inputs)
+
+        mock_engine.transcribe_batch.side_effect = fake_batch
+        mock_engine.transcribe_file.side_effect = lambda file_path, **kwargs: (
+            batches.append([file_path]) or "ok"
+        )
+
+        jobs = [
+            self._make_job("a", audio_duration=4.0),
+            self._make_job("b", audio_duration=4.0),
+            self._make_job("c", audio_duration=4.0),   # 超出 10s 预算 -> 下一批
+            self._make_job("d", audio_duration=1.0),
+            self._make_job("e", language="en", audio_duration=1.0),  # 语言不同 -> 下一批
+            self._make_job("f", language="en", audio_duration=None),  # 时长未知 -> 单独一批
+        ]
+        for job in jobs:
+            await service.queue.put(job)
+
+        service.is_running = True
+        worker_task = asyncio.create_task(service._consume_loop())
+
+        try:
+            for job in jobs:
+                await job.future
+
+            assert batches == [
+                ["temp_a.wav", "temp_b.wav"],
+                ["temp_c.wav", "temp_d.wav"],
+                ["temp_e.wav"],
+                ["temp_f.wav"],
+            ]
+
+        finally:
+            service.is_running = False
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
+
+    async def test_micro_batching_cancelled_during_batch(self, mock_engine):
+        """测试整批 (或单个) 推理期间被取消的任务不交付结果，记为 cancelled 而不是 success"""
+        service = TranscriptionService(engine=mock_engine, max_queue_size=10, max_batch_size=4)
+        loop = asyncio.get_running_loop()
+        jobs = [self._make_job("kept"), self._make_job("cancelled")]
+
+        def fake_batch(inputs, **kwargs):
+            loop.call_soon_threadsafe(jobs[1].future.cancel)
+            return [f"text for {path}" for path in inputs]
+
+        mock_engine.transcribe_batch.side_effect = fake_batch
+        for job in jobs:
+            await service.queue.put(job)
+
+        service.is_running = True
+        worker_task = asyncio.create_task(service._consume_loop())
+
+        try:
+            assert (await jobs[0].future)["text"] == "text for temp_kept.wav"
+            while service.metrics.get("skipped_jobs_total", stage="inference") < 1:
+                await asyncio.sleep(0.01)
+
+            assert service.metrics.get("requests_total", language="zh", response_format="json", status="success") == 1
+            assert service.metrics.get("requests_total", language="zh", response_format="json", status="cancelled") == 1
+            assert service.metrics.get("skipped_audio_seconds_total") == 0
+
+            # 单个任务 (凑不成批) 推理期间被取消：同样不算成功
+            single = self._make_job("single")
+
+            def fake_file(**kwargs):
+                loop.call_soon_threadsafe(single.future.cancel)
+                return "text"
+
+            mock_engine.transcribe_file.side_effect = fake_file
+            await service.queue.put(single)
+            while service.metrics.get("skipped_jobs_total", stage="inference") < 2:
+                await asyncio.sleep(0.01)
+
+            assert service.metrics.get("requests_total", language="zh", response_format="json", status="success") == 1
+            assert service.metrics.get("requests_total", language="zh", response_format="json", status="cancelled") == 2
+
+        finally:
+            service.is_running = False
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
+
+    async def test_micro_batching_fallback(self, mock_engine):
+        """测试批量推理失败时退化为逐个推理，坏任务不拖累整批"""
+        service = TranscriptionService(engine=mock_engine, max_queue_size=10, max_batch_size=4)
+        mock_engine.transcribe_batch.side_effect = ValueError("Batch Error")
+        mock_engine.transcribe_file.side_effect = ["ok", ValueError("Bad File")]
+
+        jobs = [self._make_job("good"), self._make_job("bad")]
+        for job in jobs:
+            await service.queue.put(job)
+
+        service.is_running = True
+        worker_task = asyncio.create_task(service._consume_loop())
+
+        try:
+            assert (await jobs[0].future)["text"] == "ok"
+            with pytest.raises(ValueError, match="Bad File"):
+                await jobs[1].future
+
+        finally:
+            service.is_running = False
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,97 @@
+import pytest
+import numpy as np
+from unittest.mock import MagicMock, AsyncMock
+from src.services.streaming import StreamingSession
+
+# 每块 100ms (16kHz)
+CHUNK = np.zeros(1600, dtype=np.float32)
+
+@pytest.mark.asyncio
+class TestStreamingSession:
+    """
+    测试 src/services/streaming.py
+    Mock 掉 VAD (engine.detect_speech_stream) 和推理 (service.submit_array)
+    """
+
+    @pytest.fixture
+    def service(self):
+        service = MagicMock()
+        service.submit_array = AsyncMock(side_effect=lambda samples, sample_rate, params: {
+            "text": f"{len(samples)} samples",
+            "raw_text": f"<|zh|>{len(samples)} samples",
+        })
+        return service
+
+    async def test_final_event_when_segment_closes(self, service):
+        """测试 VAD 报告语音段结束时，发出该段的 final 结果"""
+        service.engine.detect_speech_stream.side_effect = [
+            [],             # 0-100ms: 静音
+            [[100, -1]],    # 100-200ms: 语音开始
+            [],             # 200-300ms: 语音中
+            [[-1, 300]],    # 300-400ms: 语音结束
+        ]
+        session = StreamingSession(service, {"language": "zh"}, partial_interval_s=0)
+
+        events = []
+        for _ in range(4):
+            events.extend(await session.feed(CHUNK))
+
+        assert events == [{
+            "type": "final",
+            "segment_id": 0,
+            "start": 0.1,
+            "end": 0.3,
+            "text": "3200 samples",
+            "raw_text": "<|zh|>3200 samples",
+        }]
+        samples, sample_rate, params = service.submit_array.call_args.args
+        assert sample_rate == 16000
+        assert params == {"language": "zh"}
+
+    async def test_partial_results_during_long_segment(self, service):
+        """测试长语音段进行中时按间隔发出 partial"""
+        session = StreamingSession(service, {}, partial_interval_s=0.2)
+        service.engine.detect_speech_stream.side_effect = [[[0, -1]], [], [], []]
+
+        events = []
+        for _ in range(4):
+            events.extend(await session.feed(CHUNK))
+
+        partials = [e for e in events if e["type"] == "partial"]
+        assert [p["end"] for p in partials] == [0.3]
+        assert all(p["segment_id"] == 0 for p in partials)
+
+    async def test_finish_closes_open_segment(self, service):
+        """测试流结束时关闭未结束的语音段，并汇总全文"""
+        service.engine.detect_speech_stream.side_effect = [[[0, 100]], [[150, -1]], []]
+        session = StreamingSession(service, {}, partial_interval_s=0)
+
+        await session.feed(CHUNK)
+        await session.feed(CHUNK)
+        events = await session.finish()
+
+        # finish 会用 is_final=True 冲刷 VAD
+        assert service.engine.detect_speech_stream.call_args.args[2] is True
+        assert events[0]["type"] == "final"
+        assert events[0]["start"] == 0.15
+        assert events[-1] == {"type": "done", "text": "1600 samples 960 samples"}
+
+    async def test_segment_error_does_not_stop_stream(self, service):
+        """测试某一段识别失败只产生 error 事件"""
+        service.engine.detect_speech_stream.side_effect = [[[0, 100]]]
+        service.submit_array.side_effect = RuntimeError("Service busy: Queue is full.")
+        session = StreamingSession(service, {}, partial_interval_s=0)
+
+        events = await session.feed(CHUNK)
+
+        assert events == [{"type": "error", "segment_id": 0, "detail": "Service busy: Queue is full."}]
+
+    async def test_buffer_is_bounded(self, service):
+        """测试没有语音时只保留回看窗口内的音频"""
+        service.engine.detect_speech_stream.side_effect = lambda *args: []
+        session = StreamingSession(service, {}, max_lookback_s=0.5)
+
+        for _ in range(20):
+            await session.feed(CHUNK)
+
+        assert len(session._buffer) == 8000
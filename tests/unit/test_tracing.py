@@ -0,0 +1,53 @@
+import time
+from src.core.tracing import JobTrace, current_trace, stage
+
+class TestJobTrace:
+    """
+    测试 src/core/tracing.py 中的阶段耗时树
+    """
+
+    def test_nested_spans_and_totals(self):
+        """测试嵌套阶段和同名阶段合计"""
+        trace = JobTrace("abc")
+        with trace.span("inference"):
+            with trace.span("asr"):
+                time.sleep(0.001)
+            with trace.span("asr"):
+                time.sleep(0.001)
+        trace.add_span("queue_wait", 0.5)
+        trace.finish()
+
+        timings = trace.to_dict()
+        assert [span["name"] for span in timings["spans"]] == ["inference", "queue_wait"]
+        assert [child["name"] for child in timings["spans"][0]["children"]] == ["asr", "asr"]
+        assert timings["stages"]["queue_wait"] == 500.0
+        assert timings["stages"]["asr"] >= 2.0
+        assert timings["stages"]["inference"] >= timings["stages"]["asr"]
+
+    def test_collapsed_stacks(self):
+        """测试折叠栈输出 (flamegraph 格式：路径 + 自身耗时微秒)"""
+        trace = JobTrace("abc")
+        with trace.span("inference"):
+            trace.add_span("vad", 0.002)
+        trace.finish()
+
+        lines = dict(line.rsplit(" ", 1) for line in trace.collapsed_stacks())
+        assert set(lines) == {"job", "job;inference", "job;inference;vad"}
+        assert int(lines["job;inference;vad"]) == 2000
+
+    def test_stage_without_trace_is_noop(self):
+        """测试没有任务在追踪时 stage 不做任何事"""
+        assert current_trace.get() is None
+        with stage("vad"):
+            pass
+
+    def test_stage_records_on_current_trace(self):
+        trace = JobTrace("abc")
+        token = current_trace.set(trace)
+        try:
+            with stage("vad"):
+                pass
+        finally:
+            current_trace.reset(token)
+
+        assert [span.name for span in trace.root.children] == ["vad"]
@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+import os
+from io import BytesIO
+
+import pytest
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.testclient import TestClient
+
+from src.api.middleware import UploadLimitMiddleware
+from src.services import uploads
+from src.services.uploads import UploadSpool
+
+
+class TestUploadSpool:
+    """
+    测试 src/services/uploads.py
+    """
+
+    def test_ingest_streams_and_hashes(self, tmp_path):
+        """测试分块落盘，哈希与整体计算一致"""
+        spool = UploadSpool(str(tmp_path), chunk_bytes=7)
+        content = os.urandom(100)
+        path, digest = asyncio.run(spool.ingest(UploadFile(file=BytesIO(content), filename="a.wav"), ".wav"))
+
+        assert os.path.dirname(path) == str(tmp_path) and path.endswith(".wav")
+        assert open(path, "rb").read() == content
+        assert digest == hashlib.sha256(content).hexdigest()
+
+    def test_ingest_rejects_oversized_upload(self, tmp_path):
+        """测试超过大小上限时中止读取并删除已写的部分"""
+        spool = UploadSpool(str(tmp_path), max_bytes=10, chunk_bytes=4)
+        with pytest.raises(RuntimeError, match="Payload too large"):
+            asyncio.run(spool.ingest(UploadFile(file=BytesIO(b"x" * 11), filename="a.wav"), ".wav"))
+        assert os.listdir(tmp_path) == []
+
+    def test_sweep_removes_files_of_dead_processes(self, tmp_path):
+        """测试启动时清理已退出进程留下的文件，保留本进程的文件和无关文件"""
+        started = uploads._process_start(os.getpid())
+        mine = tmp_path / f"upload_{os.getpid()}_{started}_abc.wav"
+        stale = tmp_path / "upload_999999999_1_def.wav"
+        # 上一个进程用过同一个 pid (容器重启后的 PID 1)：启动时间对不上
+        reused = tmp_path / f"upload_{os.getpid()}_{int(started) - 1}_ghi.wav"
+        other = tmp_path / "notes.txt"
+        for path in (mine, stale, reused, other):
+            path.write_bytes(b"x")
+
+        spool = UploadSpool(str(tmp_path))
+        assert sorted(os.listdir(tmp_path)) == sorted([mine.name, other.name])
+        assert os.path.basename(spool.new_path(".wav")).startswith(f"upload_{os.getpid()}_{started}_")
+
+    def test_sweep_without_process_start_times(self, tmp_path, monkeypatch):
+        """测试拿不到进程启动时间时 (没有 /proc)，本 pid 下早于本进程启动的文件也会被清理"""
+        monkeypatch.setattr(uploads, "_process_start", lambda pid: None)
+        mine = tmp_path / f"upload_{os.getpid()}_0_abc.wav"
+        reused = tmp_path / f"upload_{os.getpid()}_0_def.wav"
+        for path in (mine, reused):
+            path.write_bytes(b"x")
+        os.utime(reused, (uploads._STARTED_AT - 60, uploads._STARTED_AT - 60))
+
+        UploadSpool(str(tmp_path))
+        assert os.listdir(tmp_path) == [mine.name]
+
+
+class TestUploadLimitMiddleware:
+    """
+    测试 src/api/middleware.py
+    """
+
+    @pytest.fixture
+    def client(self):
+        app = FastAPI()
+        app.add_middleware(UploadLimitMiddleware, max_body_bytes=1024)
+
+        @app.post("/upload")
+        async def upload(file: UploadFile = File(...)):
+            return {"size": len(await file.read())}
+
+        @app.post("/raw")
+        async def raw(request: Request):
+            return {"size": len(await request.body())}
+
+        return TestClient(app)
+
+    def test_small_body_passes(self, client):
+        response = client.post("/upload", files={"file": ("a.wav", b"x" * 100)})
+        assert response.json() == {"size": 100}
+
+    def test_declared_length_over_limit(self, client):
+        """测试 Content-Length 超限时不读请求体直接 413"""
+        response = client.post("/upload", files={"file": ("a.wav", b"x" * 2048)})
+        assert response.status_code == 413
+
+    def test_chunked_body_over_limit(self, client):
+        """测试没有 Content-Length 的请求边收边数，超限 413"""
+        def body():
+            for _ in range(8):
+                yield b"x" * 512
+
+        response = client.post("/raw", content=body())
+        assert response.status_code == 413
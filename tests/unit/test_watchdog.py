@@ -0,0 +1,94 @@
+import asyncio
+import time
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi import UploadFile
+
+from src.services.transcription import TranscriptionService
+from src.services.watchdog import MemoryWatchdog
+
+
+@pytest.fixture
+def engine():
+    """可卸载/重新加载的 Mock 引擎"""
+    mock = MagicMock()
+    mock.transcribe_file.return_value = "text"
+    mock.batch_size_s, mock.merge_length_s = 60, 15
+    mock.allocator_bytes.return_value = None
+    mock.release.side_effect = lambda: setattr(mock, "model", None)
+    mock.load.side_effect = lambda warmup=True: setattr(mock, "model", object())
+    return mock
+
+
+@pytest.mark.asyncio
+class TestMemoryWatchdog:
+    """
+    测试 src/services/watchdog.py
+    """
+
+    async def test_idle_unload_and_lazy_reload(self, engine):
+        """测试空闲超时后卸载模型，下一个请求到来时 worker 先重新加载 (不预热) 再推理"""
+        service = TranscriptionService(engine=engine)
+        watchdog = MemoryWatchdog(service, idle_unload_s=60)
+
+        # 刚处理过请求：不卸载
+        await watchdog.check()
+        engine.release.assert_not_called()
+
+        service.last_activity = time.time() - 120
+        await watchdog.check()
+        engine.release.assert_called_once()
+        assert not service.models_loaded()
+        assert service.metrics.get("model_unloads_total") == 1
+
+        # 已经卸载过，不会重复卸载
+        await watchdog.check()
+        engine.release.assert_called_once()
+
+        await service.start_worker()
+        try:
+            result = await service.submit(UploadFile(file=BytesIO(b"fake audio"), filename="a.m4a"), {})
+            assert result["text"] == "text"
+            engine.load.assert_called_once_with(warmup=False)
+            assert service.models_loaded()
+            assert service.metrics.get("model_reloads_total") == 1
+        finally:
+            await service.stop_worker()
+
+    async def test_busy_service_is_not_unloaded(self, engine):
+        """测试队列里还有任务时不卸载"""
+        service = TranscriptionService(engine=engine)
+        await service.submit_job(UploadFile(file=BytesIO(b"fake audio"), filename="a.m4a"), {})
+        service.last_activity = time.time() - 120
+
+        await MemoryWatchdog(service, idle_unload_s=60).check()
+        engine.release.assert_not_called()
+
+    async def test_memory_pressure_shrinks_and_restores_batching(self, engine):
+        """测试 RSS 超过高水位时分批参数减半 (有下限)，回落后逐步恢复"""
+        service = TranscriptionService(engine=engine)
+        watchdog = MemoryWatchdog(service, high_watermark_mb=1024)
+
+        with patch("src.services.watchdog.process_rss_bytes", return_value=2048 * 1024 * 1024):
+            await watchdog.check()
+            assert (engine.batch_size_s, engine.merge_length_s) == (30, 7)
+            await watchdog.check()
+            await watchdog.check()
+            assert (engine.batch_size_s, engine.merge_length_s) == (10, 5)
+        assert service.metrics.get("memory_pressure_total") == 3
+        assert service.metrics.get("process_rss_bytes") == 2048 * 1024 * 1024
+        assert service.metrics.get("engine_batch_size_s") == 10
+
+        # 介于低水位和高水位之间：保持不变
+        with patch("src.services.watchdog.process_rss_bytes", return_value=900 * 1024 * 1024):
+            await watchdog.check()
+            assert engine.batch_size_s == 10
+
+        with patch("src.services.watchdog.process_rss_bytes", return_value=100 * 1024 * 1024):
+            await watchdog.check()
+            assert (engine.batch_size_s, engine.merge_length_s) == (20, 10)
+            await watchdog.check()
+            await watchdog.check()
+            assert (engine.batch_size_s, engine.merge_length_s) == (60, 15)
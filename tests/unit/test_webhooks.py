@@ -0,0 +1,77 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+from src.services.webhooks import post_json, check_webhook_url
+
+
+class TestWebhooks:
+    """
+    测试 src/services/webhooks.py
+    在本地起一个 HTTP 服务接收回调
+    """
+
+    def _serve(self, statuses):
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                received.append(json.loads(body))
+                self.send_response(statuses.pop(0))
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, received
+
+    def test_post_json_retries_until_success(self):
+        """测试 5xx 时重试，成功后返回 True"""
+        server, received = self._serve([500, 204])
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/hook"
+            # 本地回环地址需要显式加入允许列表
+            assert post_json(url, {"id": "abc", "text": "你好"}, backoff_s=0.01, allowed_hosts=["127.0.0.1"]) is True
+        finally:
+            server.shutdown()
+
+        assert received == [{"id": "abc", "text": "你好"}] * 2
+
+    def test_post_json_gives_up(self):
+        """测试连接失败时重试到上限后返回 False"""
+        assert post_json("http://127.0.0.1:1/hook", {}, attempts=2, timeout_s=0.5, backoff_s=0.01, allowed_hosts=["127.0.0.1"]) is False
+
+    def test_check_webhook_url(self):
+        """测试默认只允许公网地址：回环、私有网段、链路本地 (云元数据) 都拒绝；允许列表优先"""
+        for url in (
+            "ftp://example.com/hook",
+            "http://127.0.0.1/hook",
+            "http://localhost:8080/hook",
+            "http://10.0.0.5/hook",
+            "http://192.168.1.10/hook",
+            "http://169.254.169.254/latest/meta-data",
+            "http://[::1]/hook",
+        ):
+            with pytest.raises(ValueError):
+                check_webhook_url(url)
+        check_webhook_url("https://93.184.216.34/hook")
+
+        check_webhook_url("http://10.0.0.5/hook", allowed_hosts=["10.0.0.5"])
+        check_webhook_url("https://a.hooks.example.com/x", allowed_hosts=[".hooks.example.com"])
+        with pytest.raises(ValueError, match="allowed list"):
+            check_webhook_url("https://93.184.216.34/hook", allowed_hosts=[".hooks.example.com"])
+
+    def test_post_json_refuses_private_targets_and_redirects(self):
+        """测试投递前再次检查地址 (不重试)，且不跟随重定向"""
+        server, received = self._serve([302])
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/hook"
+            assert post_json(url, {}, backoff_s=0.01) is False
+            assert received == []
+            assert post_json(url, {}, attempts=1, allowed_hosts=["127.0.0.1"]) is False
+            assert len(received) == 1
+        finally:
+            server.shutdown()